@@ -9,10 +9,12 @@ Type:   System test
 """
 
 import argparse
+import json
 import os.path
 import re
 import subprocess
 import sys
+import tempfile
 import time
 
 here = os.path.dirname(__file__)
@@ -20,16 +22,12 @@ here = os.path.dirname(__file__)
 
 class Result(object):
     """
-    Use the output from the tool to collect the information about its execution.
+    Use the statistics written by the tool, and its output, to collect the information about
+    its execution.
 
-    Very sensitive to the format of the output as to whether it collects information or not.
+    Very sensitive to the format of the output as to whether it collects the exception and
+    failure file or not.
     """
-    coverage_re = re.compile('cov: (\d+)')
-    corpus_re = re.compile('corp: (\d+)')
-    speed_re = re.compile('exec/s: (\d+)')
-    memory_re = re.compile('rss: (\d+\.\d+)')
-    count_re = re.compile('^#(\d+)')
-    count2_re = re.compile('^did (\d+) runs, stopping now')
     exception_re = re.compile('^Exception: (.*)')
     failfile_re = re.compile('^sample written to (.*)')
 
@@ -64,27 +62,17 @@ class Result(object):
 
         return None
 
-    def process_output(self, line):
-        match = self.coverage_re.search(line)
-        if match:
-            self.coverage = int(match.group(1))
-
-        match = self.corpus_re.search(line)
-        if match:
-            self.corpus = int(match.group(1))
-
-        match = self.speed_re.search(line)
-        if match:
-            self.speed = int(match.group(1))
-
-        match = self.memory_re.search(line)
-        if match:
-            self.memory = float(match.group(1))
-
-        match = self.count_re.search(line) or self.count2_re.search(line)
-        if match:
-            self.count = int(match.group(1))
+    def process_stats(self, record):
+        """
+        Collect the information from the last stats record written.
+        """
+        self.coverage = record['coverage']
+        self.corpus = record['corpus_inputs']
+        self.speed = record['execs_per_second']
+        self.memory = record['rss_mb']
+        self.count = record['executions']
 
+    def process_output(self, line):
         match = self.exception_re.search(line)
         if match:
             self.exception = match.group(1)
@@ -131,19 +119,29 @@ class Example(object):
         """
         Run the example script, capturing the output and maybe processing it.
         """
-        cmd = [python, self.script, '--runs', str(runs)]
+        fd, stats_file = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        cmd = [python, self.script, '--runs', str(runs), '--stats-file', stats_file]
 
         result = Result()
-        with open(log, 'w') as log_fh:
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            result.record_start()
-            for line in proc.stdout:
-                line = line.decode('utf-8', 'replace')
-                result.process_output(line)
-            result.record_end()
-
-            proc.wait()
-            result.rc = proc.returncode
+        try:
+            with open(log, 'w') as log_fh:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                result.record_start()
+                for line in proc.stdout:
+                    line = line.decode('utf-8', 'replace')
+                    result.process_output(line)
+                result.record_end()
+
+                proc.wait()
+                result.rc = proc.returncode
+
+            with open(stats_file) as f:
+                records = f.read().splitlines()
+            if records:
+                result.process_stats(json.loads(records[-1]))
+        finally:
+            os.remove(stats_file)
 
         return result
 
@@ -0,0 +1,175 @@
+"""
+Fuzzing driven by an asyncio event loop.
+
+AsyncFuzzer runs one or more fuzzing jobs, each a Fuzzer with its own worker process,
+from a single thread. Rather than blocking on the worker, each job waits for its worker's
+pipe to become readable with loop.add_reader, so one event loop can supervise many jobs
+alongside whatever else it is doing. As with --workers, the jobs share one map of the
+coverage seen and pass each other the inputs which find new coverage.
+
+What the jobs find is available as a stream of Events:
+
+    fuzzer = AsyncFuzzer(target, jobs=4, keep_going=True)
+    task = asyncio.ensure_future(fuzzer.run())
+    async for event in fuzzer.events():
+        ...
+
+This module needs Python 3.6 or later.
+"""
+
+import asyncio
+import collections
+import multiprocessing as mp
+
+from pythonfuzz import bitmap, fuzzer, stats
+
+# Something that happened in one of the jobs:
+#   kind:   'new' (an input found new coverage), 'crash', 'timeout', 'oom' or 'stats'
+#   job:    the index of the job
+#   data:   for 'new', the input; for failures, a dict of 'input', 'error' and 'signature';
+#           for 'stats', the job's stats record (see the stats module)
+Event = collections.namedtuple('Event', ('kind', 'job', 'data'))
+
+
+class AsyncPeer(object):
+    """
+    The link between a job's Fuzzer and the AsyncFuzzer running it.
+    """
+
+    def __init__(self, index, owner):
+        self._index = index
+        self._owner = owner
+        self._inbox = []
+
+    def publish(self, buf):
+        buf = bytes(buf)
+        for peer in self._owner._peers:
+            if peer is not self:
+                peer._inbox.append(buf)
+        self._owner._put(Event('new', self._index, buf))
+
+    def collect(self):
+        bufs = [bytearray(buf) for buf in self._inbox]
+        del self._inbox[:]
+        return bufs
+
+    def failure(self, kind, buf, error, signature):
+        self._owner._put(Event(kind, self._index, dict(input=bytes(buf), error=error, signature=signature)))
+
+    def report(self, record):
+        self._owner._report(self._index, record)
+        self._owner._put(Event('stats', self._index, record))
+
+
+class AsyncFuzzer(object):
+    def __init__(self, target, jobs=1, runs=-1, stats_file=None, prometheus_file=None, **fuzzer_kwargs):
+        """
+        @param jobs:            the number of fuzzing jobs to run
+        @param runs:            the number of inputs for each job to run; -1 to run until
+                                stopped (or, without keep_going, until a job finds a failure)
+        @param stats_file:      file to write the combined statistics of the jobs to, as JSON lines
+        @param prometheus_file: file to write them to as a Prometheus textfile
+        @param fuzzer_kwargs:   the arguments for each job's Fuzzer
+        """
+        self._target = target
+        self._jobs = jobs
+        self._runs = runs
+        self._fuzzer_kwargs = fuzzer_kwargs
+        self._peers = []
+        self._fuzzers = []
+        self._events = None
+        if stats_file or prometheus_file:
+            self._stats_writer = stats.StatsWriter(stats_file, prometheus_file, fuzzer.SAMPLING_WINDOW)
+        else:
+            self._stats_writer = None
+        # The latest stats record from each job
+        self._stats = {}
+
+    def _queue(self):
+        # Made on first use, so that it belongs to the loop we are run in.
+        if self._events is None:
+            self._events = asyncio.Queue()
+        return self._events
+
+    def _put(self, event):
+        self._queue().put_nowait(event)
+
+    def _report(self, index, record):
+        self._stats[index] = record
+        if self._stats_writer:
+            self._stats_writer.write(stats.combine([self._stats[n] for n in sorted(self._stats)]))
+
+    async def _readable(self, fd, timeout):
+        """
+        @return: True if fd became readable within the timeout
+        """
+        loop = asyncio.get_event_loop()
+        ready = loop.create_future()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(True))
+        try:
+            return await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    async def _drive(self, f):
+        """
+        Run a job's Fuzzer.steps(), making anything which blocks on another thread.
+        """
+        loop = asyncio.get_event_loop()
+        steps = f.steps()
+        try:
+            request = next(steps)
+            while True:
+                if isinstance(request, fuzzer.Wait):
+                    request = steps.send(await self._readable(request.conn.fileno(), request.timeout))
+                else:
+                    request = steps.send(await loop.run_in_executor(None, request.func))
+        except StopIteration:
+            pass
+
+    async def run(self):
+        """
+        Run the jobs until they have all finished.
+        """
+        shared_virgin = mp.Array('B', bitmap.MAP_SIZE)
+        for index in range(self._jobs):
+            peer = AsyncPeer(index, self)
+            self._peers.append(peer)
+            self._fuzzers.append(fuzzer.Fuzzer(self._target, runs=self._runs, shared_virgin=shared_virgin,
+                                               peer=peer, **self._fuzzer_kwargs))
+        try:
+            drivers = [asyncio.ensure_future(self._drive(f)) for f in self._fuzzers]
+            while drivers:
+                done, drivers = await asyncio.wait(drivers, return_when=asyncio.FIRST_COMPLETED)
+                for driver in done:
+                    driver.result()
+                if self._runs == -1:
+                    # Jobs only stop by themselves when they have found a failure.
+                    self.stop()
+        finally:
+            # If we were cancelled, the workers are still running.
+            loop = asyncio.get_event_loop()
+            await asyncio.gather(*[loop.run_in_executor(None, f.close) for f in self._fuzzers])
+            if self._stats_writer and self._stats:
+                self._stats_writer.write(stats.combine([self._stats[n] for n in sorted(self._stats)]), force=True)
+            # Wake up anyone waiting for events.
+            self._put(None)
+
+    def stop(self):
+        """
+        Ask all of the jobs to stop, once their current batches have finished.
+        """
+        for f in self._fuzzers:
+            f.stop()
+
+    async def events(self):
+        """
+        Asynchronous iterator over the Events from the jobs, ending once they have all finished.
+        """
+        while True:
+            event = await self._queue().get()
+            if event is None:
+                return
+            yield event
@@ -0,0 +1,199 @@
+"""
+AFL style coverage maps.
+
+The tracer records, for each input, a fixed size map of hit counts indexed by a hash of the
+(previous location, current location) edge. Once the input has run, the counts are bucketed
+(1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+) so that a loop running a different number of times
+counts as new behaviour, and the result is merged into the 'virgin' map of everything that
+has been seen so far.
+
+All of the per-input work is done with whole-map operations (bytes.translate and large
+integer arithmetic), so it costs O(map size) with no per-edge Python code.
+"""
+
+import binascii
+import hashlib
+import re
+
+# Python targets have far fewer edges than the C programs AFL was designed for, and the
+# per-input cost is proportional to the size of the map, so we use a smaller map than AFL.
+MAP_SIZE = 1 << 14
+MAP_MASK = MAP_SIZE - 1
+
+
+def bucket(count):
+    """
+    Bucket a hit count into a single bit, as AFL does.
+    """
+    if count == 0:
+        return 0
+    if count <= 3:
+        return 1 << (count - 1)
+    if count <= 7:
+        return 8
+    if count <= 15:
+        return 16
+    if count <= 31:
+        return 32
+    if count <= 127:
+        return 64
+    return 128
+
+
+BUCKETS = bytes(bytearray(bucket(n) for n in range(256)))
+
+EMPTY_MAP = bytes(bytearray(MAP_SIZE))
+
+_nonzero = re.compile(b'[^\x00]')
+
+
+try:
+    _from_bytes = int.from_bytes
+
+    def to_int(buf):
+        return _from_bytes(buf, 'little')
+
+    def to_bytes(value):
+        return value.to_bytes(MAP_SIZE, 'little')
+
+except AttributeError:
+    # Python 2 has no int.from_bytes; the bit order doesn't matter, as long as it is consistent.
+    def to_int(buf):
+        return int(binascii.hexlify(buf) or b'0', 16)
+
+    def to_bytes(value):
+        # A bytearray, which can be copied into a ctypes array (see byte_view)
+        return bytearray(binascii.unhexlify('%0*x' % (MAP_SIZE * 2, value)))
+
+
+if hasattr(memoryview, 'cast'):
+    def byte_view(shared, offset=0, length=None):
+        """
+        @param shared:  ctypes array of unsigned bytes, such as a multiprocessing RawArray
+        @return: writable view of length bytes of it from offset (the rest, by default),
+                 indexed by integers
+        """
+        view = memoryview(shared).cast('B')
+        return view[offset:] if length is None else view[offset:offset + length]
+
+else:
+    import ctypes
+
+    # Python 2 has no memoryview.cast, and its memoryviews of ctypes arrays are indexed by
+    # single characters, so the view is a ctypes array on the same memory instead.
+    def byte_view(shared, offset=0, length=None):
+        if length is None:
+            length = ctypes.sizeof(shared) - offset
+        return (ctypes.c_ubyte * length).from_buffer(shared, offset)
+
+
+def popcount(value):
+    return bin(value).count('1')
+
+
+def features(trace_map):
+    """
+    @param trace_map:   the per-input hit count map
+    @return: sorted list of the features of the input, each the index of a bit in its
+             bucketed map (as held by VirginMap.bits)
+    """
+    bucketed = bytearray(trace_map).translate(BUCKETS)
+    found = []
+    for match in _nonzero.finditer(bucketed):
+        index = match.start()
+        value = bucketed[index]
+        found.extend(index * 8 + bit for bit in range(8) if value >> bit & 1)
+    return found
+
+
+def from_features(feature_list):
+    """
+    @return: the features as an integer, in the form of VirginMap.bits
+    """
+    bucketed = bytearray(MAP_SIZE)
+    for feature in feature_list:
+        bucketed[feature >> 3] |= 1 << (feature & 7)
+    return to_int(bucketed)
+
+
+def path_hash(trace_map):
+    """
+    @return: hash of the exact hit counts of an input; much cheaper than signature, but only
+             for comparing within this process
+    """
+    return hash(bytes(bytearray(trace_map)))
+
+
+def signature(trace_map):
+    """
+    @param trace_map:   the per-input hit count map
+    @return: hex string identifying the bucketed coverage of an input; inputs with the same
+             signature took the same edges, about as many times
+    """
+    return hashlib.sha256(bytearray(trace_map).translate(BUCKETS)).hexdigest()[:32]
+
+
+class VirginMap(object):
+    """
+    Record of all the bucketed edges that have been seen so far.
+
+    The map is held as one large integer, with one bit for every (edge, bucket) pair.
+    """
+
+    def __init__(self):
+        self.bits = 0
+        self.count = 0
+
+    def merge(self, trace_map):
+        """
+        Merge the hit counts for an input into the map.
+
+        @param trace_map:   the per-input hit count map
+        @return: integer holding the bits that had not been seen before; 0 if there were none.
+        """
+        if not isinstance(trace_map, bytearray):
+            trace_map = bytearray(trace_map)
+        merged = self.bits | to_int(trace_map.translate(BUCKETS))
+        if merged == self.bits:
+            return 0
+        new_bits = merged ^ self.bits
+        self.bits = merged
+        self.count += popcount(new_bits)
+        return new_bits
+
+
+class SharedVirginMap(VirginMap):
+    """
+    Record of the bucketed edges seen by several processes.
+
+    The map is held in shared memory (a multiprocessing.Array of MAP_SIZE bytes), so that
+    an edge found by one process is not new to any of the others. Each process also keeps a
+    copy of the bits as it last saw them: the shared map only ever gains bits, so an input
+    with nothing new to the copy has nothing new to the shared map either, and most inputs
+    are dealt with without taking the lock.
+    """
+
+    def __init__(self, shared):
+        self._shared = shared
+        self._view = byte_view(shared.get_obj())
+        self._seen = to_int(self._view)
+        self.count = popcount(self._seen)
+
+    @property
+    def bits(self):
+        return to_int(self._view)
+
+    def merge(self, trace_map):
+        if not isinstance(trace_map, bytearray):
+            trace_map = bytearray(trace_map)
+        bits = to_int(trace_map.translate(BUCKETS))
+        if self._seen | bits == self._seen:
+            return 0
+        with self._shared.get_lock():
+            seen = to_int(self._view)
+            merged = seen | bits
+            if merged != seen:
+                self._view[:] = to_bytes(merged)
+        self._seen = merged
+        self.count = popcount(merged)
+        return merged ^ seen
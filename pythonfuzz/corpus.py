@@ -2,9 +2,13 @@ import os
 import math
 import random
 import struct
+import binascii
 import hashlib
+import heapq
 
-from . import dictionary
+from . import bitmap, dictionary
+from .schedule import Scheduler
+from .store import PackedStore, is_packed
 
 
 INTERESTING8 = [-128, -1, 0, 1, 16, 32, 64, 100, 127]
@@ -391,28 +395,53 @@ class CorpusError(Exception):
 
 class Corpus(object):
 
-    def __init__(self, dirs=None, max_input_size=4096, mutators_filter=None, dict_path=None):
+    def __init__(self, dirs=None, max_input_size=4096, mutators_filter=None, dict_path=None, schedule='entropic'):
+        # The inputs: each a bytearray, or for a packed corpus, the index of the input in
+        # the store
         self._inputs = []
+        # What is known about each input, and how often to pick it
+        self._schedule = Scheduler(schedule)
+        # The index of the input with each sha256 digest, and with each path (hash of its
+        # coverage map) where that is known; and the indices whose path is known
+        self._digests = {}
+        self._paths = {}
+        self._covered = set()
+        self._bytes = 0
+        # Names of the mutators used to make the last input generated, and the index of the
+        # input it was made from (None if it was not made from one)
+        self.last_mutators = []
+        self.last_seed = None
         self._dict = dictionary.Dictionary()
         if dict_path:
             self._dict.load(dict_path)
         self._max_input_size = max_input_size
         self._dirs = dirs if dirs else []
-        for i, path in enumerate(dirs):
-            if i == 0 and not os.path.exists(path):
-                os.mkdir(path)
-
-            if os.path.isfile(path):
-                self._add_file(path)
-            else:
-                for i in os.listdir(path):
-                    fname = os.path.join(path, i)
-                    if os.path.isfile(fname):
-                        self._add_file(fname)
+        self._store = None
+        if self._dirs and is_packed(self._dirs[0]):
+            self._store = PackedStore(self._dirs[0])
+            for path in self._dirs[1:]:
+                self._store.import_path(path)
+            for index in range(len(self._store)):
+                self._digests[self._store.digest(index)] = len(self._inputs)
+                self._inputs.append(index)
+                self._schedule.add(self._store.length(index))
+            self._bytes = self._store.size
+        else:
+            for i, path in enumerate(self._dirs):
+                if i == 0 and not os.path.exists(path):
+                    os.mkdir(path)
+
+                if os.path.isfile(path):
+                    self._add_file(path)
+                else:
+                    for i in os.listdir(path):
+                        fname = os.path.join(path, i)
+                        if os.path.isfile(fname):
+                            self._add_file(fname)
         self._seed_run_finished = not self._inputs
         self._seed_idx = 0
-        self._save_corpus = dirs and os.path.isdir(dirs[0])
-        self._inputs.append(bytearray(0))
+        self._save_corpus = self._store is not None or (self._dirs and os.path.isdir(self._dirs[0]))
+        self._add(bytearray(0), hashlib.sha256().digest())
 
         # Work out what we'll filter
         filters = mutators_filter.split(' ') if mutators_filter else []
@@ -445,14 +474,41 @@ class Corpus(object):
                                                         len(self._inputs),
                                                         len(self.mutators))
 
+    def _add(self, buf, digest):
+        """
+        Add an input held in memory, unless it is already there.
+        """
+        if digest not in self._digests:
+            self._digests[digest] = len(self._inputs)
+            self._inputs.append(buf)
+            self._schedule.add(len(buf))
+            self._bytes += len(buf)
+
     def _add_file(self, path):
         with open(path, 'rb') as f:
-            self._inputs.append(bytearray(f.read()))
+            buf = bytearray(f.read())
+        self._add(buf, hashlib.sha256(buf).digest())
+
+    def _get(self, index):
+        """
+        @return: the input at index; a read-only memoryview for an input in the store
+        """
+        buf = self._inputs[index]
+        if self._store is not None and isinstance(buf, int):
+            return self._store[buf]
+        return buf
 
     @property
     def length(self):
         return len(self._inputs)
 
+    @property
+    def size(self):
+        """
+        Total size of the inputs, in bytes
+        """
+        return self._bytes
+
     @staticmethod
     def _rand(n):
         if n == 1 or n == 0:
@@ -472,28 +528,141 @@ class Corpus(object):
                 break
         return count
 
-    def put(self, buf):
-        self._inputs.append(buf)
-        if self._save_corpus:
-            m = hashlib.sha256()
-            m.update(buf)
-            fname = os.path.join(self._dirs[0], m.hexdigest())
-            with open(fname, 'wb') as f:
-                f.write(buf)
+    def put(self, buf, save=True, exec_time=None, coverage_map=None):
+        """
+        Add an input to the corpus, unless it is already there: the same bytes, or (where the
+        coverage is known) the same path in no fewer bytes. An input with the path of one in
+        the corpus, but fewer bytes, takes its place.
+
+        @param exec_time:       time taken to run the input, in microseconds, if known
+        @param coverage_map:    the per-input hit count map of the input, if known
+        @return: True if the input was added, or took the place of another
+        """
+        digest = hashlib.sha256(buf).digest()
+        index = self._digests.get(digest)
+        if index is not None:
+            # Most often an input from the corpus directories, run for the first time; now we
+            # know its coverage.
+            if coverage_map is not None and index not in self._covered:
+                self._covered.add(index)
+                self._paths.setdefault(bitmap.path_hash(coverage_map), index)
+                self._schedule.update_seed(index, exec_time=exec_time, coverage_map=coverage_map)
+            return False
+
+        path = None
+        if coverage_map is not None:
+            path = bitmap.path_hash(coverage_map)
+            index = self._paths.get(path)
+            if index is not None:
+                return self._replace(index, buf, digest, exec_time)
+            self._paths[path] = len(self._inputs)
+            self._covered.add(len(self._inputs))
+
+        self._digests[digest] = len(self._inputs)
+        if save and self._store is not None:
+            self._inputs.append(self._store.append(buf))
+        else:
+            self._inputs.append(buf)
+        self._schedule.add(len(buf), exec_time, coverage_map)
+        self._bytes += len(buf)
+        if save and self._save_corpus and self._store is None:
+            self._save(buf, digest)
+        return True
+
+    def _path(self, digest):
+        return os.path.join(self._dirs[0], binascii.hexlify(digest).decode('ascii'))
+
+    def _save(self, buf, digest):
+        with open(self._path(digest), 'wb') as f:
+            f.write(buf)
+
+    def _replace(self, index, buf, digest, exec_time=None):
+        """
+        Put an input in the place of the input at index, which took the same path, if it is
+        smaller and not in the corpus already.
+
+        @return: True if it was replaced
+        """
+        old = self._get(index)
+        if len(buf) >= len(old) or digest in self._digests:
+            return False
+        old_digest = hashlib.sha256(old).digest()
+        del self._digests[old_digest]
+        self._digests[digest] = index
+        if self._store is not None and isinstance(self._inputs[index], int):
+            # The store is append-only, so the old input stays in it.
+            self._inputs[index] = self._store.append(buf)
+        else:
+            self._inputs[index] = bytearray(buf)
+            if self._save_corpus:
+                # A file in the first corpus directory named after its sha256 was saved by the
+                # fuzzer, in this run or an earlier one, so it can go; any other is left alone.
+                try:
+                    os.remove(self._path(old_digest))
+                except OSError:
+                    pass
+                self._save(buf, digest)
+        self._bytes += len(buf) - len(old)
+        self._schedule.update_seed(index, size=len(buf), exec_time=exec_time)
+        return True
+
+    def slowest(self, count):
+        """
+        @return: list of (execution time in microseconds, input) for the slowest inputs,
+                 slowest first
+        """
+        timed = ((seed.exec_time, index) for index, seed in enumerate(self._schedule.seeds)
+                 if seed.exec_time is not None)
+        return [(exec_time, self._get(index)) for exec_time, index in heapq.nlargest(count, timed)]
+
+    def ran(self, buf, coverage_map, seed=None, exec_time=None):
+        """
+        Tell the corpus about an input which has been run. Where it was made from an input in
+        the corpus, and is smaller, it takes the place of any input with the same path.
+
+        @param seed:        index of the input it was made from, if any
+        @param exec_time:   time taken to run it, in microseconds
+        @return: True if it took the place of an input
+        """
+        path = None
+        # Hashing the coverage of every input would cost more than the smaller inputs are worth.
+        if seed is not None and len(buf) < self._schedule.seeds[seed].size:
+            path = bitmap.path_hash(coverage_map)
+        self._schedule.ran(coverage_map, path)
+        index = None if path is None else self._paths.get(path)
+        if index is None:
+            return False
+        return self._replace(index, buf, hashlib.sha256(buf).digest(), exec_time)
+
+    def found(self, seed):
+        """
+        Tell the schedule that an input made from the input at index `seed` found new coverage.
+        """
+        if seed is not None:
+            self._schedule.found(seed)
+
+    def add_token(self, word):
+        """
+        Add a word learnt while fuzzing to the dictionary used by the mutators.
+        """
+        self._dict.add_temporary(word)
 
     def generate_input(self):
         if not self._seed_run_finished:
-            next_input = self._inputs[self._seed_idx]
+            self.last_mutators = []
+            self.last_seed = None
+            next_input = self._get(self._seed_idx)
             self._seed_idx += 1
             if self._seed_idx >= len(self._inputs):
                 self._seed_run_finished = True
-            return next_input
+            return next_input if isinstance(next_input, bytearray) else bytearray(next_input)
 
-        buf = self._inputs[self._rand(len(self._inputs))]
-        return self.mutate(buf)
+        self.last_seed = self._schedule.choose()
+        return self.mutate(self._get(self.last_seed))
 
     def mutate(self, buf):
-        res = buf[:]
+        res = bytearray(buf)
+        applied = []
         nm = self._rand_exp()
         #print("Start with {}".format(res))
         for i in range(nm):
@@ -511,6 +680,8 @@ class Corpus(object):
                     break
             if newres is not None:
                 res = newres
+                applied.append(mutator.__class__.__name__)
+        self.last_mutators = applied
 
         if len(res) > self._max_input_size:
             res = res[:self._max_input_size]
@@ -6,6 +6,10 @@ See documentation at:
     https://github.com/google/AFL/blob/master/dictionaries/README.dictionaries
 
 For our use, we only support reading the content of the dictionary values.
+
+Words may also be learnt while fuzzing (for example, the operands of comparisons made by the
+target). These are kept in a bounded table, from which the oldest words are dropped first.
+The tracer reports each word only once, so there is nothing to tell which are still in use.
 """
 
 import codecs
@@ -13,11 +17,23 @@ import random
 import re
 import os
 
+# Number of learnt words we keep
+TEMPORARY_SIZE = 256
+
+
 class Dictionary:
     line_re = re.compile('"(.+)"$')
 
-    def __init__(self):
+    def __init__(self, temporary_size=TEMPORARY_SIZE):
+        # The words, for random selection, and as a set, to look them up
         self._dict = list()
+        self._dict_words = set()
+        # Likewise for the learnt words; once the table is full, each word added replaces the
+        # one in the slot after the last replaced, which is the oldest.
+        self._temporary = list()
+        self._temporary_words = set()
+        self._temporary_size = temporary_size
+        self._next_slot = 0
 
     def load(self, dict_path):
         if os.path.isfile(dict_path):
@@ -33,7 +49,10 @@ class Dictionary:
             filename = os.path.join(dict_path, bin_file)
             if os.path.isfile(filename):
                 with open(filename, 'rb') as fh:
-                    self._dict.append(fh.read())
+                    word = fh.read()
+                if word not in self._dict_words:
+                    self._dict_words.add(word)
+                    self._dict.append(word)
 
     def load_file(self, dict_path):
         """
@@ -57,8 +76,27 @@ class Dictionary:
                     (value, _) = codecs.escape_decode(value)
                     _dict.add(value)
         self._dict = list(_dict)
+        self._dict_words = _dict
+
+    def add_temporary(self, word):
+        """
+        Add a word learnt while fuzzing, dropping the oldest learnt word if the table is full.
+        """
+        if word in self._temporary_words or word in self._dict_words:
+            return
+        if len(self._temporary) < self._temporary_size:
+            self._temporary.append(word)
+        else:
+            self._temporary_words.discard(self._temporary[self._next_slot])
+            self._temporary[self._next_slot] = word
+            self._next_slot = (self._next_slot + 1) % self._temporary_size
+        self._temporary_words.add(word)
 
     def get_word(self):
-        if not self._dict:
+        total = len(self._dict) + len(self._temporary)
+        if not total:
             return None
-        return random.choice(self._dict)
+        n = random.randint(0, total - 1)
+        if n < len(self._dict):
+            return self._dict[n]
+        return self._temporary[n - len(self._dict)]
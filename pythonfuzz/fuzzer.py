@@ -2,32 +2,364 @@ import os
 import sys
 import time
 import sys
+import signal
 import psutil
 import hashlib
+import heapq
+import collections
+import inspect
 import logging
 import functools
+import traceback
+import gc
 import multiprocessing as mp
 
-from pythonfuzz import corpus, tracer
+from pythonfuzz import bitmap, corpus, memory, protocol, stats, sync, tracer
 
 logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
 logging.getLogger().setLevel(logging.DEBUG)
 
 SAMPLING_WINDOW = 5 # IN SECONDS
 
+# Inputs are sent to the worker in batches, sized so that each batch should take about
+# BATCH_TIME seconds (or a tenth of the timeout, if that is shorter). The fuzzer only sees
+# results a batch at a time, so this keeps the stats and new coverage timely.
+BATCH_TIME = 0.05 # IN SECONDS
+MAX_BATCH_SIZE = 256
+
+# The worker stops inputs that run for longer than the timeout itself, where it can. The
+# fuzzer's watchdog only kills it if an input overruns by WATCHDOG_GRACE as well, which
+# happens when the worker is stuck in C code and the timeout signal cannot be handled.
+WATCHDOG_GRACE = 5 # IN SECONDS
+WATCHDOG_INTERVAL = 0.5 # IN SECONDS
+
+# The longest execution time a protocol.Result can hold, in microseconds
+MAX_EXEC_TIME = 0xffffffff
+
+# Crashes are told apart by the exception type and the innermost CRASH_FRAMES frames of
+# the traceback.
+CRASH_FRAMES = 5
+
 try:
     lru_cache = functools.lru_cache
 except:
     import functools32
     lru_cache = functools32.lru_cache
 
+try:
+    timer = time.perf_counter
+except AttributeError:
+    # Python 2
+    timer = time.time
+
+try:
+    timer_ns = time.perf_counter_ns
+except AttributeError:
+    # Python 3.6 and earlier
+    def timer_ns():
+        return int(timer() * 1000000000)
+
+try:
+    import asyncio
+except ImportError:
+    # Python 2
+    asyncio = None
+
+
+# Two batches' worth of coverage maps: one for the batch the worker is running, and one for
+# the batch the fuzzer is reading the results of.
+MAP_COUNT = 2 * MAX_BATCH_SIZE
+
+
+def coverage_maps(shared):
+    """
+    @param shared:  shared memory holding MAP_COUNT coverage maps
+    @return: list of a writable view on each map
+    """
+    return [bitmap.byte_view(shared, index * bitmap.MAP_SIZE, bitmap.MAP_SIZE) for index in range(MAP_COUNT)]
+
+
+# Where an input came from: the index of the corpus input it was made from (None for an
+# input run as it is), and the names of the mutators applied to it
+Origin = collections.namedtuple('Origin', ('seed', 'mutators'))
+
+# What Fuzzer.steps() waits for, and what it leaves to whatever drives it:
+#   Wait:   wait for conn to become readable, for up to timeout seconds; send back whether it did
+#   Call:   call func, which may block (it starts or stops the worker, say); send back the result
+Wait = collections.namedtuple('Wait', ('conn', 'timeout'))
+Call = collections.namedtuple('Call', ('func',))
+
+# A batch run by a WorkerPool:
+#   batch:      the list of (index, input) sent
+#   results:    a protocol.Result for each input the worker got to, in order; None for one whose
+#               result was lost when the worker had to be killed, or died
+#   maps:       the coverage map of each input
+#   signature:  the signature of the failure the batch stopped at, if any
+#   reason:     why the worker was lost, if it was ('timeout reached' or the exit code)
+BatchResult = collections.namedtuple('BatchResult', ('batch', 'results', 'maps', 'signature', 'reason'))
+
+try:
+    from multiprocessing.connection import wait
+except ImportError:
+    # Python 2
+    def wait(conns, timeout):
+        started = time.time()
+        while True:
+            ready = [conn for conn in conns if conn.poll()]
+            if ready or time.time() - started >= timeout:
+                return ready
+            time.sleep(0.01)
+
+
+class InputTimeout(BaseException):
+    """
+    Raised in the worker when an input runs for longer than the timeout. It is not an
+    Exception, so that the target's own exception handlers leave it alone.
+    """
+
+
+def _raise_timeout(signum, frame):
+    raise InputTimeout()
+
+
+# Without setitimer (eg on Windows), timeouts are only caught by the fuzzer's watchdog.
+in_worker_timeouts = hasattr(signal, 'setitimer')
+
+if in_worker_timeouts:
+    def _set_timer(seconds):
+        if seconds:
+            signal.setitimer(signal.ITIMER_REAL, seconds)
+
+    def _clear_timer():
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+else:
+    def _set_timer(seconds):
+        pass
+
+    def _clear_timer():
+        pass
+
+
+def crash_signature(exc_type, tb, lines=True):
+    """
+    @param lines:   include the line numbers; a hang may be interrupted on any line of
+                    the loop it is stuck in, so timeouts leave them out
+    @return: string identifying a crash, the same for every input which fails in the same way
+    """
+    m = hashlib.sha256()
+    for filename, lineno, name, _ in traceback.extract_tb(tb)[-CRASH_FRAMES:]:
+        m.update('{}:{}:{}\n'.format(filename, lineno if lines else '', name).encode('utf-8', 'replace'))
+    return '{}-{}'.format(exc_type.__name__, m.hexdigest()[:16])
+
+
+def run_input(target, buf, timeout=None, memory_limit=None):
+    """
+    Run the target on one input.
+
+    @param timeout:         seconds after which the input is stopped, if the platform can
+    @param memory_limit:    memory.MemoryLimit to check the input against
+    @return: tuple of (protocol.Result, error text, crash signature); the error text and
+             signature are None unless the target failed
+    """
+    if memory_limit:
+        memory_limit.start()
+    start = timer_ns()
+    try:
+        try:
+            _set_timer(timeout)
+            target(buf)
+        finally:
+            _clear_timer()
+    except InputTimeout:
+        exec_time = _elapsed_us(start)
+        return (protocol.Result(protocol.STATUS_TIMEOUT, exec_time, memory.peak_rss()),
+                traceback.format_exc(), crash_signature(InputTimeout, sys.exc_info()[2], lines=False))
+    except Exception as e:
+        exec_time = _elapsed_us(start)
+        print("Exception: %r\n" % (e,))
+        return (protocol.Result(protocol.STATUS_CRASH, exec_time, memory.peak_rss()),
+                traceback.format_exc(), crash_signature(type(e), sys.exc_info()[2]))
+    exec_time = _elapsed_us(start)
+
+    if memory_limit:
+        rss, error = memory_limit.check()
+        if error:
+            return protocol.Result(protocol.STATUS_OOM, exec_time, rss), error, None
+    else:
+        rss = memory.peak_rss()
+    return protocol.Result(protocol.STATUS_OK, exec_time, rss), None, None
+
+
+def _elapsed_us(start):
+    """
+    @param start:   timer_ns() at the start
+    @return: microseconds since the start, as sent in a protocol.Result
+    """
+    return min((timer_ns() - start) // 1000, MAX_EXEC_TIME)
+
+
+def is_coroutine_function(target):
+    """
+    @return: True if the target is an async def function
+    """
+    return asyncio is not None and inspect.iscoroutinefunction(target)
 
-def worker(target, child_conn, close_fd_mask):
+
+class CoroutineTarget(object):
+    """
+    Run an async def target, running each input to completion on an event loop which is
+    kept for the whole run, rather than starting a new loop (as asyncio.run does) for every
+    input.
+    """
+
+    def __init__(self, target):
+        self._target = target
+        self._loop = None
+        self._pid = None
+
+    def _get_loop(self):
+        # A forked child must not share its parent's loop, whose selector would be shared too.
+        if self._pid != os.getpid():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._pid = os.getpid()
+        return self._loop
+
+    def _cancel_pending(self, loop):
+        # Tasks left behind by an input (including the input itself, if it timed out while
+        # it was waiting) are cancelled so that they cannot run during the next one.
+        all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+        pending = [task for task in all_tasks(loop) if not task.done()]
+        if pending:
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+    def __call__(self, buf):
+        loop = self._get_loop()
+        try:
+            loop.run_until_complete(self._target(buf))
+        finally:
+            self._cancel_pending(loop)
+
+
+def run_forked(run, buf):
+    """
+    Run the target on one input in a child process forked for it, so that nothing the
+    target does persists to the next input. The coverage map is in shared memory, so the
+    child's coverage is seen; everything else is sent back over a pipe.
+
+    @param run:     function to run the target on an input, as run_input
+    @return: protocol.Reply for the one input
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            # Forget the fork handlers (threading, random and so on) we have just run.
+            tracer.reset()
+            result, error, signature = run(buf)
+            data = protocol.pack_reply([result], error, signature, tracer.take_tokens())
+            while data:
+                data = data[os.write(write_fd, data):]
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    chunks = []
+    while True:
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read_fd)
+    _, status = os.waitpid(pid, 0)
+    if chunks:
+        return protocol.unpack_reply(b''.join(chunks))
+
+    # The child died without reporting; something stronger than an exception stopped it.
+    if os.WIFSIGNALED(status):
+        reason = 'child killed by signal {}'.format(os.WTERMSIG(status))
+    else:
+        reason = 'child exited with code {}'.format(os.WEXITSTATUS(status))
+    return protocol.Reply([protocol.Result(protocol.STATUS_CRASH, 0, 0)], reason, reason, [])
+
+
+class DummyFile:
+    """No-op to trash stdout away."""
+    def write(self, x):
+        pass
+
+    def flush(self):
+        pass
+
+
+def start_coverage(trace_include=None, trace_exclude=None, instrument_modules=None, trace_cmp=False):
+    """
+    Start collecting coverage in this process.
+    """
+    tracer.trace_cmp = trace_cmp
+    if instrument_modules:
+        # The instrumented code updates the coverage map itself; no tracing is needed.
+        from pythonfuzz import instrument
+        instrument.install(instrument_modules, trace_cmp)
+    else:
+        tracer.configure(trace_include, trace_exclude)
+        tracer.install()
+
+
+def make_runner(target, timeout=None, rss_limit_mb=0, malloc_limit_mb=0):
+    """
+    @return: function to run the target on one input, as run_input
+    """
+    if in_worker_timeouts:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+    if is_coroutine_function(target):
+        target = CoroutineTarget(target)
+    return functools.partial(run_input, target, timeout=timeout,
+                             memory_limit=memory.MemoryLimit(rss_limit_mb, malloc_limit_mb))
+
+
+def run_batch(run, bufs, maps, progress=None, fork_server=False):
+    """
+    Run a batch of inputs, stopping at the first which fails.
+
+    @param run:         function to run the target on an input, as run_input
+    @param maps:        list of the coverage maps to record the coverage of each input in
+    @param progress:    shared value to hold the index of the input running
+    @return: protocol.Reply
+    """
+    results = []
+    error = None
+    signature = None
+    tokens = []
+    for index, buf in enumerate(bufs):
+        if progress is not None:
+            # Let the fuzzer know which input is running, in case it never finishes.
+            progress.value = index
+        tracer.use_map(maps[index])
+        tracer.reset()
+        if fork_server:
+            reply = run_forked(run, buf)
+            result, error, signature = reply.results[0], reply.error, reply.signature
+            tokens.extend(reply.tokens)
+        else:
+            result, error, signature = run(buf)
+        results.append(result)
+        if error is not None:
+            break
+
+    tokens.extend(tracer.take_tokens())
+    return protocol.Reply(results, error, signature, tokens)
+
+
+def worker(target, child_conn, progress, maps, close_fd_mask, timeout=None, rss_limit_mb=0, malloc_limit_mb=0,
+           trace_include=None, trace_exclude=None, instrument_modules=None, trace_cmp=False, fork_server=False):
     # Silence the fuzzee's noise
-    class DummyFile:
-        """No-op to trash stdout away."""
-        def write(self, x):
-            pass
     logging.captureWarnings(True)
     logging.getLogger().setLevel(logging.CRITICAL)
     if close_fd_mask & 1:
@@ -35,18 +367,191 @@ def worker(target, child_conn, close_fd_mask):
     if close_fd_mask & 2:
         sys.stderr = DummyFile()
 
-    sys.settrace(tracer.trace)
+    # Each input in a batch records its coverage in its own map in shared memory.
+    maps = coverage_maps(maps)
+    start_coverage(trace_include, trace_exclude, instrument_modules, trace_cmp)
+    run = make_runner(target, timeout, rss_limit_mb, malloc_limit_mb)
+
+    if fork_server and hasattr(gc, 'freeze'):
+        # Keep the collector from touching, and so copying, the objects we share with
+        # the children.
+        gc.freeze()
+
     while True:
-        buf = child_conn.recv_bytes()
-        try:
-            target(buf)
-        except Exception as e:
-            print("Exception: %r\n" % (e,))
-            logging.exception(e)
-            child_conn.send(e)
+        first_map, bufs = protocol.unpack_batch(child_conn.recv_bytes())
+        reply = run_batch(run, bufs, maps[first_map:first_map + len(bufs)], progress, fork_server)
+        child_conn.send_bytes(protocol.pack_reply(*reply))
+        # A forked child leaves nothing behind, so the fork server can carry on after a
+        # failure; so can we after a timeout, which is only a slow input. After a crash or
+        # running out of memory (our peak RSS can only go up), the fuzzer replaces us.
+        if reply.results and reply.results[-1].status in (protocol.STATUS_CRASH, protocol.STATUS_OOM) and \
+                not fork_server:
             break
+
+
+class Watchdog(object):
+    """
+    Watches a worker's progress through a batch, to tell when it is stuck on an input.
+    """
+
+    def __init__(self, progress, timeout):
+        self._progress = progress
+        self.limit = timeout
+        if in_worker_timeouts:
+            # The worker stops slow inputs itself; we only step in if that fails.
+            self.limit += WATCHDOG_GRACE
+        # How long to wait for a reply before checking on the worker
+        self.interval = min(self.limit, WATCHDOG_INTERVAL)
+        self.reset()
+
+    def reset(self):
+        self._index = self._progress.value
+        self._since = timer()
+
+    def stuck(self):
+        """
+        @return: True if the worker has been on the same input for longer than the limit
+        """
+        if self._progress.value != self._index:
+            self._index = self._progress.value
+            self._since = timer()
+            return False
+        return timer() - self._since > self.limit
+
+
+class WorkerJob(object):
+    """
+    A worker process sent inputs a batch at a time by something other than a Fuzzer, such
+    as the merge or the crash minimiser.
+    """
+
+    def __init__(self, target, worker_kwargs):
+        self._target = target
+        self._worker_kwargs = worker_kwargs
+        self._shared_maps = mp.RawArray('B', bitmap.MAP_SIZE * MAP_COUNT)
+        self.maps = coverage_maps(self._shared_maps)
+        self.progress = mp.RawValue('i', 0)
+        self._watchdog = Watchdog(self.progress, worker_kwargs['timeout'])
+        self.conn = None
+        self.batch = []
+        self._p = None
+
+    def start(self):
+        self.conn, child_conn = mp.Pipe()
+        self._p = mp.Process(target=worker, args=(self._target, child_conn, self.progress, self._shared_maps),
+                             kwargs=self._worker_kwargs)
+        self._p.daemon = True
+        self._p.start()
+
+    def stop(self, kill=False):
+        if kill:
+            self._p.kill()
         else:
-            child_conn.send_bytes(b'%d' % tracer.get_coverage())
+            self._p.terminate()
+        self._p.join()
+        self.conn.close()
+
+    def restart(self):
+        self._p.join()
+        self.conn.close()
+        self.start()
+
+    def send(self, batch):
+        """
+        @param batch:   list of (index, input) to run
+        """
+        self.batch = batch
+        self.progress.value = 0
+        self._watchdog.reset()
+        self.conn.send_bytes(protocol.pack_batch([buf for _, buf in batch]))
+
+    def stuck(self):
+        """
+        @return: True if the worker has been on the same input for too long
+        """
+        return self._watchdog.stuck()
+
+    def receive(self):
+        """
+        @return: protocol.Reply, or None if the worker exited without replying
+        """
+        try:
+            return protocol.unpack_reply(self.conn.recv_bytes())
+        except EOFError:
+            self._p.join()
+            return None
+
+    @property
+    def exitcode(self):
+        return self._p.exitcode
+
+
+class WorkerPool(object):
+    """
+    WorkerJobs running batches of inputs side by side, for something other than a Fuzzer.
+    """
+
+    def __init__(self, target, worker_kwargs, jobs=1):
+        self._timeout = worker_kwargs['timeout']
+        self.jobs = [WorkerJob(target, worker_kwargs) for _ in range(max(1, jobs))]
+
+    def start(self):
+        for job in self.jobs:
+            job.start()
+
+    def stop(self):
+        for job in self.jobs:
+            job.stop(kill=True)
+
+    def run(self, next_batch):
+        """
+        Run batches until there are none left, replacing the workers which fail or hang.
+        A worker stops at the first input which fails, so the inputs after it are not run;
+        it is up to the caller to hand them out again.
+
+        @param next_batch:  function returning the next list of (index, input) to run; empty if
+                            there is nothing more to run, at least until a running batch is done
+        @return: iterator of the BatchResult of each batch, as they finish
+        """
+        while True:
+            for job in self.jobs:
+                if not job.batch:
+                    batch = next_batch()
+                    if batch:
+                        job.send(batch)
+            busy = [job for job in self.jobs if job.batch]
+            if not busy:
+                return
+            ready = wait([job.conn for job in busy], WATCHDOG_INTERVAL)
+            for job in busy:
+                if job.conn in ready:
+                    yield self._receive(job)
+                elif job.stuck():
+                    yield self._handle_hang(job)
+
+    def _receive(self, job):
+        batch, job.batch = job.batch, []
+        reply = job.receive()
+        if reply is None:
+            # Something stronger than an exception stopped the worker. The coverage of the
+            # inputs before the one it was running is in the maps, but not how long they took.
+            done = min(job.progress.value, len(batch) - 1)
+            reason = 'worker exited with code {}'.format(job.exitcode)
+            results = [None] * done + [protocol.Result(protocol.STATUS_CRASH, 0, 0)]
+            job.restart()
+            return BatchResult(batch, results, job.maps, reason, reason)
+        if reply.results and reply.results[-1].status in (protocol.STATUS_CRASH, protocol.STATUS_OOM):
+            job.restart()
+        return BatchResult(batch, reply.results, job.maps, reply.signature, None)
+
+    def _handle_hang(self, job):
+        batch, job.batch = job.batch, []
+        done = min(job.progress.value, len(batch) - 1)
+        job.stop(kill=True)
+        job.start()
+        exec_time = min(int(self._timeout * 1000000), MAX_EXEC_TIME)
+        results = [None] * done + [protocol.Result(protocol.STATUS_TIMEOUT, exec_time, 0)]
+        return BatchResult(batch, results, job.maps, None, 'timeout reached')
 
 
 class Fuzzer(object):
@@ -61,20 +566,86 @@ class Fuzzer(object):
                  close_fd_mask=0,
                  runs=-1,
                  mutators_filter=None,
-                 dict_path=None):
+                 dict_path=None,
+                 trace_include=None,
+                 trace_exclude=None,
+                 instrument_modules=None,
+                 trace_cmp=False,
+                 shared_virgin=None,
+                 peer=None,
+                 keep_going=False,
+                 fork_server=False,
+                 malloc_limit_mb=0,
+                 sync_address=None,
+                 stats_file=None,
+                 prometheus_file=None,
+                 report_slow_units=10,
+                 in_process=False,
+                 schedule='entropic'):
         self._target = target
         self._dirs = [] if dirs is None else dirs
         self._exact_artifact_path = exact_artifact_path
         self._rss_limit_mb = rss_limit_mb
+        self._malloc_limit_mb = malloc_limit_mb
         self._timeout = timeout
         self._regression = regression
         self._close_fd_mask = close_fd_mask
-        self._corpus = corpus.Corpus(self._dirs, max_input_size, mutators_filter, dict_path)
+        self._trace_include = trace_include
+        self._trace_exclude = trace_exclude
+        self._instrument_modules = instrument_modules
+        self._trace_cmp = trace_cmp
+        if shared_virgin is not None:
+            self._virgin = bitmap.SharedVirginMap(shared_virgin)
+        else:
+            self._virgin = bitmap.VirginMap()
+        self._peer = peer
+        self._sync = sync.SyncClient(sync_address) if sync_address else None
+        # Inputs pulled from the sync server, waiting to be run.
+        self._imports = []
+        self._keep_going = keep_going
+        self._fork_server = fork_server
+        # Run the target in this process rather than in a worker; see _start_worker.
+        self._in_process = in_process
+        self._run = None
+        self._scratch_map = None
+        self._reply = None
+        self._corpus = corpus.Corpus(self._dirs, max_input_size, mutators_filter, dict_path, schedule)
         self._total_executions = 0
         self._executions_in_sample = 0
         self._last_sample_time = time.time()
         self._total_coverage = 0
+        self._start_time = time.time()
+        self._exec_time = stats.Histogram()
+        self._mutator_stats = stats.MutatorStats()
+        # Heap of (execution time, sha256) for the slowest inputs; those which took longer
+        # than report_slow_units seconds are written out.
+        self._slow_units = []
+        self._report_slow_units = report_slow_units
+        # The slowest inputs in the corpus, as last reported, and when they were found; it
+        # takes a pass over the corpus, so it is done at most every SAMPLING_WINDOW seconds.
+        self._slowest_corpus = None
+        self._slowest_corpus_time = 0
+        if stats_file or prometheus_file:
+            self._stats_writer = stats.StatsWriter(stats_file, prometheus_file, SAMPLING_WINDOW)
+        else:
+            self._stats_writer = None
+        self._worker_rss = 0
+        self._batch_size = 1
+        self._first_map = 0
+        self._sent_at = 0
+        self._stop_requested = False
         self._p = None
+        self._parent_conn = None
+        self._progress = None
+        self._watchdog = None
+        self._shared_maps = None
+        self._maps = None
+        self._crashes = 0
+        self._crash_signatures = set()
+        self._timeouts = 0
+        self._timeout_signatures = set()
+        self._replace_worker = False
+        self._ooms = 0
         self.runs = runs
 
     def help_mutators(self):
@@ -87,20 +658,73 @@ class Fuzzer(object):
         print("\nMutators prefixed by '-' are currently disabled.")
 
     def log_stats(self, log_type):
-        rss = (psutil.Process(self._p.pid).memory_info().rss + psutil.Process(os.getpid()).memory_info().rss) / 1024 / 1024
+        # The worker reports its peak RSS with every result, so there's no need to ask.
+        if self._in_process:
+            rss = memory.peak_rss() / 1024
+        else:
+            rss = (memory.peak_rss() + self._worker_rss) / 1024
 
         endTime = time.time()
-        execs_per_second = int(self._executions_in_sample / (endTime - self._last_sample_time))
+        execs_per_second = int(self._executions_in_sample / max(endTime - self._last_sample_time, 1e-6))
         self._last_sample_time = time.time()
         self._executions_in_sample = 0
-        logging.info('#{} {}     cov: {} corp: {} exec/s: {} rss: {} MB'.format(
-            self._total_executions, log_type, self._total_coverage, self._corpus.length, execs_per_second, rss))
+        findings = ''
+        if self._keep_going:
+            findings = ' crashes: {}/{} timeouts: {} ooms: {}'.format(
+                len(self._crash_signatures), self._crashes, self._timeouts, self._ooms)
+        logging.info('#{} {}     cov: {} corp: {} exec/s: {} rss: {} MB{}'.format(
+            self._total_executions, log_type, self._total_coverage, self._corpus.length, execs_per_second, rss,
+            findings))
+        final = log_type == 'DONE'
+        # Most log lines come too soon after the last record written to need a new one.
+        write = self._stats_writer is not None and (final or self._stats_writer.due())
+        if write or self._peer:
+            record = self.stats_record(execs_per_second, rss, final=final)
+            if write:
+                self._stats_writer.write(record, force=True)
+            if self._peer:
+                self._peer.report(record)
         return rss
 
-    def write_sample(self, buf, prefix='crash-'):
+    def stats_record(self, execs_per_second, rss, final=False):
+        """
+        @param execs_per_second:    the recent rate of running inputs
+        @param rss:                 memory used by the fuzzer and its worker, in MB
+        @param final:               True for the last record, which must be up to date
+        @return: dict of the statistics (see the stats module)
+        """
+        now = time.time()
+        if final or self._slowest_corpus is None or now - self._slowest_corpus_time >= SAMPLING_WINDOW:
+            self._slowest_corpus = [dict(exec_time_us=exec_time, sha256=hashlib.sha256(buf).hexdigest())
+                                    for exec_time, buf in self._corpus.slowest(stats.SLOWEST)]
+            self._slowest_corpus_time = now
+        record = dict(timestamp=now,
+                      start_time=self._start_time,
+                      executions=self._total_executions,
+                      execs_per_second=execs_per_second,
+                      coverage=self._total_coverage,
+                      corpus_inputs=self._corpus.length,
+                      corpus_bytes=self._corpus.size,
+                      crashes=self._crashes,
+                      unique_crashes=len(self._crash_signatures),
+                      timeouts=self._timeouts,
+                      ooms=self._ooms,
+                      rss_mb=rss,
+                      exec_time_us=self._exec_time.to_dict(),
+                      slowest_inputs=[dict(exec_time_us=exec_time, sha256=digest)
+                                      for exec_time, digest in sorted(self._slow_units, reverse=True)],
+                      slowest_corpus=self._slowest_corpus,
+                      mutators=self._mutator_stats.to_dict())
+        record['workers'] = [dict((name, record[name]) for name in stats.COUNTERS + ('coverage', 'corpus_inputs'))]
+        return record
+
+    def write_sample(self, buf, prefix='crash-', exact=True):
+        """
+        @param exact:   write the sample to the exact artifact path, if one was given
+        """
         m = hashlib.sha256()
         m.update(buf)
-        if self._exact_artifact_path:
+        if exact and self._exact_artifact_path:
             crash_path = self._exact_artifact_path
         else:
             crash_path = prefix + m.hexdigest()
@@ -113,49 +737,391 @@ class Fuzzer(object):
         with open(crash_path, 'wb') as f:
             f.write(buf)
 
-    def start(self):
-        logging.info("#0 READ units: {}".format(self._corpus.length))
+    def _start_worker(self):
+        if self._in_process:
+            # There's no worker: we run the target ourselves, and only trace it while it runs.
+            # Between batches, the coverage goes to a scratch map, so that any code of ours
+            # which is traced cannot add to the coverage of the inputs.
+            self._maps = [bytearray(bitmap.MAP_SIZE) for _ in range(MAP_COUNT)]
+            self._scratch_map = bytearray(bitmap.MAP_SIZE)
+            tracer.use_map(self._scratch_map)
+            start_coverage(self._trace_include, self._trace_exclude, self._instrument_modules, self._trace_cmp)
+            tracer.pause()
+            self._run = make_runner(self._target, self._timeout, self._rss_limit_mb, self._malloc_limit_mb)
+            return
 
-        parent_conn, child_conn = mp.Pipe()
-        self._p = mp.Process(target=worker, args=(self._target, child_conn, self._close_fd_mask))
+        self._parent_conn, child_conn = mp.Pipe()
+        if self._maps is None:
+            self._progress = mp.RawValue('i', 0)
+            self._watchdog = Watchdog(self._progress, self._timeout)
+            self._shared_maps = mp.RawArray('B', bitmap.MAP_SIZE * MAP_COUNT)
+            self._maps = coverage_maps(self._shared_maps)
+        self._p = mp.Process(target=worker, args=(self._target, child_conn, self._progress, self._shared_maps,
+                                                  self._close_fd_mask, self._timeout, self._rss_limit_mb,
+                                                  self._malloc_limit_mb, self._trace_include, self._trace_exclude,
+                                                  self._instrument_modules, self._trace_cmp, self._fork_server))
+        # The worker must not outlive us, whichever way we exit.
+        self._p.daemon = True
         self._p.start()
+        self._replace_worker = False
 
-        while True:
-            if self.runs != -1 and self._total_executions >= self.runs:
-                self._p.terminate()
-                logging.info('did %d runs, stopping now.', self.runs)
-                break
-
-            buf = self._corpus.generate_input()
-            parent_conn.send_bytes(bytes(buf))
-            if not parent_conn.poll(self._timeout):
-                self._p.terminate()
-                logging.info("=================================================================")
-                logging.info("timeout reached. testcase took: {}".format(self._timeout))
-                self.write_sample(buf, prefix='timeout-')
-                break
-
+    def _stop_worker(self, kill=False):
+        """
+        Stop the worker, along with any child it has forked.
+        """
+        if self._in_process:
+            tracer.uninstall()
+            return
+        try:
+            children = psutil.Process(self._p.pid).children(recursive=True)
+        except psutil.Error:
+            children = []
+        for child in children:
             try:
-                total_coverage = int(parent_conn.recv_bytes())
-            except ValueError:
-                self.write_sample(buf)
-                break
+                child.kill()
+            except psutil.Error:
+                pass
+        if kill:
+            self._p.kill()
+        else:
+            self._p.terminate()
+        self._p.join()
+        self._replace_worker = True
+
+    def _restart_worker(self):
+        """
+        Replace a worker which has stopped or been killed. The corpus and the coverage seen
+        so far are ours, so nothing is lost.
+        """
+        if self._in_process:
+            # Whatever the target did is left behind; that is the price of running in-process.
+            self._replace_worker = False
+            return
+        self._p.join()
+        self._parent_conn.close()
+        self._start_worker()
+
+    def _generate_batch(self, in_flight=0):
+        """
+        @param in_flight:   number of inputs sent to the worker but not yet counted
+        @return: tuple of (list of the inputs to run next, list of the Origin of each one);
+                 empty once the runs requested are done
+        """
+        size = self._batch_size
+        if self.runs != -1:
+            size = min(size, self.runs - self._total_executions - in_flight)
+        batch = self._imports[:size]
+        del self._imports[:size]
+        origins = [Origin(None, [])] * len(batch)
+        while len(batch) < size:
+            batch.append(self._corpus.generate_input())
+            origins.append(Origin(self._corpus.last_seed, self._corpus.last_mutators))
+            self._mutator_stats.used(self._corpus.last_mutators)
+        return batch, origins
 
+    def _update_batch_size(self, batch, elapsed):
+        """
+        Choose the size of the next batch from the time this one took.
+        """
+        target_time = min(BATCH_TIME, self._timeout / 10.0)
+        per_input = elapsed / len(batch)
+        if per_input <= 0:
+            self._batch_size = MAX_BATCH_SIZE
+        else:
+            self._batch_size = max(1, min(MAX_BATCH_SIZE, int(target_time / per_input)))
+
+    def _send_batch(self, batch):
+        """
+        Send a batch to the worker, using the set of coverage maps the last batch didn't.
+
+        @return: list of the coverage maps for the batch
+        """
+        self._first_map = MAX_BATCH_SIZE - self._first_map
+        self._sent_at = timer()
+        maps = self._maps[self._first_map:self._first_map + len(batch)]
+        if self._in_process:
+            self._reply = self._run_in_process(batch, maps)
+        else:
+            self._parent_conn.send_bytes(protocol.pack_batch(batch, self._first_map))
+        return maps
+
+    def _run_in_process(self, batch, maps):
+        """
+        Run a batch of inputs in this process.
+
+        @return: protocol.Reply
+        """
+        stdout, stderr = sys.stdout, sys.stderr
+        if self._close_fd_mask & 1:
+            sys.stdout = DummyFile()
+        if self._close_fd_mask & 2:
+            sys.stderr = DummyFile()
+        tracer.resume()
+        try:
+            return run_batch(self._run, batch, maps)
+        finally:
+            tracer.pause()
+            tracer.use_map(self._scratch_map)
+            sys.stdout, sys.stderr = stdout, stderr
+
+    def _receive_reply(self, batch, maps, origins, ready):
+        """
+        Collect the results of the batch the worker is running.
+
+        @param ready:   True if the reply has arrived, False if the worker is stuck
+        @return: protocol.Reply, or None if the worker had to be killed or died; the inputs
+                 it did run have been dealt with
+        """
+        if not ready:
+            self._handle_hang(batch, maps, origins)
+            return None
+
+        if self._in_process:
+            reply, self._reply = self._reply, None
+            self._update_batch_size(batch, timer() - self._sent_at)
+            return reply
+
+        try:
+            reply = protocol.unpack_reply(self._parent_conn.recv_bytes())
+        except EOFError:
+            # The worker exited without reporting; something stronger than an exception
+            # (eg os._exit or a fatal signal) stopped it.
+            self._p.join()
+            self._replace_worker = True
+            index = min(self._progress.value, len(batch) - 1)
+            reason = 'worker exited with code {}'.format(self._p.exitcode)
+            logging.info("=================================================================")
+            logging.info(reason)
+            completed = [protocol.Result(protocol.STATUS_OK, 0, self._worker_rss)] * index
+            completed.append(protocol.Result(protocol.STATUS_CRASH, 0, self._worker_rss))
+            self._handle_reply(batch[:index + 1], protocol.Reply(completed, None, reason, []), maps, origins)
+            return None
+
+        self._update_batch_size(batch, timer() - self._sent_at)
+        return reply
+
+    def _handle_hang(self, batch, maps, origins):
+        """
+        Deal with a worker that is stuck on an input, and has to be killed.
+        """
+        index = min(self._progress.value, len(batch) - 1)
+        # The inputs before the one that timed out completed normally, and their coverage
+        # is already in the maps.
+        completed = [protocol.Result(protocol.STATUS_OK, 0, self._worker_rss)] * index
+        self._handle_reply(batch[:index], protocol.Reply(completed, None, None, []), maps, origins)
+
+        self._stop_worker()
+        self._total_executions += 1
+        self._timeouts += 1
+        if self._peer:
+            self._peer.failure('timeout', batch[index], None, None)
+        logging.info("=================================================================")
+        logging.info("timeout reached. testcase took: {}".format(self._timeout))
+        self.write_sample(batch[index], prefix='timeout-')
+
+    def _handle_failure(self, buf, status, error, signature):
+        """
+        Record an input which made the target fail or time out; each distinct failure is
+        only written once.
+        """
+        if status == protocol.STATUS_OOM:
+            # Every input that runs out of memory is kept; there's no stack to tell them apart.
+            self._ooms += 1
+            if self._in_process:
+                # Our own peak RSS can only go up, so every input from now on would be an OOM.
+                self._stop_requested = True
+            elif not self._fork_server:
+                self._replace_worker = True
+            if self._peer:
+                self._peer.failure('oom', buf, error, None)
+            logging.info(error)
+            self.write_sample(buf)
+            return
+        if status == protocol.STATUS_TIMEOUT:
+            self._timeouts += 1
+            kind, prefix, seen = 'timeout', 'timeout-', self._timeout_signatures
+        else:
+            self._crashes += 1
+            kind, prefix, seen = 'crash', 'crash-', self._crash_signatures
+            if not self._fork_server:
+                # The worker stops after a crash; a fork server's child has taken the
+                # damage instead.
+                self._replace_worker = True
+        if signature in seen:
+            logging.info('duplicate {}: {}'.format(kind, signature))
+            return
+        seen.add(signature)
+        if self._peer:
+            self._peer.failure(kind, buf, error, signature)
+        if status == protocol.STATUS_TIMEOUT:
+            logging.info("=================================================================")
+            logging.info("timeout reached. testcase took: {}".format(self._timeout))
+        if error:
+            logging.info(error)
+        self.write_sample(buf, prefix)
+
+    def _record_slow_unit(self, buf, exec_time):
+        """
+        Keep track of an input which is one of the slowest so far, and write it out if it
+        took too long.
+        """
+        digest = hashlib.sha256(buf).hexdigest()
+        if any(seen == digest for _, seen in self._slow_units):
+            return
+        if len(self._slow_units) < stats.SLOWEST:
+            heapq.heappush(self._slow_units, (exec_time, digest))
+        else:
+            heapq.heapreplace(self._slow_units, (exec_time, digest))
+        if self._report_slow_units and exec_time >= self._report_slow_units * 1000000:
+            logging.info('slow unit: {:.3f} s'.format(exec_time / 1000000.0))
+            self.write_sample(buf, prefix='slow-unit-', exact=False)
+
+    def _handle_reply(self, batch, reply, maps, origins):
+        """
+        Process the results for a batch.
+
+        @param maps:        list of the coverage maps for the batch
+        @param origins:     list of the Origin of each input in the batch
+        @return: True to carry on, False if an input failed
+        """
+        for token in reply.tokens:
+            self._corpus.add_token(token)
+
+        for buf, result, coverage_map, origin in zip(batch, reply.results, maps, origins):
+            self._exec_time.add(result.exec_time)
             self._total_executions += 1
             self._executions_in_sample += 1
-            rss = 0
-            if total_coverage > self._total_coverage:
-                self._total_coverage = total_coverage
-                self._corpus.put(buf)
-                rss = self.log_stats("NEW")
+            self._worker_rss = result.rss
+            if result.status != protocol.STATUS_OK:
+                self._handle_failure(buf, result.status, reply.error, reply.signature)
+                return False
+            if len(self._slow_units) < stats.SLOWEST or result.exec_time > self._slow_units[0][0]:
+                self._record_slow_unit(buf, result.exec_time)
+
+            if self._corpus.ran(buf, coverage_map, origin.seed, result.exec_time):
+                self.log_stats('REDUCE')
+            new_bits = self._virgin.merge(coverage_map)
+            if new_bits:
+                self._total_coverage = self._virgin.count
+                self._corpus.put(buf, exec_time=result.exec_time, coverage_map=coverage_map)
+                self._corpus.found(origin.seed)
+                self._mutator_stats.found(origin.mutators)
+                if self._peer:
+                    self._peer.publish(buf)
+                if self._sync:
+                    self._sync.push(buf, bitmap.signature(coverage_map))
+                self.log_stats("NEW")
             else:
                 if (time.time() - self._last_sample_time) > SAMPLING_WINDOW:
-                    rss = self.log_stats('PULSE')
+                    self.log_stats('PULSE')
+        return True
 
-            if rss > self._rss_limit_mb:
-                logging.info('MEMORY OOM: exceeded {} MB. Killing worker'.format(self._rss_limit_mb))
-                self.write_sample(buf)
-                self._p.kill()
-                break
+    def stop(self):
+        """
+        Ask the fuzzer to stop once the batch the worker is running has finished.
+        """
+        self._stop_requested = True
 
-        self._p.join()
+    def close(self):
+        """
+        Stop the worker, if it is still running; for whatever drives steps() to call if it
+        gives up before the end.
+        """
+        if not self._in_process and self._p is not None and self._p.is_alive():
+            self._stop_worker()
+
+    def steps(self):
+        """
+        The fuzzing loop, as a generator, so that it can be driven either by start(), which
+        blocks, or by an event loop (see asyncfuzzer). It yields whenever it would block:
+        a Wait while the worker runs a batch, or a Call to be made, which the driver may make
+        on another thread. Each must be answered with send(), as described under Wait and Call.
+        """
+        logging.info("#0 READ units: {}".format(self._corpus.length))
+
+        if self._in_process:
+            # The tracer has to be installed by the thread which runs the target.
+            self._start_worker()
+        else:
+            yield Call(self._start_worker)
+
+        batch, origins = self._generate_batch()
+        maps = self._send_batch(batch) if batch else None
+        while batch and not self._stop_requested:
+            if self._peer:
+                # Inputs found by other jobs are already in the shared coverage map, so
+                # they go straight into the corpus.
+                for buf in self._peer.collect():
+                    self._corpus.put(buf, save=False)
+            if self._sync:
+                # Inputs from other nodes are run first, to see whether they are new to us.
+                self._imports.extend(self._sync.pull())
+
+            # Mutate the next batch while the worker runs this one. It misses out on
+            # anything this batch adds to the corpus, but the worker is never kept waiting.
+            next_batch, next_origins = self._generate_batch(in_flight=len(batch))
+            next_maps = None
+
+            # The batch has already run if we run it ourselves.
+            ready = True
+            if not self._in_process:
+                self._watchdog.reset()
+                while not (yield Wait(self._parent_conn, self._watchdog.interval)):
+                    if self._watchdog.stuck():
+                        ready = False
+                        break
+            reply = self._receive_reply(batch, maps, origins, ready)
+            if reply is not None and next_batch and \
+                    all(result.status == protocol.STATUS_OK for result in reply.results):
+                # Likewise, the worker can start on the next batch while we read the
+                # coverage of this one, as the two use different maps.
+                next_maps = self._send_batch(next_batch)
+
+            if reply is None or not self._handle_reply(batch, reply, maps, origins):
+                if not self._keep_going:
+                    break
+                if self._replace_worker:
+                    if self._in_process:
+                        self._restart_worker()
+                    else:
+                        yield Call(self._restart_worker)
+
+            if not next_batch:
+                # Any inputs skipped after a failure still need to be run.
+                next_batch, next_origins = self._generate_batch()
+            if next_batch and next_maps is None:
+                next_maps = self._send_batch(next_batch)
+            batch, maps, origins = next_batch, next_maps, next_origins
+
+        self.log_stats('DONE')
+        if self._in_process:
+            self._finish(batch)
+        else:
+            yield Call(functools.partial(self._finish, batch))
+
+    def _finish(self, batch):
+        """
+        @param batch:   the batch which was to run next; empty if the runs requested are done
+        """
+        if self._sync:
+            self._sync.finish()
+        if not batch:
+            self._stop_worker()
+            logging.info('did %d runs, stopping now.', self.runs)
+        elif self._replace_worker and not self._in_process:
+            self._p.join()
+        else:
+            # The worker is still waiting for its next batch.
+            self._stop_worker()
+
+    def start(self):
+        steps = self.steps()
+        try:
+            request = next(steps)
+            while True:
+                if isinstance(request, Wait):
+                    request = steps.send(request.conn.poll(request.timeout))
+                else:
+                    request = steps.send(request.func())
+        except StopIteration:
+            pass
@@ -0,0 +1,209 @@
+"""
+Import-time instrumentation of the target's modules.
+
+Rather than tracing every line at runtime, the modules named by the user are rewritten as
+they are imported: a call to `tracer.hit` is inserted at the start of every block (function
+bodies, both arms of each `if`, loop bodies, exception handlers, ...) and after every
+compound statement, so that the coverage map is updated directly at the branch points.
+Code which is not instrumented costs nothing at all.
+
+Only pure Python modules, loaded from source, can be instrumented. This requires Python 3.
+"""
+
+import ast
+import importlib
+import importlib.abc
+import importlib.machinery
+import sys
+import zlib
+
+from pythonfuzz import bitmap, tracer
+
+# The names the hit and comparison functions are given in the instrumented modules' globals.
+# Names with trailing double underscores are not mangled in class bodies.
+HIT_NAME = '__pythonfuzz_hit__'
+COMPARE_NAME = '__pythonfuzz_cmp__'
+
+_LOC_MULTIPLIER = 0x9e3779b1
+
+# Statements after which control flow joins again.
+_COMPOUND_STATEMENTS = tuple(getattr(ast, name) for name in ('If', 'For', 'AsyncFor', 'While', 'Try',
+                                                             'TryStar', 'With', 'AsyncWith', 'Match')
+                             if hasattr(ast, name))
+
+
+# Comparisons, and methods which compare their argument with the object, whose operands we
+# record when tracing comparisons.
+_COMPARE_OPS = (ast.Eq, ast.NotEq, ast.In, ast.NotIn)
+_COMPARE_METHODS = ('startswith', 'endswith', 'find', 'rfind', 'index', 'rindex')
+
+
+def _constant(value):
+    # ast.Constant is only present in Python 3.6 and later.
+    if hasattr(ast, 'Constant'):
+        return ast.Constant(value=value)
+    return ast.Num(n=value)
+
+
+def _compare_call(node):
+    call = ast.Call(func=ast.Name(id=COMPARE_NAME, ctx=ast.Load()), args=[node], keywords=[])
+    return ast.copy_location(call, node)
+
+
+def _is_docstring(node):
+    if not isinstance(node, ast.Expr):
+        return False
+    value = node.value
+    if isinstance(value, getattr(ast, 'Constant', ())):
+        return isinstance(value.value, str)
+    return isinstance(value, getattr(ast, 'Str', ()))
+
+
+def _is_future_import(node):
+    return isinstance(node, ast.ImportFrom) and node.module == '__future__'
+
+
+class CoverageTransformer(ast.NodeTransformer):
+    """
+    Insert calls to the hit function at the start of each block of a module.
+    """
+
+    def __init__(self, filename, trace_cmp=False):
+        self.base = zlib.crc32(filename.encode('utf-8', 'replace')) & 0xffffffff
+        self.sites = 0
+        self.trace_cmp = trace_cmp
+
+    def _hit(self, node):
+        loc = (self.base + self.sites * _LOC_MULTIPLIER) & bitmap.MAP_MASK
+        self.sites += 1
+        call = ast.Expr(value=ast.Call(func=ast.Name(id=HIT_NAME, ctx=ast.Load()),
+                                       args=[_constant(loc)],
+                                       keywords=[]))
+        return ast.copy_location(call, node)
+
+    def _instrument_body(self, body, skip=0):
+        new_body = body[:skip]
+        rest = body[skip:]
+        if not rest:
+            return body
+        new_body.append(self._hit(rest[0]))
+        for index, stmt in enumerate(rest):
+            new_body.append(stmt)
+            if isinstance(stmt, _COMPOUND_STATEMENTS) and index + 1 < len(rest):
+                new_body.append(self._hit(rest[index + 1]))
+        return new_body
+
+    def visit_Compare(self, node):
+        node = self.generic_visit(node)
+        if self.trace_cmp and all(isinstance(op, _COMPARE_OPS) for op in node.ops):
+            node.left = _compare_call(node.left)
+            node.comparators = [_compare_call(comparator) for comparator in node.comparators]
+        return node
+
+    def visit_Call(self, node):
+        node = self.generic_visit(node)
+        if self.trace_cmp and isinstance(node.func, ast.Attribute) and node.func.attr in _COMPARE_METHODS \
+                and node.args and not isinstance(node.args[0], ast.Starred):
+            node.args[0] = _compare_call(node.args[0])
+        return node
+
+    def generic_visit(self, node):
+        node = super(CoverageTransformer, self).generic_visit(node)
+        fields = ('body', 'orelse', 'finalbody')
+        if isinstance(node, ast.If) and not node.orelse:
+            # Give the 'not taken' side of the branch a block of its own.
+            node.orelse = [self._hit(node)]
+            fields = ('body',)
+        for field in fields:
+            body = getattr(node, field, None)
+            if not isinstance(body, list) or not body or not isinstance(body[0], ast.stmt):
+                continue
+            skip = 0
+            if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)) \
+                    and field == 'body' and _is_docstring(body[0]):
+                skip = 1
+            if isinstance(node, ast.Module):
+                while skip < len(body) and _is_future_import(body[skip]):
+                    skip += 1
+            setattr(node, field, self._instrument_body(body, skip))
+        return node
+
+
+def instrument_source(source, filename, trace_cmp=False):
+    """
+    Compile source code with coverage instrumentation.
+
+    @param trace_cmp:   whether to record the operands of comparisons
+    @return: the instrumented code object
+    """
+    tree = ast.parse(source, filename)
+    tree = CoverageTransformer(filename, trace_cmp).visit(tree)
+    ast.fix_missing_locations(tree)
+    return compile(tree, filename, 'exec', dont_inherit=True)
+
+
+class InstrumentingLoader(importlib.machinery.SourceFileLoader):
+    """
+    Loader which instruments the module's source as it is compiled.
+    """
+    trace_cmp = False
+
+    def get_code(self, fullname):
+        # Always compile from the source; the bytecode cache holds the uninstrumented code.
+        path = self.get_filename(fullname)
+        return instrument_source(self.get_data(path), path, self.trace_cmp)
+
+    def exec_module(self, module):
+        module.__dict__[HIT_NAME] = tracer.hit
+        module.__dict__[COMPARE_NAME] = tracer.compare_operand
+        super(InstrumentingLoader, self).exec_module(module)
+
+
+class InstrumentingFinder(importlib.abc.MetaPathFinder):
+    """
+    Finder which hands the modules we want to instrument (and their submodules) to the
+    InstrumentingLoader.
+    """
+
+    def __init__(self, modules, trace_cmp=False):
+        self.modules = list(modules)
+        self.trace_cmp = trace_cmp
+
+    def wanted(self, fullname):
+        for name in self.modules:
+            if fullname == name or fullname.startswith(name + '.'):
+                return True
+        return False
+
+    def find_spec(self, fullname, path, target=None):
+        if not self.wanted(fullname):
+            return None
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is None or type(spec.loader) is not importlib.machinery.SourceFileLoader:
+            # Extension modules and the like are left to the normal import machinery.
+            return None
+        spec.loader = InstrumentingLoader(spec.loader.name, spec.loader.path)
+        spec.loader.trace_cmp = self.trace_cmp
+        return spec
+
+
+def install(modules, trace_cmp=False):
+    """
+    Instrument the named modules, and their submodules.
+
+    If trace_cmp is set, the operands of the modules' comparisons are recorded as well.
+
+    Modules which have already been imported (usually by the fuzz harness itself) are
+    reloaded, so that the instrumentation takes effect. Objects the harness imported
+    from them directly (`from module import name`) remain uninstrumented.
+
+    @return: the finder that was installed
+    """
+    finder = InstrumentingFinder(modules, trace_cmp)
+    sys.meta_path.insert(0, finder)
+    # Sorting means packages are reloaded before their submodules.
+    for name in sorted(sys.modules):
+        module = sys.modules[name]
+        if module is not None and finder.wanted(name):
+            importlib.reload(module)
+    return finder
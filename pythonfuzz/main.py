@@ -1,5 +1,7 @@
 import argparse
-from pythonfuzz import fuzzer
+import os
+import sys
+from pythonfuzz import fuzzer, merge, minimize, parallel, schedule
 
 
 class PythonFuzz(object):
@@ -16,24 +18,98 @@ class PythonFuzz(object):
                             default=False,
                             help='run the fuzzer through set of files for regression or reproduction')
         parser.add_argument('--rss-limit-mb', type=int, default=2048, help='Memory usage in MB')
+        parser.add_argument('--malloc-limit-mb', type=int, default=0,
+                            help='Limit on the memory Python allocates for a single input, in MB; 0 (the default) for none. '
+                                 'Uses tracemalloc, which slows the target down considerably')
         parser.add_argument('--max-input-size', type=int, default=4096, help='Max input size in bytes')
         parser.add_argument('--dict', type=str, help='dictionary file')
         parser.add_argument('--close-fd-mask', type=int, default=0, help='Indicate output streams to close at startup')
         parser.add_argument('--runs', type=int, default=-1, help='Number of individual test runs, -1 (the default) to run indefinitely.')
         parser.add_argument('--help-mutators', action='store_true', help='Display help on the mutators')
         parser.add_argument('--mutator-filter', type=str, default=None, help='Filter for mutator types to use; prefix with ! to disable')
-        parser.add_argument('--timeout', type=int, default=30,
-                            help='If input takes longer then this timeout the process is treated as failure case')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='If input takes longer then this timeout (in seconds, fractions allowed) the process is treated as failure case')
+        parser.add_argument('--trace-include', type=str, action='append', default=None, metavar='GLOB',
+                            help="Only trace source files matching this glob, less those excluded (may be repeated; 'stdlib' matches the standard library)")
+        parser.add_argument('--trace-exclude', type=str, action='append', default=None, metavar='GLOB',
+                            help="Do not trace source files matching this glob (may be repeated; 'stdlib' matches the standard library)")
+        parser.add_argument('--instrument', type=str, default=None, metavar='MODULE[,MODULE...]',
+                            help='Instrument these modules (and their submodules) as they are imported, instead of tracing')
+        parser.add_argument('--trace-cmp', action='store_true',
+                            help='Collect the operands of comparisons made by the target, for use as dictionary words')
+        parser.add_argument('--schedule', type=str, default='entropic', choices=sorted(schedule.schedule_classes),
+                            help='Power schedule, deciding how often each input in the corpus is picked for mutation')
+        parser.add_argument('--keep-going', action='store_true',
+                            help='Carry on fuzzing after a crash, timeout or OOM, writing each distinct crash once')
+        parser.add_argument('--fork-server', action='store_true',
+                            help='Run each input in a child forked from a warmed-up worker, so that no state leaks between inputs')
+        parser.add_argument('--in-process', action='store_true',
+                            help='Run the target in the fuzzer process itself, rather than in a worker process, with '
+                                 'no IPC; for small, side-effect free targets. A crash in C code or a hang which '
+                                 'cannot be interrupted takes the fuzzer with it. No faster than the batched worker; '
+                                 'not with --workers')
+        parser.add_argument('--merge', action='store_true',
+                            help='Merge the inputs in the second and later dirs into the first, adding only those '
+                                 'needed to keep their coverage, then exit')
+        parser.add_argument('--merge-control-file', type=str, default=None,
+                            help='File to record the progress of --merge in, so that an interrupted merge can be '
+                                 'resumed (default: <first dir>.merge, removed once the merge is done)')
+        parser.add_argument('--minimize-crash', type=str, default=None, metavar='FILE',
+                            help='Make this crashing input as small and simple as it can be while it still crashes '
+                                 'the same way, writing it to minimized-from-<sha256>, then exit')
+        parser.add_argument('--workers', '--jobs', type=int, default=1,
+                            help='Number of fuzzing jobs to run in parallel, sharing their corpus and coverage')
+        parser.add_argument('--sync', type=str, default=None, metavar='HOST:PORT',
+                            help='Share the corpus with other machines through this pythonfuzz-sync server')
+        parser.add_argument('--report-slow-units', type=float, default=10,
+                            help='Write out inputs which take longer than this many seconds to run as slow-unit-<sha256>; '
+                                 '0 to never write them')
+        parser.add_argument('--stats-file', type=str, default=None,
+                            help='Append the fuzzing statistics to this file every few seconds, as lines of JSON')
+        parser.add_argument('--prometheus-file', type=str, default=None,
+                            help='Keep the fuzzing statistics in this file, in the Prometheus text format '
+                                 '(eg for the node exporter textfile collector)')
         args = parser.parse_args()
-        f = fuzzer.Fuzzer(self.function, args.dirs, args.exact_artifact_path,
-                          args.rss_limit_mb, args.timeout, args.regression, args.max_input_size,
-                          args.close_fd_mask, args.runs, args.mutator_filter, args.dict)
+        if args.fork_server and not hasattr(os, 'fork'):
+            parser.error('--fork-server needs os.fork, which this platform does not have')
+        if args.instrument and sys.version_info[0] < 3:
+            parser.error('--instrument needs Python 3')
+        if args.fork_server and args.in_process:
+            parser.error('--fork-server and --in-process cannot be used together')
+        if args.in_process and args.workers > 1:
+            parser.error('--in-process and --workers cannot be used together')
+        if args.merge and len(args.dirs) < 2:
+            parser.error('--merge needs an output dir and at least one input dir')
+        fuzzer_kwargs = dict(dirs=args.dirs, exact_artifact_path=args.exact_artifact_path,
+                             rss_limit_mb=args.rss_limit_mb, timeout=args.timeout, regression=args.regression,
+                             max_input_size=args.max_input_size, close_fd_mask=args.close_fd_mask,
+                             runs=args.runs, mutators_filter=args.mutator_filter, dict_path=args.dict,
+                             trace_include=args.trace_include, trace_exclude=args.trace_exclude,
+                             instrument_modules=args.instrument.split(',') if args.instrument else None,
+                             trace_cmp=args.trace_cmp, keep_going=args.keep_going,
+                             fork_server=args.fork_server, malloc_limit_mb=args.malloc_limit_mb,
+                             sync_address=args.sync, stats_file=args.stats_file,
+                             prometheus_file=args.prometheus_file, report_slow_units=args.report_slow_units,
+                             in_process=args.in_process, schedule=args.schedule)
 
-        if args.help_mutators:
-            f.help_mutators()
+        if args.minimize_crash:
+            minimize.Minimizer(self.function, args.minimize_crash, jobs=args.workers, timeout=args.timeout,
+                               rss_limit_mb=args.rss_limit_mb, malloc_limit_mb=args.malloc_limit_mb,
+                               close_fd_mask=args.close_fd_mask, exact_artifact_path=args.exact_artifact_path,
+                               trace_include=args.trace_include, trace_exclude=args.trace_exclude,
+                               instrument_modules=fuzzer_kwargs['instrument_modules']).start()
+        elif args.merge:
+            merge.Merger(self.function, args.dirs[0], args.dirs[1:], jobs=args.workers,
+                         control_file=args.merge_control_file, timeout=args.timeout, rss_limit_mb=args.rss_limit_mb,
+                         malloc_limit_mb=args.malloc_limit_mb, close_fd_mask=args.close_fd_mask,
+                         trace_include=args.trace_include, trace_exclude=args.trace_exclude,
+                         instrument_modules=fuzzer_kwargs['instrument_modules']).start()
+        elif args.help_mutators:
+            fuzzer.Fuzzer(self.function, **fuzzer_kwargs).help_mutators()
+        elif args.workers > 1:
+            parallel.ParallelFuzzer(args.workers, self.function, **fuzzer_kwargs).start()
         else:
-            f.start()
-
+            fuzzer.Fuzzer(self.function, **fuzzer_kwargs).start()
 
 if __name__ == '__main__':
     PythonFuzz()
@@ -0,0 +1,88 @@
+"""
+Cheap measurement of the memory used by the worker, checked after every input.
+
+The peak resident set size comes from getrusage, a single system call, so it costs next to
+nothing per input. Python allocations can also be counted with tracemalloc, which is much
+more expensive (it slows down every allocation), so it is only used when asked for.
+"""
+
+import sys
+
+import psutil
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+
+if resource is not None:
+    # ru_maxrss is in KB, except on macOS where it is in bytes.
+    _maxrss_scale = 1024 if sys.platform == 'darwin' else 1
+
+    def peak_rss():
+        """
+        @return: the largest resident set size this process has had, in KB
+        """
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // _maxrss_scale
+
+else:
+    def peak_rss():
+        """
+        @return: the resident set size of this process, in KB; without getrusage, the peak
+                 is not available
+        """
+        return psutil.Process().memory_info().rss // 1024
+
+
+class MemoryLimit(object):
+    """
+    Check the memory used by each input against the limits.
+    """
+
+    def __init__(self, rss_limit_mb=0, malloc_limit_mb=0):
+        """
+        @param rss_limit_mb:    limit for the peak RSS of the process, in MB; 0 for none
+        @param malloc_limit_mb: limit for the memory allocated by Python while running one
+                                input, in MB; 0 for none
+        """
+        self._rss_limit_mb = rss_limit_mb
+        self._malloc_limit_mb = malloc_limit_mb
+        if malloc_limit_mb:
+            if tracemalloc is None:
+                raise ValueError('a malloc limit needs tracemalloc (Python 3.4+)')
+            tracemalloc.start()
+            # reset_peak is only present in Python 3.9 and later; clearing the traces also
+            # resets the peak, but forgets about the blocks which are still allocated.
+            self._reset_peak = getattr(tracemalloc, 'reset_peak', tracemalloc.clear_traces)
+
+    def start(self):
+        """
+        Note the start of an input.
+        """
+        if self._malloc_limit_mb:
+            self._reset_peak()
+
+    def check(self):
+        """
+        Check the memory used by the input which has just run.
+
+        @return: tuple of (peak RSS in KB, text describing the limit exceeded or None)
+        """
+        rss = peak_rss()
+        if self._rss_limit_mb and rss > self._rss_limit_mb * 1024:
+            return rss, 'MEMORY OOM: peak RSS {} MB exceeded the limit of {} MB'.format(
+                rss // 1024, self._rss_limit_mb)
+        if self._malloc_limit_mb:
+            allocated = tracemalloc.get_traced_memory()[1]
+            if allocated > self._malloc_limit_mb * 1024 * 1024:
+                return rss, 'MALLOC LIMIT: input allocated {} MB, exceeding the limit of {} MB'.format(
+                    allocated // (1024 * 1024), self._malloc_limit_mb)
+        return rss, None
@@ -0,0 +1,247 @@
+"""
+Merging corpora into a small corpus with the same coverage, as libFuzzer's -merge=1 does.
+
+    python fuzz.py --merge OUT_DIR IN_DIR [IN_DIR ...]
+
+Every input in the directories is run by one of a number of worker processes (the same
+workers the fuzzer uses), and the coverage of each is recorded as its set of features: the
+(edge, hit count bucket) bits of its bucketed coverage map. The inputs already in OUT_DIR are
+all kept, and the features they have are counted as covered. Then, of the other inputs, the
+one adding the most features not yet covered is chosen, again and again until no input adds
+any; ties go to the smaller input, then to the faster. The inputs chosen are written to
+OUT_DIR. Inputs which crash, time out or run out of memory are left out.
+
+As each batch of inputs is run, their features are appended to a control file, so that a
+merge which is interrupted carries on from where it stopped when it is run again. The file
+is made of JSON lines: the first lists the inputs,
+
+    {"inputs": [path, ...], "existing": number of them which were in OUT_DIR}
+
+and each line after it records one input which has been run:
+
+    {"index": 12, "status": 0, "exec_time": 153, "size": 80, "features": [3, 1027, ...]}
+
+where status is one of the protocol.STATUS_* values and exec_time is in microseconds.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import os
+import time
+
+from pythonfuzz import bitmap, fuzzer, protocol
+
+# Inputs sent to a worker at a time; the control file is written after each batch.
+BATCH_SIZE = 32
+
+
+def choose(candidates, covered=0):
+    """
+    Greedily choose inputs which between them have all the features of the candidates.
+
+    @param candidates:  list of (size, exec_time, features as an integer) for each input
+    @param covered:     the features which are covered already
+    @return: list of the indices of the candidates chosen, in the order they were chosen
+    """
+    # The number of new features an input adds can only go down as others are chosen, so
+    # each is only counted again when it reaches the top of the heap.
+    heap = []
+    for index, (size, exec_time, bits) in enumerate(candidates):
+        gain = bitmap.popcount(bits & ~covered)
+        if gain:
+            heap.append((-gain, size, exec_time, index))
+    heapq.heapify(heap)
+    chosen = []
+    while heap:
+        gain, size, exec_time, index = heapq.heappop(heap)
+        bits = candidates[index][2]
+        new_gain = bitmap.popcount(bits & ~covered)
+        if new_gain == -gain:
+            chosen.append(index)
+            covered |= bits
+        elif new_gain:
+            heapq.heappush(heap, (-new_gain, size, exec_time, index))
+    return chosen
+
+
+def list_inputs(path):
+    """
+    @param path:    a file, or a directory of files (as for the corpus)
+    @return: sorted list of the paths of the inputs
+    """
+    if os.path.isfile(path):
+        return [path]
+    if not os.path.isdir(path):
+        return []
+    paths = (os.path.join(path, name) for name in os.listdir(path))
+    return sorted(name for name in paths if os.path.isfile(name))
+
+
+class Merger(object):
+    def __init__(self, target, out_dir, in_dirs, jobs=1, control_file=None, timeout=30, rss_limit_mb=2048,
+                 malloc_limit_mb=0, close_fd_mask=0, trace_include=None, trace_exclude=None,
+                 instrument_modules=None):
+        """
+        @param out_dir:         directory to merge the inputs into
+        @param in_dirs:         list of the directories (or files) of inputs to merge
+        @param jobs:            the number of worker processes to run the inputs in
+        @param control_file:    file to record the progress of the merge in, so that it can be
+                                resumed; by default, OUT_DIR.merge, which is removed once the
+                                merge is done
+        """
+        self._target = target
+        self._out_dir = out_dir
+        self._in_dirs = in_dirs
+        self._jobs = jobs
+        if control_file:
+            self._control_file = control_file
+            self._keep_control_file = True
+        else:
+            self._control_file = out_dir.rstrip('/\\') + '.merge'
+            self._keep_control_file = False
+        self._worker_kwargs = dict(close_fd_mask=close_fd_mask, timeout=timeout, rss_limit_mb=rss_limit_mb,
+                                   malloc_limit_mb=malloc_limit_mb, trace_include=trace_include,
+                                   trace_exclude=trace_exclude, instrument_modules=instrument_modules)
+        self._paths = []
+        # The results for each input run so far: {index: record from the control file}
+        self._results = {}
+        self._failures = 0
+        self._last_log = 0
+
+    def _load_control_file(self):
+        """
+        @return: tuple of (list of the paths of the inputs, number of them in the output
+                 directory), from the control file if there is one
+        """
+        if os.path.exists(self._control_file):
+            with open(self._control_file) as f:
+                content = f.read()
+            if not content.endswith('\n'):
+                # We were stopped while writing the last line; drop it, so that what we add
+                # starts on a line of its own.
+                content = content[:content.rfind('\n') + 1]
+                with open(self._control_file, 'w') as f:
+                    f.write(content)
+            lines = content.splitlines()
+            if lines:
+                header = json.loads(lines[0])
+                for line in lines[1:]:
+                    record = json.loads(line)
+                    self._results[record['index']] = record
+                logging.info('MERGE: resuming from %s, %d of %d inputs already run',
+                             self._control_file, len(self._results), len(header['inputs']))
+                return header['inputs'], header['existing']
+
+        existing = list_inputs(self._out_dir)
+        paths = list(existing)
+        for path in self._in_dirs:
+            paths.extend(list_inputs(path))
+        with open(self._control_file, 'w') as f:
+            f.write(json.dumps({'inputs': paths, 'existing': len(existing)}) + '\n')
+        return paths, len(existing)
+
+    def _record(self, control, index, buf, result, trace_map=None):
+        record = {'index': index, 'status': result.status, 'exec_time': result.exec_time, 'size': len(buf),
+                  'features': bitmap.features(trace_map) if result.status == protocol.STATUS_OK else []}
+        self._results[index] = record
+        if result.status != protocol.STATUS_OK:
+            self._failures += 1
+        control.write(json.dumps(record) + '\n')
+
+    def _next_batch(self, pending):
+        batch = []
+        while pending and len(batch) < BATCH_SIZE:
+            index = pending.pop()
+            try:
+                with open(self._paths[index], 'rb') as f:
+                    batch.append((index, bytearray(f.read())))
+            except (IOError, OSError) as e:
+                logging.info('MERGE: skipping %s: %s', self._paths[index], e)
+        return batch
+
+    def _log_progress(self, total, force=False):
+        now = time.time()
+        if force or now - self._last_log >= fuzzer.SAMPLING_WINDOW:
+            self._last_log = now
+            logging.info('MERGE: ran %d of %d inputs, %d failed', len(self._results), total, self._failures)
+
+    def _run_inputs(self, control):
+        """
+        Run each input which has not been run yet, recording its features.
+        """
+        # Popped from the end, so the inputs run in order.
+        pending = [index for index in range(len(self._paths)) if index not in self._results][::-1]
+        pool = fuzzer.WorkerPool(self._target, self._worker_kwargs, min(self._jobs, max(1, len(pending))))
+        pool.start()
+        try:
+            for done in pool.run(lambda: self._next_batch(pending)):
+                if done.reason:
+                    logging.info('MERGE: %s: %s', self._paths[done.batch[len(done.results) - 1][0]], done.reason)
+                for (index, buf), result, trace_map in zip(done.batch, done.results, done.maps):
+                    # Where the worker was lost, the inputs before the one it was running are
+                    # run again, to time them.
+                    if result is not None:
+                        self._record(control, index, buf, result, trace_map)
+                # The worker stops at a failure; whatever it did not get to runs again.
+                for index, _ in reversed(done.batch):
+                    if index not in self._results:
+                        pending.append(index)
+                control.flush()
+                self._log_progress(len(self._paths))
+        finally:
+            pool.stop()
+
+    def _write_output(self, paths, chosen):
+        """
+        @return: number of inputs written to the output directory
+        """
+        if not os.path.exists(self._out_dir):
+            os.mkdir(self._out_dir)
+        written = 0
+        for index in chosen:
+            with open(paths[index], 'rb') as f:
+                buf = f.read()
+            path = os.path.join(self._out_dir, hashlib.sha256(buf).hexdigest())
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(buf)
+                written += 1
+        return written
+
+    def start(self):
+        """
+        Run the merge.
+
+        @return: list of the paths of the inputs chosen, which have been written to the
+                 output directory
+        """
+        paths, existing = self._load_control_file()
+        self._paths = paths
+        with open(self._control_file, 'a') as control:
+            self._run_inputs(control)
+        self._log_progress(len(paths), force=True)
+
+        covered = 0
+        candidates = []
+        for index in range(len(paths)):
+            record = self._results.get(index)
+            if record is None or record['status'] != protocol.STATUS_OK:
+                bits = 0
+            else:
+                bits = bitmap.from_features(record['features'])
+            if index < existing:
+                covered |= bits
+            else:
+                candidates.append((record['size'] if record else 0, record['exec_time'] if record else 0, bits))
+        before = bitmap.popcount(covered)
+        chosen = [existing + index for index in choose(candidates, covered)]
+        for index in chosen:
+            covered |= candidates[index - existing][2]
+        written = self._write_output(paths, chosen)
+        logging.info('MERGE: %d new inputs with %d new features added; %d features in total',
+                     written, bitmap.popcount(covered) - before, bitmap.popcount(covered))
+        if not self._keep_control_file:
+            os.remove(self._control_file)
+        return [paths[index] for index in chosen]
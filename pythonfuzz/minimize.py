@@ -0,0 +1,162 @@
+"""
+Minimising a crashing input, as libFuzzer's -minimize_crash does.
+
+    python fuzz.py --minimize-crash crash-<sha256>
+
+The input is made smaller by delta debugging: it is cut into chunks, and each candidate
+leaving one chunk out is tried, halving the chunks whenever none of the candidates will do.
+The bytes left are then simplified, each replaced by '0' where that will do. A candidate
+will do if it still crashes the target in the same way: the same exception type, raised
+from the same frames (the crash signature used to tell crashes apart with --keep-going).
+
+The candidates are run in batches in the usual worker processes, several at once with
+--workers. The smallest input found is written to minimized-from-<sha256 of the input>.
+"""
+
+import hashlib
+import logging
+
+from pythonfuzz import fuzzer, protocol
+
+# The most candidates sent to a worker at a time
+BATCH_SIZE = 16
+
+# What bytes are simplified to
+SIMPLE_BYTE = ord('0')
+
+
+class Minimizer(object):
+    def __init__(self, target, path, jobs=1, timeout=30, rss_limit_mb=2048, malloc_limit_mb=0, close_fd_mask=0,
+                 exact_artifact_path=None, trace_include=None, trace_exclude=None, instrument_modules=None):
+        """
+        @param path:                the crashing input to minimise
+        @param jobs:                the number of worker processes to run the candidates in
+        @param exact_artifact_path: file to write the minimised input to, instead of
+                                    minimized-from-<sha256>
+        """
+        self._path = path
+        self._exact_artifact_path = exact_artifact_path
+        worker_kwargs = dict(close_fd_mask=close_fd_mask, timeout=timeout, rss_limit_mb=rss_limit_mb,
+                             malloc_limit_mb=malloc_limit_mb, trace_include=trace_include,
+                             trace_exclude=trace_exclude, instrument_modules=instrument_modules)
+        self._pool = fuzzer.WorkerPool(target, worker_kwargs, jobs)
+        # The signature of the crash; None until the input has been run
+        self._signature = None
+        self.runs = 0
+
+    def _reproduces(self, result, signature):
+        return result.status == protocol.STATUS_CRASH and \
+            (self._signature is None or signature == self._signature)
+
+    def _run(self, candidates):
+        """
+        Run the candidates until one crashes in the same way as the input.
+
+        @param candidates:  list of inputs, the most wanted first
+        @return: tuple of (index of the first candidate found to crash, its signature), or
+                 None if none of them do
+        """
+        found = []
+        # Popped from the end, so the candidates run in order.
+        pending = list(range(len(candidates)))[::-1]
+        batch_size = max(1, min(BATCH_SIZE, -(-len(candidates) // len(self._pool.jobs))))
+
+        def next_batch():
+            # Once one candidate has been found, only those before it are worth running.
+            end = min(found)[0] if found else len(candidates)
+            batch = []
+            while pending and pending[-1] < end and len(batch) < batch_size:
+                index = pending.pop()
+                batch.append((index, candidates[index]))
+            return batch
+
+        for done in self._pool.run(next_batch):
+            ran = len(done.results)
+            self.runs += ran
+            result = done.results[-1] if done.results else None
+            if result and self._reproduces(result, done.signature):
+                found.append((done.batch[ran - 1][0], done.signature))
+            # The worker stops at a failure; whatever it did not get to runs again.
+            pending.extend(index for index, _ in done.batch[ran:])
+            pending.sort(reverse=True)
+        return min(found) if found else None
+
+    def _first(self, candidates):
+        """
+        @return: the first of the candidates found to crash in the same way, or None
+        """
+        found = self._run(candidates)
+        return None if found is None else candidates[found[0]]
+
+    def _remove_chunks(self, buf):
+        """
+        Delta debugging: take out chunks of the input, making the chunks smaller until no
+        more can be taken out.
+        """
+        chunks = 2
+        while buf:
+            size = -(-len(buf) // chunks)
+            smaller = self._first([buf[:start] + buf[start + size:] for start in range(0, len(buf), size)])
+            if smaller is not None:
+                buf = smaller
+                chunks = max(chunks - 1, 2)
+            elif chunks >= len(buf):
+                break
+            else:
+                chunks = min(chunks * 2, len(buf))
+        return buf
+
+    def _simplify(self, buf):
+        """
+        Replace each byte of the input with SIMPLE_BYTE, where it still crashes.
+        """
+        position = 0
+        window = BATCH_SIZE * len(self._pool.jobs)
+        while position < len(buf):
+            positions = [index for index in range(position, min(position + window, len(buf)))
+                         if buf[index] != SIMPLE_BYTE]
+            candidates = []
+            for index in positions:
+                candidate = bytearray(buf)
+                candidate[index] = SIMPLE_BYTE
+                candidates.append(candidate)
+            found = self._run(candidates) if candidates else None
+            if found is None:
+                position += window
+            else:
+                buf = candidates[found[0]]
+                position = positions[found[0]] + 1
+        return buf
+
+    def start(self):
+        """
+        Minimise the input.
+
+        @return: the minimised input, or None if the input does not crash
+        """
+        with open(self._path, 'rb') as f:
+            original = bytearray(f.read())
+        self._pool.start()
+        try:
+            found = self._run([original])
+            if found is None:
+                logging.info('MINIMIZE: %s does not crash the target', self._path)
+                return None
+            self._signature = found[1]
+            logging.info('MINIMIZE: %s crashes with %s; minimizing %d bytes', self._path, self._signature,
+                         len(original))
+            buf = original
+            while True:
+                smaller = self._simplify(self._remove_chunks(buf))
+                if smaller == buf:
+                    break
+                buf = smaller
+        finally:
+            self._pool.stop()
+
+        path = self._exact_artifact_path or 'minimized-from-' + hashlib.sha256(original).hexdigest()
+        with open(path, 'wb') as f:
+            f.write(buf)
+        logging.info('MINIMIZE: %d bytes minimized to %d bytes in %d runs, written to %s', len(original),
+                     len(buf), self.runs, path)
+        return buf
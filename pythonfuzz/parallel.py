@@ -0,0 +1,199 @@
+"""
+Fuzzing with several jobs in parallel.
+
+Each job is a complete Fuzzer, with its own worker process and its own copy of the corpus,
+which it mutates locally. The jobs share a single map of the coverage seen, so an edge found
+by one job is not new to any of the others. Each input which does find new coverage is
+saved to the first corpus directory (as usual) and passed to the other jobs through the
+coordinator, which adds them straight to their corpus.
+
+The coordinator reports the combined statistics of all the jobs; each job writes its own
+log to fuzz-<n>.log.
+"""
+
+import logging
+import multiprocessing as mp
+import signal
+import sys
+import time
+
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+from pythonfuzz import bitmap, fuzzer, stats
+
+# How often a job looks for inputs found by the other jobs, in seconds
+COLLECT_INTERVAL = 0.5
+
+# How often the coordinator checks the jobs are still alive while stopping them, in seconds
+STOP_POLL_INTERVAL = 0.1
+
+
+class JobPeer(object):
+    """
+    The link between a job's Fuzzer and the coordinator.
+    """
+
+    def __init__(self, index, events, inbox):
+        self._index = index
+        self._events = events
+        self._inbox = inbox
+        self._last_collect = 0
+
+    def publish(self, buf):
+        """
+        Tell the other jobs about an input which found new coverage.
+        """
+        self._events.put(('new', self._index, bytes(buf)))
+
+    def collect(self):
+        """
+        @return: list of the inputs found by the other jobs since we last looked.
+        """
+        now = time.time()
+        if now - self._last_collect < COLLECT_INTERVAL:
+            return []
+        self._last_collect = now
+        bufs = []
+        while True:
+            try:
+                bufs.append(bytearray(self._inbox.get_nowait()))
+            except queue.Empty:
+                return bufs
+
+    def failure(self, kind, buf, error, signature):
+        """
+        Each job writes and logs its own failures, so there's nothing to pass on.
+        """
+
+    def report(self, record):
+        """
+        @param record:  dict of the job's statistics (see the stats module)
+        """
+        self._events.put(('stats', self._index, record))
+
+
+def job(index, fuzzer_kwargs, shared_virgin, events, inbox):
+    # Each job logs to its own file, leaving the console to the coordinator.
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.FileHandler('fuzz-{}.log'.format(index)))
+    # Exiting cleanly when we are terminated takes our worker down with us.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    f = fuzzer.Fuzzer(shared_virgin=shared_virgin, peer=JobPeer(index, events, inbox), **fuzzer_kwargs)
+    try:
+        f.start()
+    finally:
+        events.put(('done', index))
+
+
+class ParallelFuzzer(object):
+    def __init__(self, workers, target, runs=-1, keep_going=False, stats_file=None, prometheus_file=None,
+                 **fuzzer_kwargs):
+        self._workers = workers
+        self._runs = runs
+        self._keep_going = keep_going
+        self._fuzzer_kwargs = dict(fuzzer_kwargs, target=target, keep_going=keep_going)
+        # The jobs' statistics are written together, by us.
+        if stats_file or prometheus_file:
+            self._stats_writer = stats.StatsWriter(stats_file, prometheus_file, fuzzer.SAMPLING_WINDOW)
+        else:
+            self._stats_writer = None
+        # The latest stats record from each job
+        self._stats = {}
+        self._virgin = None
+        self._last_sample_time = time.time()
+
+    def _job_runs(self, index):
+        """
+        Share out the runs requested between the jobs.
+        """
+        if self.runs == -1:
+            return -1
+        return self.runs // self._workers + (1 if index < self.runs % self._workers else 0)
+
+    @property
+    def runs(self):
+        return self._runs
+
+    def log_stats(self, log_type):
+        self._last_sample_time = time.time()
+        if not self._stats:
+            logging.info('#0 {}     cov: 0 corp: 0 exec/s: 0 rss: 0 MB'.format(log_type))
+            return
+        record = stats.combine([self._stats[index] for index in sorted(self._stats)])
+        # The jobs share their coverage, but each has only counted what it found itself.
+        record['coverage'] = bitmap.popcount(self._virgin.bits)
+        findings = ''
+        if self._keep_going:
+            # Each job tells its crashes apart by itself, so the same crash found by two
+            # jobs is counted twice.
+            findings = ' crashes: {}/{} timeouts: {} ooms: {}'.format(
+                record['unique_crashes'], record['crashes'], record['timeouts'], record['ooms'])
+        logging.info('#{} {}     cov: {} corp: {} exec/s: {} rss: {} MB{}'.format(
+            record['executions'], log_type, record['coverage'], record['corpus_inputs'],
+            record['execs_per_second'], record['rss_mb'], findings))
+        if self._stats_writer:
+            self._stats_writer.write(record, force=log_type == 'DONE')
+
+    def start(self):
+        logging.info("#0 READ jobs: {}".format(self._workers))
+
+        shared_virgin = mp.Array('B', bitmap.MAP_SIZE)
+        self._virgin = bitmap.SharedVirginMap(shared_virgin)
+        events = mp.Queue()
+        inboxes = [mp.Queue() for _ in range(self._workers)]
+        jobs = []
+        for index in range(self._workers):
+            kwargs = dict(self._fuzzer_kwargs, runs=self._job_runs(index))
+            p = mp.Process(target=job, args=(index, kwargs, shared_virgin, events, inboxes[index]))
+            p.start()
+            jobs.append(p)
+
+        running = set(range(self._workers))
+        stopping = False
+        while running:
+            try:
+                event = events.get(timeout=STOP_POLL_INTERVAL if stopping else fuzzer.SAMPLING_WINDOW)
+            except queue.Empty:
+                # A job which died without telling us never will.
+                running = set(index for index in running if jobs[index].is_alive())
+                if not stopping:
+                    self.log_stats('PULSE')
+                continue
+
+            kind, index = event[:2]
+            if kind == 'new':
+                if not stopping:
+                    for other, inbox in enumerate(inboxes):
+                        if other != index:
+                            inbox.put(event[2])
+                    self.log_stats('NEW')
+            elif kind == 'stats':
+                self._stats[index] = event[2]
+                if not stopping and (time.time() - self._last_sample_time) > fuzzer.SAMPLING_WINDOW:
+                    self.log_stats('PULSE')
+            elif kind == 'done':
+                running.discard(index)
+                if self.runs == -1 and not stopping:
+                    # Jobs only stop by themselves when they have found a failure.
+                    logging.info('job {} stopped; see fuzz-{}.log. Stopping all jobs.'.format(index, index))
+                    for p in jobs:
+                        p.terminate()
+                    # We go on reading the events until every job is done: a job exits only
+                    # once what it has put on the queue has been read.
+                    stopping = True
+
+        # Nobody is left to read the inputs still waiting for the jobs.
+        for inbox in inboxes:
+            inbox.cancel_join_thread()
+        for p in jobs:
+            p.join()
+        self.log_stats('DONE')
+        if self.runs != -1:
+            logging.info('did %d runs, stopping now.', self.runs)
@@ -0,0 +1,120 @@
+"""
+The messages passed between the fuzzer and its worker process.
+
+The fuzzer sends the worker a batch of inputs in a single message:
+
+    <I  index of the coverage map for the first input
+    <I  number of inputs
+    then, for each input:
+        <I  length of the input
+            the input itself
+
+Once the batch has run, the worker replies with a single message:
+
+    <I  number of results
+    then, for each input that was run:
+        <B  status (STATUS_*)
+        <I  execution time, in microseconds
+        <I  peak RSS of the process that ran it, in KB
+    <I  length of the error text, followed by the text (utf-8); empty unless an input failed
+    <I  length of the failure's signature, followed by the signature (utf-8); likewise
+    <I  number of comparison operands collected, then for each:
+        <I  length of the operand
+            the operand itself
+
+An input which fails is the last to be run in the batch; the worker does not report on
+the inputs after it.
+
+The coverage of each input is not part of the reply: the worker records it straight into
+shared memory, one map for each input in the batch, for the fuzzer to read. The fuzzer
+alternates between two sets of maps, so that it can read the coverage of one batch while
+the worker runs the next.
+"""
+
+import collections
+import struct
+
+STATUS_OK = 0
+STATUS_CRASH = 1
+STATUS_TIMEOUT = 2
+STATUS_OOM = 3
+
+_count = struct.Struct('<I')
+_result = struct.Struct('<BII')
+
+# The outcome of running one input
+Result = collections.namedtuple('Result', ('status', 'exec_time', 'rss'))
+
+# Everything the worker tells us about a batch
+Reply = collections.namedtuple('Reply', ('results', 'error', 'signature', 'tokens'))
+
+
+def _pack_items(items):
+    parts = [_count.pack(len(items))]
+    for item in items:
+        parts.append(_count.pack(len(item)))
+        parts.append(bytes(item))
+    return parts
+
+
+def _unpack_items(data, offset):
+    (count,) = _count.unpack_from(data, offset)
+    offset += _count.size
+    items = []
+    for _ in range(count):
+        (length,) = _count.unpack_from(data, offset)
+        offset += _count.size
+        items.append(bytes(data[offset:offset + length]))
+        offset += length
+    return items, offset
+
+
+def pack_batch(bufs, first_map=0):
+    """
+    @param bufs:        list of the inputs to run
+    @param first_map:   index of the coverage map for the first input; the rest follow it
+    """
+    return _count.pack(first_map) + b''.join(_pack_items(bufs))
+
+
+def unpack_batch(data):
+    """
+    @return: tuple of (index of the first coverage map, list of the inputs in the batch)
+    """
+    data = memoryview(data)
+    (first_map,) = _count.unpack_from(data, 0)
+    (bufs, _) = _unpack_items(data, _count.size)
+    return first_map, bufs
+
+
+def pack_reply(results, error=None, signature=None, tokens=()):
+    """
+    @param results:     list of Result tuples, one for each input run
+    @param error:       text describing the failure of the last input, if it failed
+    @param signature:   string identifying the failure, the same for every input which
+                        fails in the same way
+    @param tokens:      list of the comparison operands collected
+    """
+    parts = [_count.pack(len(results))]
+    for result in results:
+        parts.append(_result.pack(*result))
+    parts.extend(_pack_items([(error or u'').encode('utf-8', 'replace'),
+                              (signature or u'').encode('utf-8', 'replace')]))
+    parts.extend(_pack_items(tokens))
+    return b''.join(parts)
+
+
+def unpack_reply(data):
+    """
+    @return: Reply tuple
+    """
+    data = memoryview(data)
+    (count,) = _count.unpack_from(data, 0)
+    offset = _count.size
+    results = []
+    for _ in range(count):
+        results.append(Result(*_result.unpack_from(data, offset)))
+        offset += _result.size
+    ((error, signature), offset) = _unpack_items(data, offset)
+    (tokens, offset) = _unpack_items(data, offset)
+    return Reply(results, error.decode('utf-8') or None, signature.decode('utf-8') or None, tokens)
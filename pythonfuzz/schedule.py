@@ -0,0 +1,318 @@
+"""
+Power schedules: how much of the fuzzing each input in the corpus gets.
+
+Rather than picking the input to mutate next uniformly at random, the corpus picks each one
+with a probability in proportion to its weight. The power schedule works the weight out from
+what is known about the input (its Seed):
+
+    uniform     every input is as likely as any other
+    explore     after AFLFast's explore (as AFL++ weights its picks): inputs whose path
+                (exact coverage) is run often are picked less
+    fast        after AFLFast's fast: the same, but the weight of an input doubles with
+                each round of picks, up to MAX_FACTOR
+    entropic    after libFuzzer's entropic: inputs with features that few others in the
+                corpus have are picked more, as are inputs whose mutants keep finding new
+                coverage; those whose mutants find nothing fade. The default, as it found
+                the most coverage in our trials.
+
+All of them (bar uniform) favour inputs which are fast to run, small, or have not been
+picked yet. Other schedules can be added by registering a PowerSchedule subclass.
+
+The weights are held in a WeightedSampler, so picking an input and changing the weight of
+one both take O(log n), however large the corpus grows.
+"""
+
+import math
+import random
+
+from pythonfuzz import bitmap
+
+# The number of picks of an input which make one round of fuzzing it. AFL spends a few
+# hundred executions on an input each time it takes it from its queue; we pick an input for
+# each execution.
+ROUND = 256
+
+# The most the weight of an input grows to under the fast schedule
+MAX_FACTOR = 16
+
+# Features which no more than this many inputs in the corpus have are rare.
+RARE_LIMIT = 8
+
+# A dict of the schedule classes we have available, by name
+schedule_classes = {}
+
+
+def register_schedule(cls):
+    schedule_classes[cls.name] = cls
+    return cls
+
+
+class Seed(object):
+    """
+    What is known about one input in the corpus.
+    """
+    __slots__ = ('size', 'exec_time', 'chosen', 'finds', 'hits', 'rare', 'rarity')
+
+    def __init__(self, size, exec_time=None):
+        self.size = size
+        # Time taken to run the input, in microseconds; None where it is not known
+        self.exec_time = exec_time
+        # The number of times it has been picked for mutation
+        self.chosen = 0
+        # The number of its mutants which found new coverage
+        self.finds = 0
+        # The number of inputs run which took exactly its path (itself included)
+        self.hits = 1
+        # The number of its features which are rare, and the sum of 1 / the number of
+        # inputs with each of them
+        self.rare = 0
+        self.rarity = 0.0
+
+
+class PowerSchedule(object):
+    """
+    Base class for the power schedules, which must provide a `weight` method.
+    """
+    name = None
+    # Whether the schedule uses Seed.hits, which costs a hash of the coverage of every
+    # input run
+    uses_hits = False
+    # Whether the schedule uses Seed.rare and Seed.rarity
+    uses_rarity = False
+
+    @staticmethod
+    def performance(seed):
+        """
+        In the spirit of AFL's performance score: inputs which are fast and small are worth
+        more, as are those not yet picked.
+        """
+        exec_time = seed.exec_time or 0
+        score = 1.0 / ((1 + exec_time / 1000.0) * (1 + seed.size / 1024.0))
+        if not seed.chosen:
+            score *= 2
+        return score
+
+    def weight(self, seed):
+        """
+        @return: the weight of the input, greater than 0
+        """
+        raise NotImplementedError('weight not implemented in {}'.format(self.__class__.__name__))
+
+
+@register_schedule
+class UniformSchedule(PowerSchedule):
+    name = 'uniform'
+
+    def weight(self, seed):
+        return 1.0
+
+
+@register_schedule
+class ExploreSchedule(PowerSchedule):
+    name = 'explore'
+    uses_hits = True
+
+    def weight(self, seed):
+        return self.performance(seed) / (1 + math.log10(seed.hits))
+
+
+@register_schedule
+class FastSchedule(PowerSchedule):
+    name = 'fast'
+    uses_hits = True
+
+    def weight(self, seed):
+        rounds = min(seed.chosen // ROUND, 30)
+        return self.performance(seed) * min(2.0 ** rounds, MAX_FACTOR) / (1 + math.log10(seed.hits))
+
+
+@register_schedule
+class EntropicSchedule(PowerSchedule):
+    name = 'entropic'
+    uses_rarity = True
+
+    def weight(self, seed):
+        return self.performance(seed) * (1 + seed.rarity) * (1 + seed.finds) / (1.0 + seed.chosen / ROUND)
+
+
+class WeightedSampler(object):
+    """
+    Picks indices at random, each with a probability in proportion to its weight.
+
+    The weights are held in a Fenwick tree, so that adding a weight, changing one and picking
+    an index all take O(log n).
+    """
+
+    def __init__(self):
+        self._weights = []
+        # 1-based: node i holds the sum of the weights (i - lowbit(i), i]
+        self._tree = [0.0]
+        self._updates = 0
+
+    def __len__(self):
+        return len(self._weights)
+
+    def _prefix(self, end):
+        """
+        @return: the sum of the first `end` weights
+        """
+        total = 0.0
+        while end > 0:
+            total += self._tree[end]
+            end -= end & -end
+        return total
+
+    @property
+    def total(self):
+        return self._prefix(len(self._weights))
+
+    def append(self, weight):
+        self._weights.append(weight)
+        node = len(self._weights)
+        self._tree.append(weight + self._prefix(node - 1) - self._prefix(node - (node & -node)))
+
+    def update(self, index, weight):
+        delta = weight - self._weights[index]
+        self._weights[index] = weight
+        node = index + 1
+        while node < len(self._tree):
+            self._tree[node] += delta
+            node += node & -node
+        # Adding up a long run of changes lets rounding errors creep in; start afresh now and
+        # then, which costs O(1) for each update.
+        self._updates += 1
+        if self._updates > len(self._weights) + 1024:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._tree = [0.0] + self._weights
+        for node in range(1, len(self._tree)):
+            parent = node + (node & -node)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[node]
+        self._updates = 0
+
+    def sample(self, rand=random.random):
+        """
+        @return: an index, picked in proportion to the weights
+        """
+        target = rand() * self.total
+        index = 0
+        step = 1 << (len(self._weights).bit_length() - 1) if self._weights else 0
+        while step:
+            node = index + step
+            if node <= len(self._weights) and self._tree[node] <= target:
+                index = node
+                target -= self._tree[node]
+            step >>= 1
+        return min(index, len(self._weights) - 1)
+
+
+class Scheduler(object):
+    """
+    The Seeds of the inputs in the corpus, and their weights under a power schedule.
+    """
+
+    def __init__(self, schedule='entropic'):
+        """
+        @param schedule:    the name of the power schedule
+        """
+        self.schedule = schedule_classes[schedule]()
+        self.seeds = []
+        self._sampler = WeightedSampler()
+        # The index of the input with each path (hash of its coverage map)
+        self._paths = {}
+        # The number of inputs with each feature, and while it is rare, the inputs with it
+        self._feature_counts = {}
+        self._rare_features = {}
+
+    def _update(self, index):
+        self._sampler.update(index, self.schedule.weight(self.seeds[index]))
+
+    def add(self, size, exec_time=None, coverage_map=None):
+        """
+        Add an input to the corpus.
+
+        @param coverage_map:    the per-input hit count map of the input, if it is known
+        """
+        index = len(self.seeds)
+        self.seeds.append(Seed(size, exec_time))
+        self._sampler.append(0.0)
+        if coverage_map is not None:
+            if self.schedule.uses_hits:
+                self._paths[bitmap.path_hash(coverage_map)] = index
+            if self.schedule.uses_rarity:
+                self._add_features(index, bitmap.features(coverage_map))
+        self._update(index)
+
+    def update_seed(self, index, size=None, exec_time=None, coverage_map=None):
+        """
+        Record what has been learnt about an input already in the corpus: its new size (when
+        it has been replaced by a smaller input with the same path), its execution time, or
+        its coverage, which must not have been given for it before.
+        """
+        seed = self.seeds[index]
+        if size is not None:
+            seed.size = size
+        if exec_time is not None:
+            seed.exec_time = exec_time
+        if coverage_map is not None:
+            if self.schedule.uses_hits:
+                self._paths.setdefault(bitmap.path_hash(coverage_map), index)
+            if self.schedule.uses_rarity:
+                self._add_features(index, bitmap.features(coverage_map))
+        self._update(index)
+
+    def _add_features(self, index, features):
+        seed = self.seeds[index]
+        changed = set()
+        for feature in features:
+            count = self._feature_counts.get(feature, 0) + 1
+            self._feature_counts[feature] = count
+            if count <= RARE_LIMIT:
+                holders = self._rare_features.setdefault(feature, [])
+                # Each of the others with the feature now shares it with one more.
+                for other in holders:
+                    self.seeds[other].rarity += 1.0 / count - 1.0 / (count - 1)
+                    changed.add(other)
+                holders.append(index)
+                seed.rare += 1
+                seed.rarity += 1.0 / count
+            elif count == RARE_LIMIT + 1:
+                # No longer rare
+                for other in self._rare_features.pop(feature):
+                    self.seeds[other].rare -= 1
+                    self.seeds[other].rarity -= 1.0 / RARE_LIMIT
+                    changed.add(other)
+        for other in changed:
+            self._update(other)
+
+    def choose(self):
+        """
+        @return: the index of the input to mutate next
+        """
+        index = self._sampler.sample()
+        self.seeds[index].chosen += 1
+        self._update(index)
+        return index
+
+    def ran(self, coverage_map, path=None):
+        """
+        Count the path of an input which has been run.
+
+        @param path:    bitmap.path_hash of the coverage map, if it is known already
+        """
+        if self.schedule.uses_hits:
+            if path is None:
+                path = bitmap.path_hash(coverage_map)
+            index = self._paths.get(path)
+            if index is not None:
+                self.seeds[index].hits += 1
+                self._update(index)
+
+    def found(self, index):
+        """
+        Credit an input with a mutant of it which found new coverage.
+        """
+        self.seeds[index].finds += 1
+        self._update(index)
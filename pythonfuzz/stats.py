@@ -0,0 +1,234 @@
+"""
+Statistics for monitoring, in a form which does not need scraping from the log.
+
+The fuzzer gathers a record of its statistics each time it logs them: a dict of
+
+    timestamp           time of the record (seconds since the epoch)
+    start_time          time the fuzzing started
+    executions          number of inputs run
+    execs_per_second    rate at which inputs have been run since the last record
+    coverage            number of (edge, bucket) pairs seen
+    corpus_inputs       number of inputs in the corpus
+    corpus_bytes        total size of the inputs in the corpus
+    crashes             number of crashes, and of distinct crashes (with --keep-going)
+    unique_crashes
+    timeouts            number of inputs which ran for too long
+    ooms                number of inputs which used too much memory
+    rss_mb              memory used by the fuzzer and its worker
+    exec_time_us        histogram of the time taken to run each input (see Histogram)
+    slowest_inputs      list of the SLOWEST inputs which took longest to run, slowest first:
+                        each a dict of 'exec_time_us' and 'sha256' (of the input)
+    slowest_corpus      likewise, for the inputs in the corpus
+    mutators            {mutator: {'uses': inputs made with it, 'finds': of which found
+                        new coverage}}
+    workers             list of the same counters for each worker (or job)
+
+StatsWriter writes the records as JSON lines and/or as a Prometheus textfile (for the node
+exporter's textfile collector).
+"""
+
+import json
+import os
+import time
+
+# Execution times are counted in power of two buckets of microseconds, up to 2**27us (about
+# two minutes), with one more for anything longer.
+HISTOGRAM_BUCKETS = 28
+
+# The number of slowest inputs reported
+SLOWEST = 10
+
+# The counters which are added up when records are combined, and shown for each worker.
+COUNTERS = ('executions', 'execs_per_second', 'crashes', 'unique_crashes', 'timeouts', 'ooms', 'rss_mb')
+
+
+class Histogram(object):
+    """
+    Histogram of values in power of two buckets; bucket n counts the values less than 2**n
+    (and not in an earlier bucket).
+    """
+
+    def __init__(self):
+        self.counts = [0] * (HISTOGRAM_BUCKETS + 1)
+        self.sum = 0
+
+    def add(self, value):
+        """
+        @param value:   non-negative integer
+        """
+        self.counts[min(value.bit_length(), HISTOGRAM_BUCKETS)] += 1
+        self.sum += value
+
+    def to_dict(self):
+        """
+        @return: dict of 'counts' (list of the count in each bucket) and 'sum'
+        """
+        return {'counts': list(self.counts), 'sum': self.sum}
+
+
+class MutatorStats(object):
+    """
+    How often each mutator is used, and how often the inputs it makes find new coverage.
+    """
+
+    def __init__(self):
+        self._uses = {}
+        self._finds = {}
+
+    def used(self, mutators):
+        """
+        @param mutators:    names of the mutators applied to make an input
+        """
+        for name in mutators:
+            self._uses[name] = self._uses.get(name, 0) + 1
+
+    def found(self, mutators):
+        """
+        @param mutators:    names of the mutators applied to make an input which found new
+                            coverage
+        """
+        for name in mutators:
+            self._finds[name] = self._finds.get(name, 0) + 1
+
+    def to_dict(self):
+        return dict((name, {'uses': uses, 'finds': self._finds.get(name, 0)})
+                    for name, uses in self._uses.items())
+
+
+def combine(records):
+    """
+    Combine the records of several jobs fuzzing together.
+
+    @param records: list of the latest record from each job
+    @return: a record for all of the jobs, with each job as one of its workers
+    """
+    combined = dict(timestamp=time.time(),
+                    start_time=min(record['start_time'] for record in records),
+                    coverage=max(record['coverage'] for record in records),
+                    corpus_inputs=max(record['corpus_inputs'] for record in records),
+                    corpus_bytes=max(record['corpus_bytes'] for record in records))
+    for name in COUNTERS:
+        combined[name] = sum(record[name] for record in records)
+    exec_time = Histogram()
+    mutators = {}
+    for record in records:
+        exec_time.counts = [a + b for a, b in zip(exec_time.counts, record['exec_time_us']['counts'])]
+        exec_time.sum += record['exec_time_us']['sum']
+        for name, counts in record['mutators'].items():
+            total = mutators.setdefault(name, {'uses': 0, 'finds': 0})
+            total['uses'] += counts['uses']
+            total['finds'] += counts['finds']
+    for name in ('slowest_inputs', 'slowest_corpus'):
+        slowest = [unit for record in records for unit in record[name]]
+        slowest.sort(key=lambda unit: unit['exec_time_us'], reverse=True)
+        combined[name] = slowest[:SLOWEST]
+    combined['exec_time_us'] = exec_time.to_dict()
+    combined['mutators'] = mutators
+    combined['workers'] = [dict((name, record[name]) for name in COUNTERS + ('coverage', 'corpus_inputs'))
+                           for record in records]
+    return combined
+
+
+def _metric(lines, name, kind, help_text, samples):
+    """
+    @param samples: list of (labels dict, value)
+    """
+    lines.append('# HELP pythonfuzz_{} {}'.format(name, help_text))
+    lines.append('# TYPE pythonfuzz_{} {}'.format(name, kind))
+    for labels, value in samples:
+        if labels:
+            labels = '{' + ','.join('{}="{}"'.format(key, labels[key]) for key in sorted(labels)) + '}'
+        else:
+            labels = ''
+        lines.append('pythonfuzz_{}{} {}'.format(name, labels, value))
+
+
+def to_prometheus(record):
+    """
+    @return: the record in the Prometheus text exposition format
+    """
+    lines = []
+    _metric(lines, 'start_time_seconds', 'gauge', 'Time the fuzzing started', [({}, record['start_time'])])
+    _metric(lines, 'executions_total', 'counter', 'Inputs run', [({}, record['executions'])])
+    _metric(lines, 'execs_per_second', 'gauge', 'Recent rate of running inputs', [({}, record['execs_per_second'])])
+    _metric(lines, 'coverage', 'gauge', 'Edges (and hit count buckets) covered', [({}, record['coverage'])])
+    _metric(lines, 'corpus_inputs', 'gauge', 'Inputs in the corpus', [({}, record['corpus_inputs'])])
+    _metric(lines, 'corpus_bytes', 'gauge', 'Total size of the corpus', [({}, record['corpus_bytes'])])
+    _metric(lines, 'crashes_total', 'counter', 'Inputs which crashed the target', [({}, record['crashes'])])
+    _metric(lines, 'unique_crashes', 'gauge', 'Distinct crashes found', [({}, record['unique_crashes'])])
+    _metric(lines, 'timeouts_total', 'counter', 'Inputs which ran for too long', [({}, record['timeouts'])])
+    _metric(lines, 'ooms_total', 'counter', 'Inputs which used too much memory', [({}, record['ooms'])])
+    _metric(lines, 'rss_bytes', 'gauge', 'Memory used by the fuzzer and its workers',
+            [({}, int(record['rss_mb'] * 1024 * 1024))])
+
+    exec_time = record['exec_time_us']
+    lines.append('# HELP pythonfuzz_exec_time_seconds Time taken to run each input')
+    lines.append('# TYPE pythonfuzz_exec_time_seconds histogram')
+    cumulative = 0
+    for index, count in enumerate(exec_time['counts']):
+        cumulative += count
+        le = '+Inf' if index == HISTOGRAM_BUCKETS else repr((2 ** index) / 1000000.0)
+        lines.append('pythonfuzz_exec_time_seconds_bucket{{le="{}"}} {}'.format(le, cumulative))
+    lines.append('pythonfuzz_exec_time_seconds_sum {}'.format(exec_time['sum'] / 1000000.0))
+    lines.append('pythonfuzz_exec_time_seconds_count {}'.format(cumulative))
+    for name, help_text in (('slowest_inputs', 'Time taken by the slowest input run'),
+                            ('slowest_corpus', 'Time taken by the slowest input in the corpus')):
+        if record[name]:
+            _metric(lines, '{}_exec_time_seconds'.format(name), 'gauge', help_text,
+                    [({}, record[name][0]['exec_time_us'] / 1000000.0)])
+
+    mutators = sorted(record['mutators'].items())
+    _metric(lines, 'mutator_uses_total', 'counter', 'Inputs made with each mutator',
+            [({'mutator': name}, counts['uses']) for name, counts in mutators])
+    _metric(lines, 'mutator_finds_total', 'counter', 'Inputs made with each mutator which found new coverage',
+            [({'mutator': name}, counts['finds']) for name, counts in mutators])
+    _metric(lines, 'worker_executions_total', 'counter', 'Inputs run by each worker',
+            [({'worker': index}, worker['executions']) for index, worker in enumerate(record['workers'])])
+    _metric(lines, 'worker_execs_per_second', 'gauge', 'Recent rate of running inputs in each worker',
+            [({'worker': index}, worker['execs_per_second']) for index, worker in enumerate(record['workers'])])
+    _metric(lines, 'worker_rss_bytes', 'gauge', 'Memory used by each worker',
+            [({'worker': index}, int(worker['rss_mb'] * 1024 * 1024))
+             for index, worker in enumerate(record['workers'])])
+    return '\n'.join(lines) + '\n'
+
+
+class StatsWriter(object):
+    """
+    Write the stats records to files, at most once every interval.
+    """
+
+    def __init__(self, json_path=None, prometheus_path=None, interval=5):
+        """
+        @param json_path:       file to append each record to, as a line of JSON
+        @param prometheus_path: file to replace with the latest record, in the Prometheus
+                                text format
+        @param interval:        the least time between records, in seconds
+        """
+        self._json_path = json_path
+        self._prometheus_path = prometheus_path
+        self._interval = interval
+        self._last_write = 0
+
+    def due(self):
+        """
+        @return: True if a record written now would not be thrown away, so that the caller
+                 need not build one otherwise
+        """
+        return time.time() - self._last_write >= self._interval
+
+    def write(self, record, force=False):
+        """
+        @param force:   write the record even if one was written less than the interval ago
+        """
+        if not force and not self.due():
+            return
+        self._last_write = time.time()
+        if self._json_path:
+            with open(self._json_path, 'a') as f:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+        if self._prometheus_path:
+            # The collector may read the file at any time, so it is replaced all at once.
+            temp_path = self._prometheus_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                f.write(to_prometheus(record))
+            os.rename(temp_path, self._prometheus_path)
@@ -0,0 +1,246 @@
+"""
+A corpus kept in a single packed file, rather than a file for each input.
+
+The file is append-only:
+
+    MAGIC
+    then, for each input:
+        <I  length of the input
+            sha256 digest of the input (32 bytes)
+            the input itself
+
+Opening the file memory-maps it and reads only the record headers, building an index of
+the offset, length and digest of each input; the inputs themselves are handed out as
+memoryview slices of the map, so they are only read from disk (and only take memory) when
+they are used. An input is only added if its digest is not already in the index.
+
+Several processes may append to the same file (eg the jobs of --workers): each append is
+made under an exclusive lock, after picking up whatever the others have added.
+
+A corpus is kept in a packed file when its path ends in PACK_SUFFIX. The inputs can be
+moved between a packed file and the usual directory of files named by their sha256 with
+
+    pythonfuzz-pack import corpus.pack corpus/
+    pythonfuzz-pack export corpus.pack corpus/
+
+Packed files need Python 3, whose mmap can be viewed with a memoryview.
+"""
+
+import argparse
+import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends from several processes are not safe.
+    fcntl = None
+
+MAGIC = b'PFPACK1\n'
+PACK_SUFFIX = '.pack'
+
+_header = struct.Struct('<I32s')
+
+
+def is_packed(path):
+    """
+    @return: True if the corpus at path is kept in a packed file
+    """
+    return path.endswith(PACK_SUFFIX)
+
+
+def read_inputs(path):
+    """
+    @param path:    a file, or a directory of files (as for the corpus)
+    @return: iterator over the inputs, as bytes
+    """
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path))
+    for name in paths:
+        if os.path.isfile(name):
+            with open(name, 'rb') as f:
+                yield f.read()
+
+
+class PackedStore(object):
+    """
+    The inputs in a packed file, as a sequence of memoryviews.
+    """
+
+    def __init__(self, path):
+        if sys.version_info[0] < 3:
+            raise ValueError('a packed corpus needs Python 3')
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        # Where each input starts in the file, and its length
+        self._offsets = array.array('Q')
+        self._lengths = array.array('L')
+        self._digests = {}
+        # The end of the last whole record we know of
+        self._end = 0
+        self._map = None
+        self._view = None
+        self.size = 0
+        self._lock()
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                self._write(MAGIC)
+            self._remap()
+            valid = bytes(self._view[:len(MAGIC)]) == MAGIC
+            if valid:
+                self._end = len(MAGIC)
+                self._scan()
+        finally:
+            self._unlock()
+        if not valid:
+            self.close()
+            raise ValueError('{} is not a packed corpus'.format(path))
+
+    def _lock(self):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _write(self, data):
+        os.lseek(self._fd, self._end, os.SEEK_SET)
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    def _remap(self):
+        size = os.fstat(self._fd).st_size
+        if self._map is None or len(self._map) < size:
+            # Views handed out keep the old map alive for as long as they are needed.
+            self._map = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+
+    def _scan(self):
+        """
+        Index the records added since we last looked, by us or anyone else.
+        """
+        self._remap()
+        size = len(self._map)
+        while self._end + _header.size <= size:
+            length, digest = _header.unpack_from(self._map, self._end)
+            start = self._end + _header.size
+            if start + length > size:
+                break
+            self._digests.setdefault(digest, len(self._offsets))
+            self._offsets.append(start)
+            self._lengths.append(length)
+            self.size += length
+            self._end = start + length
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def length(self, index):
+        """
+        @return: the length of the input at index, without reading it
+        """
+        return self._lengths[index]
+
+    def digest(self, index):
+        """
+        @return: the sha256 digest of the input at index, without reading it
+        """
+        start = self._offsets[index] - _header.size
+        return _header.unpack_from(self._map, start)[1]
+
+    def __getitem__(self, index):
+        start = self._offsets[index]
+        if start + self._lengths[index] > len(self._map):
+            self._remap()
+        return self._view[start:start + self._lengths[index]]
+
+    def append(self, buf):
+        """
+        Add an input, unless it is already there.
+
+        @return: the index of the input
+        """
+        digest = hashlib.sha256(buf).digest()
+        index = self._digests.get(digest)
+        if index is not None:
+            return index
+        self._lock()
+        try:
+            self._scan()
+            index = self._digests.get(digest)
+            if index is not None:
+                return index
+            # Anything after the last whole record was cut short by a crash; write over it.
+            os.ftruncate(self._fd, self._end)
+            self._write(_header.pack(len(buf), digest) + bytes(buf))
+            self._scan()
+        finally:
+            self._unlock()
+        return self._digests[digest]
+
+    def import_path(self, path):
+        """
+        Add the inputs from a file, or a directory of files.
+
+        @return: the number of inputs added which were not already there
+        """
+        before = len(self)
+        for buf in read_inputs(path):
+            self.append(buf)
+        return len(self) - before
+
+    def export(self, directory):
+        """
+        Write each input to a file in the directory, named by its sha256.
+
+        @return: the number of files written
+        """
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+        written = 0
+        for digest, index in self._digests.items():
+            path = os.path.join(directory, digest.hex())
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(self[index])
+                written += 1
+        return written
+
+    def close(self):
+        self._view = None
+        self._map = None
+        os.close(self._fd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move a pythonfuzz corpus between a packed file and a directory')
+    parser.add_argument('command', choices=('import', 'export'),
+                        help='import: add the inputs from the paths to the packed file; '
+                             'export: write the inputs in the packed file to the directory')
+    parser.add_argument('pack', type=str, help='the packed corpus file')
+    parser.add_argument('paths', type=str, nargs='+', help='directories (or files) of inputs')
+    args = parser.parse_args()
+    if args.command == 'export' and len(args.paths) != 1:
+        parser.error('export takes a single directory')
+
+    store = PackedStore(args.pack)
+    try:
+        if args.command == 'import':
+            for path in args.paths:
+                print('{}: {} new inputs'.format(path, store.import_path(path)))
+        else:
+            print('{}: {} files written'.format(args.paths[0], store.export(args.paths[0])))
+        print('{}: {} inputs, {} bytes'.format(args.pack, len(store), store.size))
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
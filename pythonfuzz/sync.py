@@ -0,0 +1,479 @@
+"""
+Sharing the corpus between fuzzers running on different machines.
+
+A sync server (started with pythonfuzz-sync) holds the inputs which found new coverage on
+any of the nodes fuzzing the same target. A Fuzzer given --sync HOST:PORT syncs with it
+every SYNC_INTERVAL seconds: it pushes the inputs it has found since the last sync, each
+tagged with the signature of its coverage, and pulls the inputs pushed by the other nodes.
+The inputs pulled are run like any other, so they only join the node's corpus if they find
+coverage the node has not seen.
+
+The node syncs on a thread of its own, so a slow or unresponsive server never holds up the
+fuzzing. After a failed sync, it waits twice as long before each attempt, up to MAX_BACKOFF.
+
+The server ignores inputs it already has, and inputs whose coverage signature it has
+already seen. It takes at most max_push_rate new inputs a second from each node (with
+bursts of up to BURST_SECONDS' worth); a node keeps the inputs the server has not taken
+yet for its next sync.
+
+A sync is a single request and reply, each sent as a <I length followed by:
+
+    request:
+        4s  MAGIC
+        16s id of the node
+        <Q  cursor: the number of the server's inputs the node has already seen
+        <I  the most inputs to pull
+        <I  number of inputs pushed, then for each:
+            <I  length of the coverage signature, then the signature (ascii)
+            <I  length of the input, then the input
+    reply:
+        <I  number of the pushed inputs the server has dealt with, from the first
+        <Q  the new cursor
+        <I  number of inputs pulled, then for each:
+            <I  length of the input, then the input
+"""
+
+import argparse
+import collections
+import hashlib
+import itertools
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    # Python 2
+    import SocketServer as socketserver
+
+MAGIC = b'PFS1'
+SYNC_PORT = 7070
+
+# How often a node syncs, in seconds
+SYNC_INTERVAL = 5
+SYNC_TIMEOUT = 10 # IN SECONDS
+# The longest a node waits between attempts to sync with a server which can't be reached
+MAX_BACKOFF = 300
+# How long a node waits for its last sync when it stops, in seconds
+FINISH_TIMEOUT = 2
+
+# The most inputs moved by one sync in each direction, and the most a node keeps while
+# waiting for the server to take them.
+MAX_PUSH = 256
+MAX_PULL = 256
+MAX_PENDING = 4096
+
+# The largest message either side will accept, and the largest input the server will keep.
+MAX_MESSAGE = 64 * 1024 * 1024
+MAX_INPUT_SIZE = 1024 * 1024
+
+BURST_SECONDS = 10
+
+_length = struct.Struct('<I')
+_request = struct.Struct('<4s16sQI')
+_reply = struct.Struct('<IQ')
+
+
+class SyncError(Exception):
+    pass
+
+
+def parse_address(address):
+    """
+    @param address: 'HOST:PORT', or just 'HOST' for the default port
+    @return: tuple of (host, port)
+    """
+    host, _, port = address.rpartition(':')
+    if not host:
+        return port, SYNC_PORT
+    try:
+        return host, int(port)
+    except ValueError:
+        raise SyncError('Bad sync address {!r}; expected HOST:PORT'.format(address))
+
+
+def _recv_exactly(sock, size):
+    parts = []
+    while size:
+        part = sock.recv(min(size, 1 << 20))
+        if not part:
+            return None
+        parts.append(part)
+        size -= len(part)
+    return b''.join(parts)
+
+
+def recv_message(sock):
+    """
+    @return: the body of the next message, or None if the connection was closed
+    """
+    header = _recv_exactly(sock, _length.size)
+    if header is None:
+        return None
+    (size,) = _length.unpack(header)
+    if size > MAX_MESSAGE:
+        raise SyncError('message of {} bytes is too large'.format(size))
+    body = _recv_exactly(sock, size)
+    if body is None:
+        raise SyncError('connection closed in the middle of a message')
+    return body
+
+
+def send_message(sock, body):
+    sock.sendall(_length.pack(len(body)) + body)
+
+
+def _pack_item(item):
+    return _length.pack(len(item)) + bytes(item)
+
+
+def _pack_items(items):
+    return _length.pack(len(items)) + b''.join(_pack_item(item) for item in items)
+
+
+def _unpack_items(data, offset, count=None):
+    if count is None:
+        (count,) = _length.unpack_from(data, offset)
+        offset += _length.size
+    items = []
+    for _ in range(count):
+        (size,) = _length.unpack_from(data, offset)
+        offset += _length.size
+        if offset + size > len(data):
+            raise SyncError('truncated message')
+        items.append(bytes(data[offset:offset + size]))
+        offset += size
+    return items, offset
+
+
+def pack_request(node, cursor, limit, pushed):
+    """
+    @param pushed:  list of (coverage signature, input) tuples
+    """
+    parts = [_request.pack(MAGIC, node, cursor, limit), _length.pack(len(pushed))]
+    for signature, buf in pushed:
+        parts.append(_pack_item(signature.encode('ascii')))
+        parts.append(_pack_item(buf))
+    return b''.join(parts)
+
+
+def unpack_request(data):
+    """
+    @return: tuple of (node, cursor, limit, list of (coverage signature, input) tuples)
+    """
+    if len(data) < _request.size + _length.size:
+        raise SyncError('truncated message')
+    magic, node, cursor, limit = _request.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise SyncError('not a sync request')
+    (count,) = _length.unpack_from(data, _request.size)
+    items, _ = _unpack_items(data, _request.size + _length.size, count * 2)
+    pushed = [(items[i].decode('ascii', 'replace'), items[i + 1]) for i in range(0, len(items), 2)]
+    return node, cursor, limit, pushed
+
+
+def pack_reply(taken, cursor, pulled):
+    return _reply.pack(taken, cursor) + _pack_items(pulled)
+
+
+def unpack_reply(data):
+    """
+    @return: tuple of (number of pushed inputs taken, new cursor, list of inputs pulled)
+    """
+    if len(data) < _reply.size:
+        raise SyncError('truncated message')
+    taken, cursor = _reply.unpack_from(data, 0)
+    pulled, _ = _unpack_items(data, _reply.size)
+    return taken, cursor, pulled
+
+
+class SyncStore(object):
+    """
+    The inputs held by the sync server.
+    """
+
+    def __init__(self, path=None, max_push_rate=100):
+        """
+        @param path:            directory to keep the inputs in, so that they survive a
+                                restart; None to keep them in memory only
+        @param max_push_rate:   the most new inputs to take from each node per second
+        """
+        self._lock = threading.Lock()
+        self._path = path
+        self._rate = max_push_rate
+        # (node, input) for each input, in the order they arrived; the cursors index this.
+        self._entries = []
+        self._hashes = set()
+        self._signatures = set()
+        # node -> (allowance, time it was last topped up)
+        self._allowances = {}
+        if path is not None:
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            for name in sorted(os.listdir(path)):
+                with open(os.path.join(path, name), 'rb') as f:
+                    self._add(b'', f.read())
+
+    @property
+    def length(self):
+        return len(self._entries)
+
+    def _add(self, node, buf):
+        digest = hashlib.sha256(buf).digest()
+        if digest in self._hashes:
+            return False
+        self._hashes.add(digest)
+        self._entries.append((node, buf))
+        return True
+
+    def _allowance(self, node, now):
+        # A token bucket for each node.
+        burst = self._rate * BURST_SECONDS
+        allowance, last = self._allowances.get(node, (burst, now))
+        return min(burst, allowance + (now - last) * self._rate)
+
+    def sync(self, node, cursor, limit, pushed):
+        """
+        @return: tuple of (number of pushed inputs dealt with, new cursor, list of inputs pulled)
+        """
+        now = time.time()
+        with self._lock:
+            allowance = self._allowance(node, now)
+            taken = 0
+            for signature, buf in pushed:
+                new = len(buf) <= MAX_INPUT_SIZE and signature not in self._signatures and \
+                    hashlib.sha256(buf).digest() not in self._hashes
+                if new:
+                    if allowance < 1:
+                        break
+                    allowance -= 1
+                    self._signatures.add(signature)
+                    self._add(node, buf)
+                    self._save(buf)
+                taken += 1
+            self._allowances[node] = (allowance, now)
+
+            if cursor > len(self._entries):
+                # We have been restarted since the node last synced.
+                cursor = 0
+            pulled = []
+            while cursor < len(self._entries) and len(pulled) < limit:
+                origin, buf = self._entries[cursor]
+                cursor += 1
+                if origin != node:
+                    pulled.append(buf)
+        return taken, cursor, pulled
+
+    def _save(self, buf):
+        if self._path is not None:
+            with open(os.path.join(self._path, hashlib.sha256(buf).hexdigest()), 'wb') as f:
+                f.write(buf)
+
+
+class _SyncHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.settimeout(SYNC_TIMEOUT * 6)
+        try:
+            while True:
+                data = recv_message(self.request)
+                if data is None:
+                    return
+                node, cursor, limit, pushed = unpack_request(data)
+                before = self.server.store.length
+                taken, cursor, pulled = self.server.store.sync(node, cursor, limit, pushed)
+                send_message(self.request, pack_reply(taken, cursor, pulled))
+                if pushed or pulled:
+                    logging.info('%s: pushed %d (%d new), pulled %d; %d inputs held', self.client_address[0],
+                                 len(pushed), self.server.store.length - before, len(pulled),
+                                 self.server.store.length)
+        except (socket.error, SyncError) as e:
+            logging.warning('%s: %s', self.client_address[0], e)
+
+
+class SyncServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Serve a SyncStore over TCP, one thread for each node connected.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, store):
+        self.store = store
+        socketserver.TCPServer.__init__(self, address, _SyncHandler)
+
+
+class SyncClient(object):
+    """
+    A node's link to the sync server.
+    """
+
+    def __init__(self, address, interval=SYNC_INTERVAL):
+        """
+        @param address:     'HOST:PORT' of the server
+        @param interval:    the time between syncs, in seconds
+        """
+        self._address = parse_address(address)
+        self._interval = interval
+        self._node = os.urandom(16)
+        self._sock = None
+        self._cursor = 0
+        # Guards what the fuzzer and the sync thread share: the inputs waiting to be pushed,
+        # those pulled but not yet collected, and the hashes seen.
+        self._lock = threading.Lock()
+        self._pending = collections.deque(maxlen=MAX_PENDING)
+        self._pulled = []
+        # Hashes of the inputs we have pushed or pulled, so that neither goes back to the server.
+        self._seen = set()
+        self._thread = None
+        self._stopping = threading.Event()
+        # The number of syncs which have failed in a row
+        self.failures = 0
+        self.pushed = 0
+        self.pulled = 0
+
+    def push(self, buf, signature):
+        """
+        Queue an input which found new coverage, to be pushed at the next sync.
+
+        @param signature:   the input's coverage signature (see bitmap.signature)
+        """
+        buf = bytes(buf)
+        digest = hashlib.sha256(buf).digest()
+        with self._lock:
+            if digest not in self._seen:
+                self._seen.add(digest)
+                self._pending.append((signature, buf))
+
+    def pull(self):
+        """
+        Collect the inputs pulled in the background, starting to sync if we have not yet.
+        Never waits for the server.
+
+        @return: list of the inputs found by other nodes since the last call
+        """
+        if self._thread is None:
+            self._start()
+        with self._lock:
+            bufs, self._pulled = self._pulled, []
+        return bufs
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name='pythonfuzz-sync')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        delay = 0
+        while not self._stopping.wait(delay):
+            if self._try_sync():
+                delay = self._interval
+            else:
+                delay = min(self._interval * 2 ** self.failures, MAX_BACKOFF)
+        # One last push, unless the server has stopped answering.
+        if self._pending and not self.failures:
+            self._try_sync(limit=0)
+        self.close()
+
+    def _try_sync(self, limit=MAX_PULL):
+        """
+        @return: True if the sync succeeded
+        """
+        try:
+            bufs = self.sync(limit)
+        except (socket.error, SyncError) as e:
+            self.failures += 1
+            logging.warning('sync with %s:%d failed: %s', self._address[0], self._address[1], e)
+            self.close()
+            return False
+        self.failures = 0
+        with self._lock:
+            self._pulled.extend(bufs)
+        return True
+
+    def sync(self, limit=MAX_PULL):
+        """
+        Push the inputs queued and pull new inputs from the server, now.
+
+        @param limit:   the most inputs to pull
+        @return: list of the inputs pulled
+        """
+        if self._sock is None:
+            self._sock = socket.create_connection(self._address, SYNC_TIMEOUT)
+        with self._lock:
+            pushed = list(itertools.islice(self._pending, MAX_PUSH))
+        send_message(self._sock, pack_request(self._node, self._cursor, limit, pushed))
+        data = recv_message(self._sock)
+        if data is None:
+            raise SyncError('connection closed by the server')
+        taken, self._cursor, pulled = unpack_reply(data)
+        with self._lock:
+            # Pushes made meanwhile may have pushed some of these out of a full queue already.
+            for item in pushed[:taken]:
+                if self._pending and self._pending[0] is item:
+                    self._pending.popleft()
+            bufs = []
+            for buf in pulled:
+                digest = hashlib.sha256(buf).digest()
+                if digest not in self._seen:
+                    self._seen.add(digest)
+                    bufs.append(bytearray(buf))
+        self.pushed += taken
+        self.pulled += len(bufs)
+        return bufs
+
+    def finish(self):
+        """
+        Stop syncing: push whatever is still queued, if the server answers within
+        FINISH_TIMEOUT seconds, and disconnect.
+        """
+        self._stopping.set()
+        if self._thread is None:
+            if not self._pending:
+                return
+            self._start()
+        self._thread.join(FINISH_TIMEOUT)
+        if self._thread.is_alive():
+            logging.warning('sync with %s:%d did not finish; %d inputs not pushed', self._address[0],
+                            self._address[1], len(self._pending))
+            # Wake the thread from whatever it is waiting for; it gives up on the error.
+            sock = self._sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Corpus sync server for pythonfuzz nodes fuzzing the same target')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to listen on; use 0.0.0.0 to accept nodes from other machines')
+    parser.add_argument('--port', type=int, default=SYNC_PORT, help='Port to listen on')
+    parser.add_argument('--dir', type=str, default=None,
+                        help='Directory to keep the inputs in, so that they survive a restart')
+    parser.add_argument('--max-push-rate', type=float, default=100,
+                        help='The most new inputs to take from each node per second')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    server = SyncServer((args.host, args.port), SyncStore(args.dir, args.max_push_rate))
+    logging.info('serving %d inputs on %s:%d', server.store.length, args.host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
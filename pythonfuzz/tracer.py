@@ -1,33 +1,309 @@
-import collections
+import dis
+import fnmatch
+import logging
+import multiprocessing
+import os
 import sys
+import sysconfig
+import weakref
+import zlib
+
+from pythonfuzz import bitmap
+
+# Hit counts for the edges taken by the current input, indexed by the hash of each edge.
+# The worker points this at shared memory (see use_map) so that the fuzzer can read it.
+coverage_map = bytearray(bitmap.MAP_SIZE)
+prev_loc = 0
+
+# Whether the tracer is installed
+_installed = False
+
+try:
+    import asyncio
+    import selectors
+except ImportError:
+    # Python 2
+    asyncio = selectors = None
+
+# Source files that are never traced: the fuzzer itself and the modules it uses to talk
+# to the worker, none of which tell us anything about the target.
+DEFAULT_EXCLUDE = [os.path.join(os.path.dirname(os.path.abspath(path)), '*')
+                   for path in (__file__, multiprocessing.__file__, logging.__file__)]
+if asyncio is not None:
+    # Nor is the event loop which runs async targets; with it left out, the edge recorded
+    # when a coroutine resumes runs from the line it was waiting on, as if there were no
+    # await in between.
+    DEFAULT_EXCLUDE.append(os.path.join(os.path.dirname(os.path.abspath(asyncio.__file__)), '*'))
+    DEFAULT_EXCLUDE.append(os.path.abspath(selectors.__file__))
+
+# Special pattern matching the standard library (but not the site-packages inside it).
+STDLIB = 'stdlib'
+_stdlib_dir = os.path.join(sysconfig.get_paths()['stdlib'], '')
+_site_dirs = tuple(os.path.join(sysconfig.get_paths()[name], '') for name in ('purelib', 'platlib'))
+
+_include = []
+_exclude = []
+
+# Whether to collect the operands of comparisons, to be used as dictionary words.
+trace_cmp = False
+# Operands collected that have not yet been passed back to the fuzzer.
+tokens = []
+# Operands we have already collected, so that they are only reported once.
+_seen_tokens = set()
+MAX_TOKEN_LENGTH = 64
+MAX_SEEN_TOKENS = 4096
+_TOKEN_TYPES = (bytes, bytearray, type(u''))
+
+_COMPARE_OPNAMES = ('COMPARE_OP', 'CONTAINS_OP')
+_COMPARE_OPS = ('==', '!=', 'in', 'not in')
+_COMPARE_METHODS = ('startswith', 'endswith', 'find', 'rfind', 'index', 'rindex')
+
+# Per code object information, created the first time we see the code object.
+_code_info = weakref.WeakKeyDictionary()
+
+_LINE_MULTIPLIER = 0x9e3779b1
+
+
+class _LineTable(dict):
+    """
+    Location value for each line of a code object; lines missing from the table are
+    filled in when they are first seen.
+    """
+    __slots__ = ('base',)
+
+    def __init__(self, base):
+        super(_LineTable, self).__init__()
+        self.base = base
+
+    def __missing__(self, line):
+        loc = (self.base + line * _LINE_MULTIPLIER) & bitmap.MAP_MASK
+        self[line] = loc
+        return loc
+
+
+class _CodeInfo(object):
+    """
+    What we know about a code object.
+
+        `base` - location value for the code object; derived from its name and position
+                 so that it is the same in every process, whatever the hash seed
+        `lines` - location value for each line
+        `traced` - whether the code object's file is one we are tracing
+        `trace` - the local trace function for frames of this code object, or None if
+                  the code is not traced
+    """
+    __slots__ = ('base', 'lines', 'traced', 'trace')
+
+    def __init__(self, code):
+        key = '{}:{}:{}'.format(code.co_filename, code.co_firstlineno, code.co_name)
+        self.base = zlib.crc32(key.encode('utf-8', 'replace')) & 0xffffffff
+        self.lines = _LineTable(self.base)
+        self.traced = is_traced(code.co_filename)
+        if self.traced:
+            for _, line in dis.findlinestarts(code):
+                if line is not None:
+                    self.lines[line]
+            self.trace = _make_local_trace(self.lines)
+            if trace_cmp:
+                _collect_constants(code)
+        else:
+            self.trace = None
+
+
+def _add_token(value):
+    if isinstance(value, bytearray):
+        value = bytes(value)
+    elif not isinstance(value, bytes):
+        value = value.encode('utf-8', 'replace')
+    if value in _seen_tokens:
+        return
+    if len(_seen_tokens) >= MAX_SEEN_TOKENS:
+        _seen_tokens.clear()
+    _seen_tokens.add(value)
+    tokens.append(value)
+
+
+def compare_operand(value):
+    """
+    Record the operand of a comparison, if it might be useful as a dictionary word;
+    called by code instrumented by the instrument module.
+
+    @return: the value, unchanged
+    """
+    if isinstance(value, _TOKEN_TYPES):
+        if 0 < len(value) <= MAX_TOKEN_LENGTH:
+            _add_token(value)
+    elif isinstance(value, tuple):
+        for item in value:
+            if isinstance(item, _TOKEN_TYPES) and 0 < len(item) <= MAX_TOKEN_LENGTH:
+                _add_token(item)
+    return value
+
+
+def _collect_constants(code):
+    """
+    Record the constant operands of the comparisons in a code object.
+
+    We cannot see the values being compared when tracing, but the constants they are
+    compared against are usually the magic values we are interested in.
+    """
+    if not hasattr(dis, 'get_instructions'):
+        return
+    instructions = list(dis.get_instructions(code))
+    for index, instruction in enumerate(instructions):
+        if instruction.opname != 'LOAD_CONST':
+            continue
+        wanted = False
+        if index > 0:
+            previous = instructions[index - 1]
+            wanted = previous.opname in ('LOAD_METHOD', 'LOAD_ATTR') and previous.argval in _COMPARE_METHODS
+        # The constant may be either operand, so look a little way ahead for the comparison.
+        for following in instructions[index + 1:index + 3]:
+            if following.opname in _COMPARE_OPNAMES:
+                wanted = wanted or following.opname == 'CONTAINS_OP' or following.argval in _COMPARE_OPS
+                break
+        if wanted:
+            compare_operand(instruction.argval)
+
+
+def take_tokens():
+    """
+    @return: the comparison operands collected since the last call.
+    """
+    collected = tokens[:]
+    del tokens[:]
+    return collected
+
+
+def _matches(filename, patterns):
+    for pattern in patterns:
+        if pattern == STDLIB:
+            if filename.startswith('<frozen '):
+                return True
+            if filename.startswith(_stdlib_dir) and not filename.startswith(_site_dirs):
+                return True
+        elif fnmatch.fnmatch(filename, pattern):
+            return True
+    return False
+
+
+def is_traced(filename):
+    """
+    Decide whether code from a given source file should be traced: never the files in
+    DEFAULT_EXCLUDE; otherwise, the files matching the include patterns (or all files, if
+    there are none) which do not match an exclude pattern.
+    """
+    if _matches(filename, DEFAULT_EXCLUDE):
+        return False
+    if _include:
+        return _matches(filename, _include) and not _matches(filename, _exclude)
+    return not _matches(filename, _exclude)
+
+
+def configure(include=None, exclude=None):
+    """
+    Select the source files to trace.
+
+    @param include: list of glob patterns for the filenames to trace, or None to trace all
+                    files
+    @param exclude: list of glob patterns for filenames not to trace, even if they are
+                    included; DEFAULT_EXCLUDE is never traced either way.
+    Either list may contain STDLIB to match the standard library.
+    """
+    global _include, _exclude
+    _include = list(include or [])
+    _exclude = list(exclude or [])
+    # The decisions are cached, so forget those made with the old patterns.
+    _code_info.clear()
+
+
+def _get_info(code):
+    info = _code_info.get(code)
+    if info is None:
+        info = _code_info[code] = _CodeInfo(code)
+    return info
+
+
+def _make_local_trace(lines):
+    def local_trace(frame, event, arg):
+        if event == 'line':
+            global prev_loc
+            loc = lines[frame.f_lineno]
+            idx = loc ^ prev_loc
+            count = coverage_map[idx]
+            if count != 255:
+                coverage_map[idx] = count + 1
+            prev_loc = loc >> 1
+        return local_trace
+    return local_trace
 
-prev_line = 0
-prev_filename = ''
-data = collections.defaultdict(set)
 
 def trace(frame, event, arg):
-    if event != 'line':
-        return trace
+    # Only ever called for 'call' events; the per-code local trace function sees the rest.
+    # Returning None for code we are not tracing means the frame never gets a local trace
+    # function at all.
+    return _get_info(frame.f_code).trace
+
+
+def install():
+    """
+    Start collecting coverage for the current thread.
+    """
+    global _installed
+    sys.settrace(trace)
+    _installed = True
+
+
+def uninstall():
+    """
+    Stop collecting coverage.
+    """
+    global _installed
+    sys.settrace(None)
+    _installed = False
+
+
+def pause():
+    """
+    Stop tracing the current thread until resume() is called, so that code which is not
+    part of the target runs at full speed.
+    """
+    if _installed:
+        sys.settrace(None)
+
+
+def resume():
+    if _installed:
+        sys.settrace(trace)
 
-    global prev_line
-    global prev_filename
 
-    func_filename = frame.f_code.co_filename
-    func_line_no = frame.f_lineno
+def hit(loc):
+    """
+    Record that a location has been reached; called by code instrumented by the
+    instrument module.
+    """
+    global prev_loc
+    idx = loc ^ prev_loc
+    count = coverage_map[idx]
+    if count != 255:
+        coverage_map[idx] = count + 1
+    prev_loc = loc >> 1
 
-    if func_filename != prev_filename:
-        # We need a way to keep track of inter-files transferts,
-        # and since we don't really care about the details of the coverage,
-        # concatenating the two filenames in enough.
-        data[func_filename + prev_filename].add((prev_line, func_line_no))
-    else:
-        data[func_filename].add((prev_line, func_line_no))
 
-    prev_line = func_line_no
-    prev_filename = func_filename
+def use_map(buf):
+    """
+    Record the coverage of the following inputs in buf, which must be MAP_SIZE bytes and
+    writable (eg a bytearray, or a memoryview of shared memory).
+    """
+    global coverage_map
+    coverage_map = buf
 
-    return trace
 
+def reset():
+    """
+    Clear the per-input coverage map, ready for the next input.
+    """
+    global prev_loc
+    coverage_map[:] = bitmap.EMPTY_MAP
+    prev_loc = 0
 
-def get_coverage():
-    return sum(map(len, data.values()))
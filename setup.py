@@ -26,5 +26,11 @@ setuptools.setup(
         "Topic :: Software Development :: Testing"
     ],
     python_requires='~=2.7, ~=3.5.3',
+    entry_points={
+        'console_scripts': [
+            'pythonfuzz-sync = pythonfuzz.sync:main',
+            'pythonfuzz-pack = pythonfuzz.store:main',
+        ],
+    },
     packages=setuptools.find_packages('.', exclude=("examples",))
 )
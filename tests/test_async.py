@@ -0,0 +1,97 @@
+"""
+Test fuzzing jobs can be driven from an asyncio event loop.
+
+SUT:    AsyncFuzzer
+Area:   Orchestration
+Class:  Functional
+Type:   Integration test
+"""
+
+import sys
+import time
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+if sys.version_info >= (3, 6):
+    import asyncio
+    from pythonfuzz.asyncfuzzer import AsyncFuzzer
+    from pythonfuzz.fuzzer import Fuzzer
+
+
+@unittest.skipUnless(sys.version_info >= (3, 6), 'needs asyncio with async generators')
+class TestAsyncFuzzer(unittest.TestCase):
+    def collect(self, fuzzer):
+        async def run():
+            task = asyncio.ensure_future(fuzzer.run())
+            events = [event async for event in fuzzer.events()]
+            await task
+            return events
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    def test_runs(self):
+        """
+        Tests that every job runs to completion, reporting as it goes.
+        """
+        def fuzz(buf):
+            pass
+
+        with patch('logging.Logger.info') as mock:
+            events = self.collect(AsyncFuzzer(fuzz, jobs=2, runs=100))
+            self.assertEqual(mock.call_args_list.count((('did %d runs, stopping now.', 100),)), 2)
+        self.assertIn('new', [event.kind for event in events])
+
+    def test_crashes(self):
+        """
+        Tests that the crashes found are reported as events.
+        """
+        def fuzz(buf):
+            if len(buf) % 2:
+                raise ValueError('odd')
+
+        with patch('logging.Logger.info'), patch('pythonfuzz.fuzzer.Fuzzer.write_sample'):
+            events = self.collect(AsyncFuzzer(fuzz, jobs=2, runs=100, keep_going=True))
+        crashes = [event for event in events if event.kind == 'crash']
+        self.assertTrue(crashes)
+        self.assertTrue(all(len(event.data['input']) % 2 for event in crashes))
+        self.assertTrue(all(event.data['signature'].startswith('ValueError-') for event in crashes))
+
+    def test_not_blocked(self):
+        """
+        Tests that the event loop carries on while the workers are started and stopped.
+        """
+        def fuzz(buf):
+            pass
+
+        stop_worker = Fuzzer._stop_worker
+
+        def slow_stop(self, kill=False):
+            time.sleep(0.5)
+            stop_worker(self, kill)
+
+        async def run():
+            task = asyncio.ensure_future(AsyncFuzzer(fuzz, jobs=2, runs=100).run())
+            gaps = []
+            last = time.time()
+            while not task.done():
+                await asyncio.sleep(0.01)
+                gaps.append(time.time() - last)
+                last = time.time()
+            await task
+            return max(gaps)
+
+        loop = asyncio.new_event_loop()
+        try:
+            with patch('logging.Logger.info'), patch('pythonfuzz.fuzzer.Fuzzer._stop_worker', slow_stop):
+                self.assertLess(loop.run_until_complete(run()), 0.25)
+        finally:
+            loop.close()
@@ -0,0 +1,72 @@
+"""
+Test async def targets are run to completion, on one event loop.
+
+SUT:    Fuzzer
+Area:   Coroutine targets
+Class:  Functional
+Type:   Integration test
+"""
+
+import signal
+import sys
+import time
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.fuzzer
+
+if sys.version_info >= (3, 5):
+    import asyncio
+
+    # Defined with exec so that this file still compiles on Python 2.
+    exec('''
+loops = set()
+
+
+async def fuzz_crash(buf):
+    loops.add(id(asyncio.get_event_loop()))
+    await asyncio.sleep(0)
+    if len(loops) > 1:
+        raise RuntimeError('a new event loop for each input')
+    if len(buf) > 1 and buf[0] == ord('A'):
+        await asyncio.sleep(0)
+        # Both bytes are checked after an await; guessing them together takes 65536 tries,
+        # so the fuzzer has to have kept the inputs which reached this far.
+        if buf[1] == ord('B'):
+            raise ValueError('found it')
+
+
+async def fuzz_hang(buf):
+    await asyncio.sleep(60)
+''')
+
+
+@unittest.skipUnless(sys.version_info >= (3, 5), 'needs async def')
+class TestCoroutine(unittest.TestCase):
+    def test_crash(self):
+        """
+        Tests that the coverage after an await is seen, and an exception raised there
+        is reported.
+        """
+        with patch('logging.Logger.info'), \
+                patch.object(pythonfuzz.fuzzer.Fuzzer, 'write_sample') as write_sample:
+            pythonfuzz.fuzzer.Fuzzer(fuzz_crash, runs=200000).start()
+            buf = write_sample.call_args[0][0]
+            self.assertEqual(bytes(buf[:2]), b'AB')
+
+    @unittest.skipUnless(hasattr(signal, 'setitimer'), 'needs signal.setitimer')
+    def test_timeout(self):
+        """
+        Tests that an input waiting on the event loop is stopped by the timeout.
+        """
+        with patch('logging.Logger.info'), \
+                patch.object(pythonfuzz.fuzzer.Fuzzer, 'write_sample') as write_sample:
+            started = time.time()
+            pythonfuzz.fuzzer.Fuzzer(fuzz_hang, timeout=0.1).start()
+            self.assertLess(time.time() - started, pythonfuzz.fuzzer.WATCHDOG_GRACE)
+            self.assertEqual(write_sample.call_args[0][1], 'timeout-')
@@ -0,0 +1,38 @@
+"""
+Test the fork server runs each input from a clean state.
+
+SUT:    Fuzzer
+Area:   Fork server
+Class:  Functional
+Type:   Integration test
+"""
+
+import os
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.fuzzer
+
+
+calls = []
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+class TestForkServer(unittest.TestCase):
+    def test_clean_state(self):
+        """
+        Tests that state left behind by one input is not seen by the next.
+        """
+        def fuzz(buf):
+            calls.append(buf)
+            if len(calls) > 1:
+                raise RuntimeError('state leaked between inputs')
+
+        with patch('logging.Logger.info') as mock:
+            pythonfuzz.fuzzer.Fuzzer(fuzz, runs=50, fork_server=True).start()
+            mock.assert_called_with('did %d runs, stopping now.', 50)
@@ -0,0 +1,77 @@
+"""
+Test the fuzzer can run the target in its own process.
+
+SUT:    Fuzzer
+Area:   In-process fuzzing
+Class:  Functional
+Type:   Integration test
+"""
+
+import os
+import signal
+import sys
+import time
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.fuzzer
+
+
+class TestInProcess(unittest.TestCase):
+    def test_crash(self):
+        """
+        Tests that a crash is found without a worker process, and the tracer is removed afterwards.
+        """
+        pids = set()
+
+        def fuzz(buf):
+            pids.add(os.getpid())
+            if len(buf) > 1 and buf[0] == buf[1]:
+                raise ValueError('repeated')
+
+        trace = sys.gettrace()
+        with patch('logging.Logger.info'), \
+                patch.object(pythonfuzz.fuzzer.Fuzzer, 'write_sample') as write_sample:
+            pythonfuzz.fuzzer.Fuzzer(fuzz, in_process=True).start()
+            self.assertEqual(write_sample.call_args[0][1], 'crash-')
+            buf = write_sample.call_args[0][0]
+            self.assertEqual(buf[0], buf[1])
+        self.assertEqual(pids, set([os.getpid()]))
+        self.assertIs(sys.gettrace(), trace)
+
+    def test_keep_going(self):
+        """
+        Tests that the fuzzer carries on past a crash in the target.
+        """
+        def fuzz(buf):
+            if len(buf) % 2:
+                raise ValueError('odd')
+
+        with patch('logging.Logger.info') as mock, \
+                patch.object(pythonfuzz.fuzzer.Fuzzer, 'write_sample') as write_sample:
+            pythonfuzz.fuzzer.Fuzzer(fuzz, runs=200, keep_going=True, in_process=True).start()
+            mock.assert_called_with('did %d runs, stopping now.', 200)
+            self.assertEqual(write_sample.call_count, 1)
+
+    @unittest.skipUnless(hasattr(signal, 'setitimer'), 'needs signal.setitimer')
+    def test_timeout(self):
+        """
+        Tests that a hanging input is stopped by the timer.
+        """
+        def fuzz(buf):
+            try:
+                time.sleep(60)
+            except Exception:
+                pass
+
+        with patch('logging.Logger.info'), \
+                patch.object(pythonfuzz.fuzzer.Fuzzer, 'write_sample') as write_sample:
+            started = time.time()
+            pythonfuzz.fuzzer.Fuzzer(fuzz, timeout=0.1, in_process=True).start()
+            self.assertLess(time.time() - started, pythonfuzz.fuzzer.WATCHDOG_GRACE)
+            self.assertEqual(write_sample.call_args[0][1], 'timeout-')
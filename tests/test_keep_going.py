@@ -0,0 +1,34 @@
+"""
+Test the fuzzing carries on past faults when asked to, reporting each fault once.
+
+SUT:    Fuzzer
+Area:   Fault finding
+Class:  Functional
+Type:   Integration test
+"""
+
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.fuzzer
+
+
+class TestKeepGoing(unittest.TestCase):
+    def test_keep_going(self):
+        """
+        Tests that a fault which recurs does not stop the fuzzer, and is only written once.
+        """
+        def fuzz(buf):
+            if len(buf) % 2:
+                raise ValueError('odd')
+
+        with patch('logging.Logger.info') as mock, \
+                patch.object(pythonfuzz.fuzzer.Fuzzer, 'write_sample') as write_sample:
+            pythonfuzz.fuzzer.Fuzzer(fuzz, runs=200, keep_going=True).start()
+            mock.assert_called_with('did %d runs, stopping now.', 200)
+            self.assertEqual(write_sample.call_count, 1)
@@ -0,0 +1,100 @@
+"""
+Test merging corpora keeps the inputs needed for their coverage.
+
+SUT:    Merger
+Area:   Corpus merging
+Class:  Functional
+Type:   Integration test
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.merge
+
+
+def fuzz(buf):
+    if buf.startswith(b'a'):
+        if buf.startswith(b'ab'):
+            pass
+    elif buf.startswith(b'z'):
+        raise ValueError('z')
+
+
+class TestMerge(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.dir, 'out')
+        self.in_dir = os.path.join(self.dir, 'in')
+        os.mkdir(self.in_dir)
+        for name, buf in (('1', b'abcdef'), ('2', b'ab'), ('3', b'a'), ('4', b'aa'), ('5', b'z'), ('6', b'q')):
+            with open(os.path.join(self.in_dir, name), 'wb') as f:
+                f.write(buf)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def outputs(self):
+        bufs = []
+        for name in os.listdir(self.out_dir):
+            with open(os.path.join(self.out_dir, name), 'rb') as f:
+                bufs.append(f.read())
+        return sorted(bufs)
+
+    def test_merge(self):
+        """
+        Tests that the smallest inputs with the coverage are written, leaving out the crash.
+        """
+        with patch('logging.Logger.info'):
+            pythonfuzz.merge.Merger(fuzz, self.out_dir, [self.in_dir], jobs=2).start()
+        self.assertEqual(self.outputs(), [b'a', b'ab', b'q'])
+        self.assertFalse(os.path.exists(self.out_dir + '.merge'))
+
+    def test_existing(self):
+        """
+        Tests that the inputs already in the output are kept, and only what they lack is added.
+        """
+        os.mkdir(self.out_dir)
+        with open(os.path.join(self.out_dir, 'kept'), 'wb') as f:
+            f.write(b'abc')
+        with patch('logging.Logger.info'):
+            pythonfuzz.merge.Merger(fuzz, self.out_dir, [self.in_dir]).start()
+        self.assertEqual(self.outputs(), [b'a', b'abc', b'q'])
+
+    def test_resume(self):
+        """
+        Tests that an interrupted merge carries on from its control file.
+        """
+        control_file = os.path.join(self.dir, 'control')
+        with patch('logging.Logger.info'):
+            pythonfuzz.merge.Merger(fuzz, self.out_dir, [self.in_dir], control_file=control_file).start()
+        shutil.rmtree(self.out_dir)
+
+        # Cut the merge short after the first three inputs.
+        with open(control_file) as f:
+            lines = f.read().splitlines()
+        with open(control_file, 'w') as f:
+            f.write('\n'.join(lines[:4]) + '\n{"index": 3, "sta')
+
+        def spy(buf):
+            with open(os.path.join(self.dir, 'ran'), 'ab') as f:
+                f.write(bytes(buf) + b'\n')
+            fuzz(buf)
+
+        with patch('logging.Logger.info'):
+            pythonfuzz.merge.Merger(spy, self.out_dir, [self.in_dir], control_file=control_file).start()
+        with open(os.path.join(self.dir, 'ran'), 'rb') as f:
+            ran = f.read().splitlines()
+        self.assertEqual(sorted(ran), [b'aa', b'q', b'z'])
+        self.assertEqual(self.outputs(), [b'a', b'ab', b'q'])
+        with open(control_file) as f:
+            self.assertEqual(len([json.loads(line) for line in f.read().splitlines()[1:] if line.endswith('}')]), 6)
@@ -0,0 +1,72 @@
+"""
+Test a crashing input is made smaller while it crashes in the same way.
+
+SUT:    Minimizer
+Area:   Crash minimisation
+Class:  Functional
+Type:   Integration test
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.minimize
+
+
+def fuzz(buf):
+    if len(buf) < 10:
+        raise KeyError('short')
+    if b'BUG' in buf:
+        raise ValueError('bug')
+
+
+class TestMinimize(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'crash')
+        self.output = os.path.join(self.dir, 'minimized')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def minimize(self, buf, jobs=1):
+        with open(self.path, 'wb') as f:
+            f.write(buf)
+        with patch('logging.Logger.info'):
+            return pythonfuzz.minimize.Minimizer(fuzz, self.path, jobs=jobs,
+                                                 exact_artifact_path=self.output).start()
+
+    def test_minimize(self):
+        """
+        Tests that the input is cut down and simplified, but not so far that it fails another way.
+        """
+        junk = bytes(bytearray(range(256)))
+        buf = self.minimize(junk * 2 + b'xBUGx' + junk)
+        self.assertEqual(len(buf), 10)
+        self.assertIn(b'BUG', buf)
+        self.assertEqual(buf.count(b'0'), 7)
+        with open(self.output, 'rb') as f:
+            self.assertEqual(f.read(), buf)
+
+    def test_parallel(self):
+        """
+        Tests that several workers find the same result.
+        """
+        buf = self.minimize(b'a' * 100 + b'BUG' + b'b' * 100, jobs=3)
+        self.assertEqual(len(buf), 10)
+        self.assertIn(b'BUG', buf)
+
+    def test_no_crash(self):
+        """
+        Tests that an input which does not crash is reported, and nothing is written.
+        """
+        self.assertIsNone(self.minimize(b'0123456789'))
+        self.assertFalse(os.path.exists(self.output))
@@ -0,0 +1,53 @@
+"""
+Test the parallel jobs all stop once one of them finds a crash.
+
+SUT:    ParallelFuzzer
+Area:   Parallel fuzzing
+Class:  Functional
+Type:   Integration test
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.parallel
+
+
+def fuzz(buf):
+    # Every new length is new coverage, so the jobs keep telling each other about inputs
+    # until one of them grows one long enough.
+    for _ in buf:
+        pass
+    if len(buf) > 32:
+        raise ValueError('long')
+
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def test_stop(self):
+        """
+        Tests that the crash found by one job stops them all, and the coordinator returns.
+        """
+        with patch('logging.Logger.info') as mock:
+            pythonfuzz.parallel.ParallelFuzzer(2, fuzz).start()
+        messages = [call[0][0] for call in mock.call_args_list]
+        self.assertTrue(any(message.startswith('job ') and 'Stopping all jobs' in message
+                            for message in messages))
+        self.assertTrue([name for name in os.listdir(self.dir) if name.startswith('crash-')])
@@ -0,0 +1,39 @@
+"""
+Test the fuzzer reports the inputs which are slow to run.
+
+SUT:    Fuzzer
+Area:   Slow units
+Class:  Functional
+Type:   Integration test
+"""
+
+import time
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.fuzzer
+
+
+class TestSlowUnits(unittest.TestCase):
+    def test_slow_units(self):
+        """
+        Tests that an input slower than the threshold is written out, and is the slowest.
+        """
+        def fuzz(buf):
+            if len(buf) == 0:
+                time.sleep(0.2)
+
+        with patch('logging.Logger.info'), \
+                patch.object(pythonfuzz.fuzzer.Fuzzer, 'write_sample') as write_sample:
+            f = pythonfuzz.fuzzer.Fuzzer(fuzz, runs=100, report_slow_units=0.1)
+            f.start()
+            write_sample.assert_called_once_with(bytearray(), prefix='slow-unit-', exact=False)
+        record = f.stats_record(0, 0)
+        self.assertGreaterEqual(record['slowest_inputs'][0]['exec_time_us'], 200000)
+        self.assertEqual(record['slowest_corpus'][0]['exec_time_us'], max(
+            unit['exec_time_us'] for unit in record['slowest_corpus']))
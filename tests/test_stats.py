@@ -0,0 +1,97 @@
+"""
+Test the fuzzer writes out its statistics.
+
+SUT:    Fuzzer
+Area:   Statistics
+Class:  Functional
+Type:   Integration test
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.fuzzer
+
+
+class TestStats(unittest.TestCase):
+    def test_stats_file(self):
+        """
+        Tests that the final statistics are written when the fuzzing finishes.
+        """
+        def fuzz(buf):
+            if len(buf) > 2:
+                return len(buf)
+
+        path = tempfile.mkdtemp()
+        try:
+            stats_path = os.path.join(path, 'stats.json')
+            with patch('logging.Logger.info'):
+                pythonfuzz.fuzzer.Fuzzer(fuzz, runs=500, stats_file=stats_path).start()
+            with open(stats_path) as f:
+                record = json.loads(f.read().splitlines()[-1])
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(record['executions'], 500)
+        self.assertEqual(sum(record['exec_time_us']['counts']), 500)
+        self.assertGreater(record['coverage'], 0)
+        self.assertTrue(record['mutators'])
+        self.assertEqual(len(record['workers']), 1)
+
+    def test_slowest_corpus(self):
+        """
+        Tests that the corpus is only searched for its slowest inputs once in a while, not for
+        every input which finds new coverage.
+        """
+        def fuzz(buf):
+            for value in buf:
+                if value == 0:
+                    continue
+                if value < 128:
+                    break
+
+        path = tempfile.mkdtemp()
+        try:
+            with patch('logging.Logger.info') as info, \
+                    patch('pythonfuzz.corpus.Corpus.slowest', autospec=True, return_value=[]) as slowest:
+                pythonfuzz.fuzzer.Fuzzer(fuzz, runs=2000, stats_file=os.path.join(path, 'stats.json')).start()
+            new = [call for call in info.call_args_list if ' NEW ' in call[0][0]]
+        finally:
+            shutil.rmtree(path)
+        self.assertGreater(len(new), 2)
+        self.assertLessEqual(slowest.call_count, 2)
+
+    def test_record_when_due(self):
+        """
+        Tests that a stats record is only built when it is due to be written, not for every
+        log line.
+        """
+        def fuzz(buf):
+            for value in buf:
+                if value == 0:
+                    continue
+                if value < 128:
+                    break
+
+        path = tempfile.mkdtemp()
+        stats_file = os.path.join(path, 'stats.json')
+        try:
+            with patch('logging.Logger.info') as info, \
+                    patch.object(pythonfuzz.fuzzer.Fuzzer, 'stats_record', autospec=True,
+                                 side_effect=pythonfuzz.fuzzer.Fuzzer.stats_record) as stats_record:
+                pythonfuzz.fuzzer.Fuzzer(fuzz, runs=2000, stats_file=stats_file).start()
+            new = [call for call in info.call_args_list if ' NEW ' in call[0][0]]
+            with open(stats_file) as f:
+                lines = f.readlines()
+        finally:
+            shutil.rmtree(path)
+        self.assertGreater(len(new), 2)
+        self.assertEqual(stats_record.call_count, len(lines))
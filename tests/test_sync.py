@@ -0,0 +1,71 @@
+"""
+Test fuzzers on different nodes share their corpus through a sync server.
+
+SUT:    Fuzzer
+Area:   Corpus sync
+Class:  Functional
+Type:   Integration test
+"""
+
+import socket
+import threading
+import time
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.fuzzer
+import pythonfuzz.sync
+
+
+def fuzz(buf):
+    if len(buf) > 0 and buf[0] == ord('A'):
+        if len(buf) > 1 and buf[1] == ord('B'):
+            return 2
+        return 1
+    return 0
+
+
+class TestSync(unittest.TestCase):
+    def test_sync(self):
+        """
+        Tests that the inputs found by one node are run by the next.
+        """
+        server = pythonfuzz.sync.SyncServer(('127.0.0.1', 0), pythonfuzz.sync.SyncStore())
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        address = '127.0.0.1:{}'.format(server.server_address[1])
+        try:
+            with patch('logging.Logger.info'):
+                pythonfuzz.fuzzer.Fuzzer(fuzz, runs=20000, sync_address=address).start()
+                self.assertGreater(server.store.length, 1)
+
+                node = pythonfuzz.fuzzer.Fuzzer(fuzz, runs=1000, sync_address=address)
+                node.start()
+            self.assertEqual(node._sync.pulled, server.store.length)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_unresponsive(self):
+        """
+        Tests that a server which never answers does not slow the fuzzing down.
+        """
+        silent = socket.socket()
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(5)
+        address = '127.0.0.1:{}'.format(silent.getsockname()[1])
+        try:
+            start = time.time()
+            with patch('logging.Logger.info'), patch('logging.warning'):
+                node = pythonfuzz.fuzzer.Fuzzer(fuzz, runs=2000, sync_address=address)
+                node.start()
+            self.assertLess(time.time() - start, pythonfuzz.sync.SYNC_TIMEOUT)
+            self.assertEqual(node._sync.pulled, 0)
+        finally:
+            silent.close()
@@ -0,0 +1,42 @@
+"""
+Test the fuzzing stops an input which runs for too long.
+
+SUT:    Fuzzer
+Area:   Fault finding
+Class:  Functional
+Type:   Integration test
+"""
+
+import signal
+import time
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.fuzzer
+
+
+@unittest.skipUnless(hasattr(signal, 'setitimer'), 'needs signal.setitimer')
+class TestTimeout(unittest.TestCase):
+    def test_timeout(self):
+        """
+        Tests that a hanging input is stopped by the worker, well before the watchdog
+        would kill it.
+        """
+        def fuzz(buf):
+            try:
+                time.sleep(60)
+            except Exception:
+                # The timeout must get past the target's own handlers.
+                pass
+
+        with patch('logging.Logger.info'), \
+                patch.object(pythonfuzz.fuzzer.Fuzzer, 'write_sample') as write_sample:
+            started = time.time()
+            pythonfuzz.fuzzer.Fuzzer(fuzz, timeout=0.1).start()
+            self.assertLess(time.time() - started, pythonfuzz.fuzzer.WATCHDOG_GRACE)
+            self.assertEqual(write_sample.call_args[0][1], 'timeout-')
@@ -0,0 +1,128 @@
+"""
+Test the coverage maps record new behaviour as desired.
+
+SUT:    bitmap
+Area:   Coverage maps
+Class:  Functional
+Type:   Unit test
+"""
+
+import multiprocessing as mp
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.bitmap as bitmap
+
+
+class TestBucket(unittest.TestCase):
+
+    def test01_buckets(self):
+        # Hit counts are bucketed into a single bit each
+        self.assertEqual([bitmap.bucket(n) for n in (0, 1, 2, 3, 4, 7, 8, 15, 16, 31, 32, 127, 128, 255)],
+                         [0, 1, 2, 4, 8, 8, 16, 16, 32, 32, 64, 64, 128, 128])
+
+    def test02_table(self):
+        # The translation table agrees with the function
+        for n in range(256):
+            self.assertEqual(bytearray(bitmap.BUCKETS)[n], bitmap.bucket(n))
+
+
+class TestVirginMap(unittest.TestCase):
+
+    def setUp(self):
+        self.virgin = bitmap.VirginMap()
+        self.trace_map = bytearray(bitmap.MAP_SIZE)
+
+    def test01_empty(self):
+        # Nothing executed gives nothing new
+        self.assertEqual(self.virgin.merge(self.trace_map), 0)
+        self.assertEqual(self.virgin.count, 0)
+
+    def test02_new_edge(self):
+        # A new edge is new the first time only
+        self.trace_map[10] = 1
+        self.assertNotEqual(self.virgin.merge(self.trace_map), 0)
+        self.assertEqual(self.virgin.merge(self.trace_map), 0)
+        self.assertEqual(self.virgin.count, 1)
+
+    def test03_new_bucket(self):
+        # Running the same edge a different number of times is new behaviour...
+        self.trace_map[10] = 1
+        self.virgin.merge(self.trace_map)
+        self.trace_map[10] = 5
+        self.assertNotEqual(self.virgin.merge(self.trace_map), 0)
+        self.assertEqual(self.virgin.count, 2)
+
+        # ... but not if the count lands in a bucket we've already seen.
+        self.trace_map[10] = 6
+        self.assertEqual(self.virgin.merge(self.trace_map), 0)
+
+    def test04_shared_memory(self):
+        # A map can be written and read straight out of shared memory
+        shared = mp.RawArray('B', bitmap.MAP_SIZE * 2)
+        view = bitmap.byte_view(shared, bitmap.MAP_SIZE, bitmap.MAP_SIZE)
+        view[30] += 3
+        self.assertEqual(shared[bitmap.MAP_SIZE + 30], 3)
+        self.assertEqual(self.virgin.merge(view), bitmap.from_features([30 * 8 + 2]))
+
+
+class TestSharedVirginMap(unittest.TestCase):
+
+    def setUp(self):
+        shared = mp.Array('B', bitmap.MAP_SIZE)
+        self.virgin1 = bitmap.SharedVirginMap(shared)
+        self.virgin2 = bitmap.SharedVirginMap(shared)
+        self.trace_map = bytearray(bitmap.MAP_SIZE)
+
+    def test01_shared(self):
+        # An edge seen through one map is not new to the other
+        self.trace_map[10] = 1
+        self.assertNotEqual(self.virgin1.merge(self.trace_map), 0)
+        self.assertEqual(self.virgin2.merge(self.trace_map), 0)
+
+        self.trace_map[20] = 1
+        self.assertNotEqual(self.virgin2.merge(self.trace_map), 0)
+        self.assertEqual(self.virgin2.count, 2)
+
+    def test02_lock(self):
+        # The lock is only taken for an input which may have something new
+        self.trace_map[10] = 1
+        self.virgin1.merge(self.trace_map)
+        with patch.object(self.virgin1._shared, 'get_lock') as get_lock:
+            self.assertEqual(self.virgin1.merge(self.trace_map), 0)
+            self.assertFalse(get_lock.called)
+        # and then it is new to the map of this process, but not to the shared map
+        with patch.object(self.virgin2._shared, 'get_lock', wraps=self.virgin2._shared.get_lock) as get_lock:
+            self.assertEqual(self.virgin2.merge(self.trace_map), 0)
+            self.assertTrue(get_lock.called)
+            self.assertEqual(self.virgin2.merge(self.trace_map), 0)
+            self.assertEqual(get_lock.call_count, 1)
+        self.assertEqual(self.virgin2.count, 1)
+
+
+class TestFeatures(unittest.TestCase):
+
+    def test01_features(self):
+        # Each edge gives the bit of its bucket
+        trace_map = bytearray(bitmap.MAP_SIZE)
+        trace_map[0] = 1
+        trace_map[10] = 3
+        trace_map[bitmap.MAP_SIZE - 1] = 200
+        self.assertEqual(bitmap.features(trace_map), [0, 82, bitmap.MAP_SIZE * 8 - 1])
+
+    def test02_from_features(self):
+        # The features are the bits of the map the virgin map would merge
+        trace_map = bytearray(bitmap.MAP_SIZE)
+        trace_map[5] = 2
+        trace_map[700] = 9
+        virgin = bitmap.VirginMap()
+        self.assertEqual(bitmap.from_features(bitmap.features(trace_map)), virgin.merge(trace_map))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Test the corpus keeps only one input for each content and each path.
+
+SUT:    corpus
+Area:   Corpus deduplication
+Class:  Functional
+Type:   Unit test
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import pythonfuzz.bitmap as bitmap
+import pythonfuzz.corpus as corpus
+
+
+def coverage(*edges):
+    trace_map = bytearray(bitmap.MAP_SIZE)
+    for edge in edges:
+        trace_map[edge] = 1
+    return trace_map
+
+
+class TestDedup(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.corpus_dir = os.path.join(self.dir, 'corpus')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, directory, name, buf):
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(buf)
+
+    def test01_load(self):
+        # The same input in several corpus directories is loaded once
+        other = os.path.join(self.dir, 'other')
+        self.write(self.corpus_dir, 'one', b'same')
+        self.write(other, 'two', b'same')
+        self.write(other, 'three', b'different')
+        self.write(other, 'empty', b'')
+        c = corpus.Corpus([self.corpus_dir, other])
+        self.assertEqual(c.length, 3)
+        self.assertEqual(c.size, 13)
+
+    def test02_same_content(self):
+        c = corpus.Corpus([self.corpus_dir])
+        self.assertTrue(c.put(bytearray(b'input'), coverage_map=coverage(1)))
+        self.assertFalse(c.put(bytearray(b'input'), coverage_map=coverage(2)))
+        self.assertFalse(c.put(bytearray(b'input'), save=False))
+        self.assertEqual(c.length, 2)
+
+    def test03_same_path(self):
+        # Of inputs with the same path, only the smallest is kept
+        c = corpus.Corpus([self.corpus_dir])
+        c.put(bytearray(b'medium'), coverage_map=coverage(1))
+        self.assertFalse(c.put(bytearray(b'much larger'), coverage_map=coverage(1)))
+        self.assertTrue(c.put(bytearray(b'small'), coverage_map=coverage(1)))
+        self.assertEqual(c.length, 2)
+        self.assertEqual(c.size, 5)
+        self.assertEqual(os.listdir(self.corpus_dir), [hashlib.sha256(b'small').hexdigest()])
+
+    def test04_seed_coverage(self):
+        # A corpus input found to have new coverage is not added again, but its coverage
+        # is recorded
+        self.write(self.corpus_dir, 'seed', b'seed input')
+        c = corpus.Corpus([self.corpus_dir])
+        seed = c.generate_input()
+        self.assertFalse(c.put(seed, exec_time=5, coverage_map=coverage(1, 2)))
+        self.assertEqual(c.length, 2)
+        self.assertEqual(c._schedule.seeds[0].exec_time, 5)
+        self.assertEqual(c._schedule.seeds[0].rare, 2)
+        self.assertEqual(sorted(os.listdir(self.corpus_dir)), ['seed'])
+        # Smaller inputs with its path now take its place
+        self.assertTrue(c.put(bytearray(b'seed'), coverage_map=coverage(1, 2)))
+        self.assertEqual(c.generate_input(), bytearray())
+
+    def test05_reduce(self):
+        # A mutant smaller than its seed takes the place of the input with its path
+        c = corpus.Corpus([self.corpus_dir])
+        c.put(bytearray(b'a long input'), exec_time=100, coverage_map=coverage(1))
+        c.put(bytearray(b'another'), exec_time=100, coverage_map=coverage(2))
+        self.assertFalse(c.ran(bytearray(b'a longer input'), coverage(1), seed=1))
+        self.assertFalse(c.ran(bytearray(b'short'), coverage(3), seed=1))
+        self.assertTrue(c.ran(bytearray(b'short'), coverage(1), seed=1, exec_time=10))
+        self.assertEqual(c.length, 3)
+        self.assertEqual(c._schedule.seeds[1].size, 5)
+        self.assertEqual(c._schedule.seeds[1].exec_time, 10)
+        self.assertEqual(sorted(os.listdir(self.corpus_dir)),
+                         sorted(hashlib.sha256(buf).hexdigest() for buf in (b'short', b'another')))
+        # An input already in the corpus does not take the place of another
+        self.assertFalse(c.ran(bytearray(b'short'), coverage(2), seed=2))
+
+    def test06_reduce_seed(self):
+        # Inputs we started with are replaced, and the replacement saved, but files not
+        # named by the fuzzer are not deleted
+        self.write(self.corpus_dir, 'seed', b'seed input')
+        c = corpus.Corpus([self.corpus_dir])
+        c.put(c.generate_input(), coverage_map=coverage(1))
+        self.assertTrue(c.ran(bytearray(b'seed'), coverage(1), seed=0))
+        self.assertEqual(sorted(os.listdir(self.corpus_dir)), sorted(['seed', hashlib.sha256(b'seed').hexdigest()]))
+        self.assertEqual(c.size, 4)
+
+    def test07_reduce_saved(self):
+        # Inputs saved by an earlier run are the fuzzer's own, so their replacements take
+        # their place on disk
+        c = corpus.Corpus([self.corpus_dir])
+        c.put(bytearray(b'saved input'), coverage_map=coverage(1))
+        c = corpus.Corpus([self.corpus_dir])
+        c.put(c.generate_input(), coverage_map=coverage(1))
+        self.assertTrue(c.ran(bytearray(b'saved'), coverage(1), seed=0))
+        self.assertEqual(os.listdir(self.corpus_dir), [hashlib.sha256(b'saved').hexdigest()])
+        c = corpus.Corpus([self.corpus_dir])
+        self.assertEqual(c.generate_input(), bytearray(b'saved'))
@@ -0,0 +1,55 @@
+"""
+Test the dictionary supplies the words we expect.
+
+SUT:    Dictionary
+Area:   Dictionary words
+Class:  Functional
+Type:   Unit test
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pythonfuzz.dictionary as dictionary
+
+
+class TestTemporaryWords(unittest.TestCase):
+
+    def setUp(self):
+        self.dict = dictionary.Dictionary(temporary_size=2)
+
+    def test01_empty(self):
+        # No words means no word
+        self.assertIsNone(self.dict.get_word())
+
+    def test02_learnt_word(self):
+        # A learnt word is used
+        self.dict.add_temporary(b'magic')
+        self.assertEqual(self.dict.get_word(), b'magic')
+
+    def test03_oldest_dropped(self):
+        # When the table is full, the word learnt first is replaced, and so on
+        for word in (b'one', b'two', b'one', b'three', b'four', b'five'):
+            self.dict.add_temporary(word)
+        words = set(self.dict.get_word() for _ in range(100))
+        self.assertEqual(words, set([b'four', b'five']))
+
+    def test04_known_word(self):
+        # A word already in the dictionary is not learnt again
+        path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(path, 'word'), 'wb') as f:
+                f.write(b'known')
+            self.dict.load(path)
+        finally:
+            shutil.rmtree(path)
+        self.dict.add_temporary(b'known')
+        self.assertEqual(set(self.dict.get_word() for _ in range(100)), set([b'known']))
+        self.dict.add_temporary(b'new')
+        self.assertEqual(set(self.dict.get_word() for _ in range(100)), set([b'known', b'new']))
+
+
+if __name__ == '__main__':
+    unittest.main()
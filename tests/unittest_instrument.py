@@ -0,0 +1,91 @@
+"""
+Test the instrumentation of source code records coverage as desired.
+
+SUT:    instrument
+Area:   Instrumentation
+Class:  Functional
+Type:   Unit test
+"""
+
+import unittest
+
+import pythonfuzz.instrument as instrument
+import pythonfuzz.tracer as tracer
+
+
+SOURCE = '''\
+"""Module docstring"""
+from __future__ import division
+
+
+def branch(value):
+    """Function docstring"""
+    if value:
+        return 1
+    return 2
+
+
+class Thing(object):
+    """Class docstring"""
+
+
+def magic(value):
+    return value == 'MAGIC' or value.startswith(b'PK')
+'''
+
+
+class TestInstrumentSource(unittest.TestCase):
+
+    def setUp(self):
+        self.namespace = {instrument.HIT_NAME: tracer.hit}
+        exec(instrument.instrument_source(SOURCE, 'example.py'), self.namespace)
+        self.addCleanup(tracer.reset)
+
+    def run_branch(self, value):
+        tracer.reset()
+        self.namespace['branch'](value)
+        return bytes(tracer.coverage_map)
+
+    def test01_docstrings(self):
+        # Docstrings must still be docstrings once the hits are inserted
+        self.assertEqual(self.namespace['__doc__'], 'Module docstring')
+        self.assertEqual(self.namespace['branch'].__doc__, 'Function docstring')
+        self.assertEqual(self.namespace['Thing'].__doc__, 'Class docstring')
+
+    def test02_records_hits(self):
+        # Running the function updates the coverage map
+        self.assertTrue(any(bytearray(self.run_branch(True))))
+
+    def test03_branches_differ(self):
+        # Each side of the branch is recorded differently, and consistently
+        self.assertNotEqual(self.run_branch(True), self.run_branch(False))
+        self.assertEqual(self.run_branch(True), self.run_branch(True))
+
+
+class TestInstrumentCompare(unittest.TestCase):
+
+    def setUp(self):
+        self.namespace = {instrument.HIT_NAME: tracer.hit,
+                          instrument.COMPARE_NAME: tracer.compare_operand}
+        self.addCleanup(tracer.reset)
+        self.addCleanup(tracer.take_tokens)
+
+    def test01_no_tokens(self):
+        # Comparisons are left alone unless asked for
+        exec(instrument.instrument_source(SOURCE, 'example.py'), self.namespace)
+        tracer.take_tokens()
+        self.namespace['magic'](b'wibble')
+        self.assertEqual(tracer.take_tokens(), [])
+
+    def test02_tokens(self):
+        # The operands of comparisons and comparison methods are collected
+        exec(instrument.instrument_source(SOURCE, 'compare.py', trace_cmp=True), self.namespace)
+        tracer.take_tokens()
+        self.namespace['magic'](b'wibble')
+        tokens = tracer.take_tokens()
+        self.assertIn(b'MAGIC', tokens)
+        self.assertIn(b'PK', tokens)
+
+
+if __name__ == '__main__':
+    unittest.main()
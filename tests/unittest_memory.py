@@ -0,0 +1,46 @@
+"""
+Test the memory used by an input is checked against the limits.
+
+SUT:    memory
+Area:   Memory limits
+Class:  Functional
+Type:   Unit test
+"""
+
+import unittest
+
+import pythonfuzz.memory as memory
+
+
+class TestMemoryLimit(unittest.TestCase):
+
+    def test01_peak_rss(self):
+        # The process is using some memory
+        self.assertGreater(memory.peak_rss(), 0)
+
+    def test02_no_limits(self):
+        rss, error = memory.MemoryLimit().check()
+        self.assertGreater(rss, 0)
+        self.assertIsNone(error)
+
+    def test03_rss_limit(self):
+        # A limit we're already past is reported
+        limit = memory.MemoryLimit(rss_limit_mb=1)
+        limit.start()
+        self.assertIn('MEMORY OOM', limit.check()[1])
+
+    @unittest.skipIf(memory.tracemalloc is None, 'needs tracemalloc')
+    def test04_malloc_limit(self):
+        # Only the allocations made since the input started count
+        limit = memory.MemoryLimit(malloc_limit_mb=10)
+        self.addCleanup(memory.tracemalloc.stop)
+        limit.start()
+        data = bytearray(20 * 1024 * 1024)
+        self.assertIn('MALLOC LIMIT', limit.check()[1])
+        del data
+        limit.start()
+        self.assertIsNone(limit.check()[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
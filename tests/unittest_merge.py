@@ -0,0 +1,45 @@
+"""
+Test the merge chooses a small set of inputs with all of the coverage.
+
+SUT:    merge
+Area:   Corpus merging
+Class:  Functional
+Type:   Unit test
+"""
+
+import unittest
+
+import pythonfuzz.merge as merge
+
+
+class TestChoose(unittest.TestCase):
+
+    def test01_greedy(self):
+        # One input covering everything beats the several which cover it between them
+        candidates = [(1, 1, 0b0011), (1, 1, 0b1100), (10, 1, 0b1111), (1, 1, 0b0001)]
+        self.assertEqual(merge.choose(candidates), [2])
+
+    def test02_smaller(self):
+        # Of inputs adding the same features, the smaller is chosen
+        candidates = [(50, 1, 0b11), (20, 1, 0b11), (30, 1, 0b11)]
+        self.assertEqual(merge.choose(candidates), [1])
+
+    def test03_faster(self):
+        # Of inputs of the same size, the faster is chosen
+        candidates = [(20, 900, 0b1), (20, 100, 0b1)]
+        self.assertEqual(merge.choose(candidates), [1])
+
+    def test04_covered(self):
+        # Inputs adding nothing to what is already covered are not chosen
+        candidates = [(1, 1, 0b01), (1, 1, 0b10), (1, 1, 0b11)]
+        self.assertEqual(merge.choose(candidates, covered=0b01), [1])
+
+    def test05_all_features(self):
+        # Between them, the inputs chosen have every feature
+        candidates = [(1, 1, 0b000111), (1, 1, 0b001100), (1, 1, 0b111000), (1, 1, 0b100001)]
+        chosen = merge.choose(candidates)
+        covered = 0
+        for index in chosen:
+            covered |= candidates[index][2]
+        self.assertEqual(covered, 0b111111)
+        self.assertEqual(sorted(chosen), [0, 2])
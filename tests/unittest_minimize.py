@@ -0,0 +1,66 @@
+"""
+Test the minimiser picks the first candidate which crashes, whichever worker finds it.
+
+SUT:    minimize
+Area:   Crash minimisation
+Class:  Functional
+Type:   Unit test
+"""
+
+import unittest
+
+import pythonfuzz.fuzzer as fuzzer
+import pythonfuzz.minimize as minimize
+import pythonfuzz.protocol as protocol
+
+
+class FakePool(object):
+    """
+    Two pretend workers, each running a batch at a time; the batch sent last finishes first.
+    """
+    jobs = [None, None]
+
+    def __init__(self, outcomes):
+        # {index: signature of the crash} for the candidates which crash
+        self.outcomes = outcomes
+
+    def run(self, next_batch):
+        running = [batch for batch in (next_batch(), next_batch()) if batch]
+        while running:
+            batch = running.pop()
+            results = []
+            signature = None
+            for index, _ in batch:
+                signature = self.outcomes.get(index)
+                results.append(protocol.Result(protocol.STATUS_OK if signature is None else protocol.STATUS_CRASH,
+                                               0, 0))
+                if signature is not None:
+                    break
+            yield fuzzer.BatchResult(batch, results, [], signature, None)
+            batch = next_batch()
+            if batch:
+                running.insert(0, batch)
+
+
+class TestRun(unittest.TestCase):
+
+    def test01_earlier_requeued(self):
+        # The second worker finds candidate 5, while the first stops at 1, which crashes in
+        # another way; 2 and 3 are sent again, and 2 is the one wanted.
+        minimizer = minimize.Minimizer(None, 'crash')
+        minimizer._pool = FakePool({1: 'other', 2: 'wanted', 5: 'wanted'})
+        minimizer._signature = 'wanted'
+        self.assertEqual(minimizer._run([bytearray([n]) for n in range(8)]), (2, 'wanted'))
+        self.assertEqual(minimizer.runs, 5)
+
+    def test02_later_not_run(self):
+        # Once a candidate is found, those after it are not run
+        minimizer = minimize.Minimizer(None, 'crash')
+        minimizer._pool = FakePool({1: 'wanted', 6: 'wanted'})
+        minimizer._signature = 'wanted'
+        self.assertEqual(minimizer._run([bytearray([n]) for n in range(12)]), (1, 'wanted'))
+        self.assertLess(minimizer.runs, 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
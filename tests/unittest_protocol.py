@@ -0,0 +1,49 @@
+"""
+Test the messages between the fuzzer and its worker survive the trip.
+
+SUT:    protocol
+Area:   Worker communication
+Class:  Functional
+Type:   Unit test
+"""
+
+import unittest
+
+import pythonfuzz.protocol as protocol
+
+
+class TestBatch(unittest.TestCase):
+
+    def test01_round_trip(self):
+        # Inputs come out as they went in, including empty ones
+        bufs = [b'', b'hello', bytearray(b'\x00\xff' * 100)]
+        self.assertEqual(protocol.unpack_batch(protocol.pack_batch(bufs, 256)), (256, [bytes(buf) for buf in bufs]))
+
+    def test02_empty(self):
+        self.assertEqual(protocol.unpack_batch(protocol.pack_batch([])), (0, []))
+
+
+class TestReply(unittest.TestCase):
+
+    def test01_results(self):
+        # Results and tokens come back; no error means None
+        results = [protocol.Result(protocol.STATUS_OK, 120, 20480),
+                   protocol.Result(protocol.STATUS_OK, 95, 20484)]
+        reply = protocol.unpack_reply(protocol.pack_reply(results, tokens=[b'MAGIC', b'PK']))
+        self.assertEqual(reply.results, results)
+        self.assertIsNone(reply.error)
+        self.assertIsNone(reply.signature)
+        self.assertEqual(reply.tokens, [b'MAGIC', b'PK'])
+
+    def test02_error(self):
+        # The failure text is carried intact
+        results = [protocol.Result(protocol.STATUS_CRASH, 10, 20480)]
+        reply = protocol.unpack_reply(protocol.pack_reply(results, error=u'Traceback: ☃',
+                                                          signature=u'ValueError-0123'))
+        self.assertEqual(reply.results[0].status, protocol.STATUS_CRASH)
+        self.assertEqual(reply.error, u'Traceback: ☃')
+        self.assertEqual(reply.signature, u'ValueError-0123')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Test the power schedules pick the inputs of the corpus as desired.
+
+SUT:    schedule
+Area:   Seed scheduling
+Class:  Functional
+Type:   Unit test
+"""
+
+import random
+import unittest
+
+import pythonfuzz.bitmap as bitmap
+import pythonfuzz.schedule as schedule
+
+
+class TestWeightedSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.sampler = schedule.WeightedSampler()
+
+    def test01_proportions(self):
+        # Each index is picked in proportion to its weight
+        for weight in (1.0, 0.0, 3.0):
+            self.sampler.append(weight)
+        rng = random.Random(1)
+        counts = [0, 0, 0]
+        for _ in range(4000):
+            counts[self.sampler.sample(rng.random)] += 1
+        self.assertEqual(counts[1], 0)
+        self.assertAlmostEqual(counts[2] / float(counts[0]), 3.0, delta=0.4)
+
+    def test02_boundaries(self):
+        # The ends of the range land on the indices either side of the boundary
+        for weight in (1.0, 1.0, 1.0):
+            self.sampler.append(weight)
+        self.assertEqual(self.sampler.sample(lambda: 0.0), 0)
+        self.assertEqual(self.sampler.sample(lambda: 0.5), 1)
+        self.assertEqual(self.sampler.sample(lambda: 0.9999), 2)
+
+    def test03_update(self):
+        # A changed weight is picked up
+        for weight in range(10):
+            self.sampler.append(1.0)
+        for index in range(10):
+            self.sampler.update(index, 0.0)
+        self.sampler.update(7, 2.0)
+        self.assertEqual(self.sampler.total, 2.0)
+        self.assertEqual(self.sampler.sample(random.random), 7)
+
+    def test04_totals(self):
+        # The tree agrees with the weights, through appends, updates and rebuilds
+        rng = random.Random(2)
+        weights = []
+        for n in range(3000):
+            if weights and rng.random() < 0.7:
+                index = rng.randrange(len(weights))
+                weights[index] = rng.random()
+                self.sampler.update(index, weights[index])
+            else:
+                weights.append(rng.random())
+                self.sampler.append(weights[-1])
+        self.assertAlmostEqual(self.sampler.total, sum(weights), places=6)
+        target = sum(weights[:100])
+        self.assertEqual(self.sampler.sample(lambda: (target + weights[100] / 2) / sum(weights)), 100)
+
+
+class TestScheduler(unittest.TestCase):
+
+    @staticmethod
+    def coverage(*edges):
+        trace_map = bytearray(bitmap.MAP_SIZE)
+        for edge in edges:
+            trace_map[edge] = 1
+        return trace_map
+
+    def test01_schedules(self):
+        # Every schedule is registered, and gives positive weights
+        self.assertEqual(sorted(schedule.schedule_classes), ['entropic', 'explore', 'fast', 'uniform'])
+        for name in schedule.schedule_classes:
+            scheduler = schedule.Scheduler(name)
+            scheduler.add(10, 100, self.coverage(1))
+            self.assertGreater(scheduler.schedule.weight(scheduler.seeds[0]), 0)
+            self.assertEqual(scheduler.choose(), 0)
+            self.assertEqual(scheduler.seeds[0].chosen, 1)
+
+    def test02_hits(self):
+        # Inputs run with the same path as a corpus input count against it
+        scheduler = schedule.Scheduler('fast')
+        scheduler.add(1, 10, self.coverage(1))
+        scheduler.add(1, 10, self.coverage(2))
+        for _ in range(5):
+            scheduler.ran(self.coverage(1))
+        scheduler.ran(self.coverage(3))
+        self.assertEqual([seed.hits for seed in scheduler.seeds], [6, 1])
+        weights = [scheduler.schedule.weight(seed) for seed in scheduler.seeds]
+        self.assertLess(weights[0], weights[1])
+
+    def test03_rare(self):
+        # Features stop being rare once more than RARE_LIMIT inputs have them
+        scheduler = schedule.Scheduler('entropic')
+        scheduler.add(1, 10, self.coverage(1, 2))
+        scheduler.add(1, 10, self.coverage(1))
+        self.assertEqual(scheduler.seeds[0].rare, 2)
+        self.assertAlmostEqual(scheduler.seeds[0].rarity, 1.5)
+        self.assertAlmostEqual(scheduler.seeds[1].rarity, 0.5)
+        for _ in range(schedule.RARE_LIMIT - 1):
+            scheduler.add(1, 10, self.coverage(1))
+        self.assertEqual(scheduler.seeds[0].rare, 1)
+        self.assertAlmostEqual(scheduler.seeds[0].rarity, 1.0)
+        self.assertEqual(scheduler.seeds[1].rare, 0)
+        self.assertAlmostEqual(scheduler.seeds[1].rarity, 0.0)
+
+    def test04_finds(self):
+        # Inputs whose mutants find new coverage are picked more under entropic
+        scheduler = schedule.Scheduler('entropic')
+        scheduler.add(1, 10, self.coverage(1))
+        scheduler.add(1, 10, self.coverage(2))
+        scheduler.found(1)
+        weights = [scheduler.schedule.weight(seed) for seed in scheduler.seeds]
+        self.assertAlmostEqual(weights[1], weights[0] * 2)
@@ -0,0 +1,116 @@
+"""
+Test the statistics are gathered and written out as desired.
+
+SUT:    stats
+Area:   Statistics
+Class:  Functional
+Type:   Unit test
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pythonfuzz.stats as stats
+
+
+def make_record(executions, coverage, mutators):
+    exec_time = stats.Histogram()
+    for _ in range(executions):
+        exec_time.add(100)
+    return dict(timestamp=0, start_time=10 + executions, executions=executions, execs_per_second=executions,
+                coverage=coverage, corpus_inputs=coverage, corpus_bytes=coverage * 10, crashes=1,
+                unique_crashes=1, timeouts=0, ooms=0, rss_mb=1.5, exec_time_us=exec_time.to_dict(),
+                mutators=mutators, workers=[],
+                slowest_inputs=[dict(exec_time_us=executions * 100, sha256=str(executions))],
+                slowest_corpus=[])
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test01_buckets(self):
+        # Each value is counted in the first bucket whose limit is above it
+        histogram = stats.Histogram()
+        for value in (0, 1, 2, 3, 4, 1 << 40):
+            histogram.add(value)
+        self.assertEqual(histogram.counts[:4], [1, 1, 2, 1])
+        self.assertEqual(histogram.counts[-1], 1)
+        self.assertEqual(histogram.sum, 10 + (1 << 40))
+
+
+class TestMutatorStats(unittest.TestCase):
+
+    def test01_counts(self):
+        # Every mutator used to make an input shares the credit for what it finds
+        mutator_stats = stats.MutatorStats()
+        mutator_stats.used(['A', 'B'])
+        mutator_stats.used(['A'])
+        mutator_stats.found(['A', 'B'])
+        self.assertEqual(mutator_stats.to_dict(), {'A': {'uses': 2, 'finds': 1}, 'B': {'uses': 1, 'finds': 1}})
+
+
+class TestCombine(unittest.TestCase):
+
+    def test01_combine(self):
+        # Counters are added up, and each job is shown as a worker
+        record = stats.combine([make_record(3, 5, {'A': {'uses': 3, 'finds': 1}}),
+                                make_record(4, 7, {'A': {'uses': 4, 'finds': 0}, 'B': {'uses': 1, 'finds': 1}})])
+        self.assertEqual(record['executions'], 7)
+        self.assertEqual(record['crashes'], 2)
+        self.assertEqual(record['coverage'], 7)
+        self.assertEqual(record['start_time'], 13)
+        self.assertEqual(sum(record['exec_time_us']['counts']), 7)
+        self.assertEqual(record['mutators'], {'A': {'uses': 7, 'finds': 1}, 'B': {'uses': 1, 'finds': 1}})
+        self.assertEqual([worker['executions'] for worker in record['workers']], [3, 4])
+        self.assertEqual([unit['sha256'] for unit in record['slowest_inputs']], ['4', '3'])
+
+
+class TestStatsWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.json_path = os.path.join(self.path, 'stats.json')
+        self.prometheus_path = os.path.join(self.path, 'fuzz.prom')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test01_json(self):
+        # Records are appended as lines of JSON, no more often than asked
+        writer = stats.StatsWriter(self.json_path, interval=60)
+        writer.write(make_record(1, 1, {}))
+        writer.write(make_record(2, 1, {}))
+        writer.write(make_record(3, 1, {}), force=True)
+        with open(self.json_path) as f:
+            self.assertEqual([json.loads(line)['executions'] for line in f], [1, 3])
+
+    def test03_due(self):
+        # A record is only due once the interval has passed since the last was written
+        writer = stats.StatsWriter(self.json_path, interval=60)
+        self.assertTrue(writer.due())
+        writer.write(make_record(1, 1, {}))
+        self.assertFalse(writer.due())
+        writer = stats.StatsWriter(self.json_path, interval=0)
+        writer.write(make_record(1, 1, {}))
+        self.assertTrue(writer.due())
+
+    def test02_prometheus(self):
+        # The latest record replaces the Prometheus textfile
+        writer = stats.StatsWriter(prometheus_path=self.prometheus_path, interval=0)
+        writer.write(stats.combine([make_record(3, 5, {'A': {'uses': 3, 'finds': 1}})]))
+        writer.write(stats.combine([make_record(4, 5, {'A': {'uses': 4, 'finds': 1}})]))
+        with open(self.prometheus_path) as f:
+            lines = f.read().splitlines()
+        self.assertIn('pythonfuzz_executions_total 4', lines)
+        self.assertIn('pythonfuzz_exec_time_seconds_count 4', lines)
+        self.assertIn('pythonfuzz_exec_time_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('pythonfuzz_mutator_uses_total{mutator="A"} 4', lines)
+        self.assertIn('pythonfuzz_worker_executions_total{worker="0"} 4', lines)
+        self.assertIn('pythonfuzz_slowest_inputs_exec_time_seconds 0.0004', lines)
+        self.assertEqual(os.listdir(self.path), ['fuzz.prom'])
+
+
+if __name__ == '__main__':
+    unittest.main()
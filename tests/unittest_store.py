@@ -0,0 +1,155 @@
+"""
+Test the packed corpus store keeps, finds and hands out inputs.
+
+SUT:    store, corpus
+Area:   Corpus storage
+Class:  Functional
+Type:   Unit test
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.corpus as corpus
+import pythonfuzz.store as store
+
+
+class TestPackedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'corpus' + store.PACK_SUFFIX)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test01_append(self):
+        packed = store.PackedStore(self.path)
+        self.assertEqual(packed.append(b'hello'), 0)
+        self.assertEqual(packed.append(bytearray(b'world!')), 1)
+        self.assertEqual(len(packed), 2)
+        self.assertEqual(bytes(packed[0]), b'hello')
+        self.assertEqual(bytes(packed[1]), b'world!')
+        self.assertEqual(packed.length(1), 6)
+        self.assertEqual(packed.size, 11)
+        packed.close()
+
+    def test02_duplicates(self):
+        # An input already there is not added again
+        packed = store.PackedStore(self.path)
+        packed.append(b'one')
+        packed.append(b'two')
+        self.assertEqual(packed.append(b'one'), 0)
+        self.assertEqual(len(packed), 2)
+        packed.close()
+
+    def test03_reopen(self):
+        packed = store.PackedStore(self.path)
+        packed.append(b'one')
+        packed.append(b'')
+        packed.close()
+        packed = store.PackedStore(self.path)
+        self.assertEqual([bytes(packed[index]) for index in range(len(packed))], [b'one', b''])
+        self.assertEqual(packed.append(b'one'), 0)
+        packed.close()
+
+    def test04_shared(self):
+        # Each store picks up what the others appended
+        first = store.PackedStore(self.path)
+        second = store.PackedStore(self.path)
+        first.append(b'from the first')
+        self.assertEqual(second.append(b'from the second'), 1)
+        self.assertEqual(second.append(b'from the first'), 0)
+        self.assertEqual(first.append(b'from the second'), 1)
+        self.assertEqual(bytes(first[1]), b'from the second')
+        first.close()
+        second.close()
+
+    def test05_truncated(self):
+        # A record cut short is ignored, and written over by the next append
+        packed = store.PackedStore(self.path)
+        packed.append(b'whole')
+        packed.close()
+        with open(self.path, 'ab') as f:
+            f.write(b'\x40\x00\x00\x00partial')
+        packed = store.PackedStore(self.path)
+        self.assertEqual(len(packed), 1)
+        self.assertEqual(packed.append(b'next'), 1)
+        packed.close()
+        packed = store.PackedStore(self.path)
+        self.assertEqual([bytes(packed[index]) for index in range(len(packed))], [b'whole', b'next'])
+        packed.close()
+
+    def test06_not_packed(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'something else entirely')
+        with self.assertRaises(ValueError):
+            store.PackedStore(self.path)
+
+    def test07_import_export(self):
+        source = os.path.join(self.dir, 'source')
+        os.mkdir(source)
+        for buf in (b'a', b'bb', b'ccc'):
+            with open(os.path.join(source, hashlib.sha256(buf).hexdigest()), 'wb') as f:
+                f.write(buf)
+        packed = store.PackedStore(self.path)
+        self.assertEqual(packed.import_path(source), 3)
+        self.assertEqual(packed.import_path(source), 0)
+
+        exported = os.path.join(self.dir, 'exported')
+        self.assertEqual(packed.export(exported), 3)
+        packed.close()
+        self.assertEqual(sorted(os.listdir(exported)), sorted(os.listdir(source)))
+
+    def test08_python2(self):
+        # Python 2 is turned away before anything is written
+        with patch.object(store.sys, 'version_info', (2, 7, 18)):
+            with self.assertRaises(ValueError):
+                store.PackedStore(self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TestPackedCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'corpus' + store.PACK_SUFFIX)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test01_saved(self):
+        # Inputs put in the corpus are kept in the packed file, and loaded from it next time
+        c = corpus.Corpus([self.path])
+        c.put(bytearray(b'first'))
+        c.put(bytearray(b'second'))
+        c.put(bytearray(b'from a peer'), save=False)
+        self.assertEqual(c.length, 4)
+
+        c = corpus.Corpus([self.path])
+        self.assertEqual(c.length, 3)
+        self.assertEqual(c.size, 11)
+        seeds = [c.generate_input() for _ in range(c.length)]
+        self.assertEqual(seeds, [bytearray(b'first'), bytearray(b'second'), bytearray()])
+        self.assertIsInstance(c.generate_input(), bytearray)
+
+    def test02_import(self):
+        # The other corpus directories are added to the packed file
+        source = os.path.join(self.dir, 'source')
+        os.mkdir(source)
+        with open(os.path.join(source, 'input'), 'wb') as f:
+            f.write(b'imported')
+        c = corpus.Corpus([self.path, source])
+        self.assertEqual(c.generate_input(), bytearray(b'imported'))
+        packed = store.PackedStore(self.path)
+        self.assertEqual(bytes(packed[0]), b'imported')
+        packed.close()
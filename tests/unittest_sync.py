@@ -0,0 +1,155 @@
+"""
+Test the sync server shares inputs between nodes, without repeating them.
+
+SUT:    sync
+Area:   Corpus sync
+Class:  Functional
+Type:   Unit test
+"""
+
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    # Python 2 backport of mock
+    from mock import patch
+
+import pythonfuzz.sync as sync
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestSyncStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = sync.SyncStore()
+
+    def test01_share(self):
+        # An input pushed by one node is pulled by the others, but not by itself
+        self.assertEqual(self.store.sync(b'a' * 16, 0, 10, [('s1', b'one')]), (1, 1, []))
+        self.assertEqual(self.store.sync(b'b' * 16, 0, 10, []), (0, 1, [b'one']))
+
+    def test02_dedup(self):
+        # Inputs already held, or with coverage already seen, are not kept again
+        self.store.sync(b'a' * 16, 0, 10, [('s1', b'one')])
+        self.assertEqual(self.store.sync(b'b' * 16, 1, 10, [('s2', b'one'), ('s1', b'two')]), (2, 1, []))
+        self.assertEqual(self.store.length, 1)
+
+    def test03_rate_limit(self):
+        # A node can only push so many new inputs at once
+        store = sync.SyncStore(max_push_rate=0.1)
+        pushed = [('s{}'.format(n), str(n).encode()) for n in range(5)]
+        self.assertEqual(store.sync(b'a' * 16, 0, 0, pushed)[0], 1)
+        self.assertEqual(store.length, 1)
+
+    def test04_persistence(self):
+        # The inputs can be kept on disk, across a restart
+        path = tempfile.mkdtemp()
+        try:
+            sync.SyncStore(path).sync(b'a' * 16, 0, 0, [('s1', b'one')])
+            self.assertEqual(sync.SyncStore(path).sync(b'a' * 16, 0, 10, []), (0, 1, [b'one']))
+        finally:
+            shutil.rmtree(path)
+
+
+class TestSyncClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = sync.SyncServer(('127.0.0.1', 0), sync.SyncStore())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.address = '127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test01_share(self):
+        # Inputs pushed by one node are pulled by another, once
+        client1 = sync.SyncClient(self.address)
+        client2 = sync.SyncClient(self.address)
+        client1.push(b'one', 's1')
+        client1.push(b'one', 's1')
+        client1.push(b'two', 's2')
+        self.assertEqual(client1.sync(), [])
+        self.assertEqual(client2.sync(), [b'one', b'two'])
+        self.assertEqual(client2.sync(), [])
+        client1.finish()
+        client2.finish()
+
+    def test02_interval(self):
+        # Nodes sync in the background, every so often
+        client = sync.SyncClient(self.address, interval=60)
+        other = sync.SyncClient(self.address)
+        other.push(b'one', 's1')
+        other.finish()
+        pulled = []
+        self.assertTrue(wait_for(lambda: pulled.extend(client.pull()) or pulled))
+        self.assertEqual(pulled, [b'one'])
+        other = sync.SyncClient(self.address)
+        other.push(b'two', 's2')
+        other.finish()
+        time.sleep(0.1)
+        self.assertEqual(client.pull(), [])
+        client.finish()
+
+    def test03_unreachable(self):
+        # A server which can't be reached doesn't stop the node, which tries again less often
+        unused = socket.socket()
+        unused.bind(('127.0.0.1', 0))
+        client = sync.SyncClient('127.0.0.1:{}'.format(unused.getsockname()[1]), interval=0.05)
+        unused.close()
+        client.push(b'one', 's1')
+        with patch('logging.warning') as warning:
+            self.assertEqual(client.pull(), [])
+            self.assertTrue(wait_for(lambda: client.failures >= 3))
+            self.assertTrue(warning.called)
+            # 0.1, 0.2 and then 0.4 seconds after each failure
+            time.sleep(0.2)
+            self.assertLess(client.failures, 5)
+            client.finish()
+        self.assertEqual(client.pushed, 0)
+
+    def test04_unresponsive(self):
+        # A server which takes connections but never answers holds up neither pull() nor finish()
+        silent = socket.socket()
+        silent.bind(('127.0.0.1', 0))
+        silent.listen(5)
+        try:
+            client = sync.SyncClient('127.0.0.1:{}'.format(silent.getsockname()[1]), interval=0)
+            client.push(b'one', 's1')
+            start = time.time()
+            for _ in range(1000):
+                self.assertEqual(client.pull(), [])
+            self.assertLess(time.time() - start, 1)
+            with patch('logging.warning') as warning:
+                client.finish()
+                self.assertTrue(warning.called)
+            self.assertLess(time.time() - start, sync.FINISH_TIMEOUT + 1)
+            self.assertEqual(client.pushed, 0)
+        finally:
+            silent.close()
+
+
+class TestAddress(unittest.TestCase):
+
+    def test01_parse(self):
+        self.assertEqual(sync.parse_address('example.com:1234'), ('example.com', 1234))
+        self.assertEqual(sync.parse_address('example.com'), ('example.com', sync.SYNC_PORT))
+        self.assertRaises(sync.SyncError, sync.parse_address, 'example.com:port')
+
+
+if __name__ == '__main__':
+    unittest.main()
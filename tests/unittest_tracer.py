@@ -0,0 +1,101 @@
+"""
+Test the tracer records a complete map of the coverage of each input, from the files
+chosen.
+
+SUT:    tracer
+Area:   Coverage collection
+Class:  Functional
+Type:   Unit test
+"""
+
+import fnmatch
+import json
+import logging
+import multiprocessing.connection
+import os
+import unittest
+
+import pythonfuzz.bitmap as bitmap
+import pythonfuzz.tracer as tracer
+
+
+def target(buf):
+    total = 0
+    for value in buf:
+        if value == 'a':
+            total += 1
+        else:
+            total -= 1
+    return total
+
+
+class TestMaps(unittest.TestCase):
+
+    def record(self, inputs):
+        """
+        @return: list of the coverage map of each input
+        """
+        maps = []
+        tracer.configure()
+        tracer.install()
+        try:
+            for buf in inputs:
+                tracer.use_map(bytearray(bitmap.MAP_SIZE))
+                tracer.reset()
+                target(buf)
+                maps.append(bytes(tracer.coverage_map))
+        finally:
+            tracer.uninstall()
+            tracer.use_map(bytearray(bitmap.MAP_SIZE))
+        return maps
+
+    def test01_per_input(self):
+        first, other, again = self.record(['aaaa', 'bbbb', 'aaaa'])
+        # Each input gets a map of its own, however often its code has run before
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other)
+        self.assertTrue(set(bitmap.features(first)) - set(bitmap.features(other)))
+        self.assertTrue(set(bitmap.features(other)) - set(bitmap.features(first)))
+        # and the edges are counted each time they are taken
+        self.assertGreater(max(bytearray(first)), 1)
+
+
+class TestFilters(unittest.TestCase):
+
+    def tearDown(self):
+        tracer.configure()
+
+    def test01_stdlib(self):
+        # 'stdlib' matches the standard library, but not the site-packages inside it
+        self.assertTrue(tracer._matches(json.__file__, [tracer.STDLIB]))
+        self.assertTrue(tracer._matches('<frozen importlib._bootstrap>', [tracer.STDLIB]))
+        self.assertFalse(tracer._matches(os.path.join(tracer._site_dirs[0], 'package', 'module.py'),
+                                         [tracer.STDLIB]))
+        self.assertFalse(tracer._matches(__file__, [tracer.STDLIB]))
+
+    def test02_include(self):
+        # Only the files included are traced, less those which are also excluded
+        tracer.configure(include=[tracer.STDLIB], exclude=[os.path.join(os.path.dirname(json.__file__), '*')])
+        self.assertTrue(tracer.is_traced(fnmatch.__file__))
+        self.assertFalse(tracer.is_traced(json.__file__))
+        self.assertFalse(tracer.is_traced(__file__))
+
+    def test03_exclude(self):
+        tracer.configure(exclude=[tracer.STDLIB])
+        self.assertFalse(tracer.is_traced(json.__file__))
+        self.assertTrue(tracer.is_traced(__file__))
+
+    def test04_default_exclude(self):
+        # The fuzzer, and the modules it talks to the worker with, are never traced
+        tracer.configure(include=[tracer.STDLIB, '*'])
+        for path in (tracer.__file__, multiprocessing.connection.__file__, logging.__file__):
+            self.assertFalse(tracer.is_traced(path))
+        self.assertTrue(tracer.is_traced(json.__file__))
+
+    def test05_configure(self):
+        # Decisions already made are forgotten when the patterns change
+        code = target.__code__
+        tracer.configure()
+        self.assertTrue(tracer._get_info(code).traced)
+        tracer.configure(exclude=[__file__])
+        self.assertFalse(tracer._get_info(code).traced)